@@ -61,6 +61,8 @@ CONSOLE_ENCODING = None
 # db options
 MAX_FETCH_COUNT = 1000
 
+DECOMPILE_CACHE_FILE = None  # keeps decompiled query ASTs between runs if set to a file path
+
 # used for select(...).show()
 CONSOLE_WIDTH = 80
 
@@ -0,0 +1,131 @@
+from threading import Lock
+from time import time
+
+from pony.utils import throw
+
+PREV, NEXT, KEY, VALUE, EXPIRES = range(5)
+
+class LRUCache(object):
+    def __init__(cache, max_size=1000, ttl=None):
+        if max_size is not None and max_size < 1: throw(ValueError,
+            'max_size must be positive number or None. Got: %r' % max_size)
+        cache.max_size = max_size
+        cache.ttl = ttl
+        cache.lock = Lock()
+        cache.hits = cache.misses = 0
+        cache.generation = 0  # incremented on each explicit invalidation
+        cache._clear_()
+    def _clear_(cache):
+        cache.data = {}
+        cache.root = root = [ None, None, None, None, None ]
+        root[PREV] = root[NEXT] = root
+    def __len__(cache):
+        return len(cache.data)
+    def __contains__(cache, key):
+        return key in cache.data
+    def get(cache, key, default=None):
+        cache.lock.acquire()
+        try:
+            node = cache.data.get(key)
+            if node is not None and node[EXPIRES] is not None and node[EXPIRES] < time():
+                cache._unlink_(node)
+                node = None
+            if node is None:
+                cache.misses += 1
+                return default
+            cache.hits += 1
+            cache._unlink_(node)
+            cache._link_(node)
+            return node[VALUE]
+        finally: cache.lock.release()
+    def set(cache, key, value, ttl=None, generation=None):
+        if ttl is None: ttl = cache.ttl
+        expires = ttl is not None and time() + ttl or None
+        cache.lock.acquire()
+        try:
+            if generation is not None and generation != cache.generation: return
+            cache._set_(key, value, expires)
+        finally: cache.lock.release()
+    def _set_(cache, key, value, expires):
+        node = cache.data.get(key)
+        if node is not None: cache._unlink_(node)
+        cache._link_([ None, None, key, value, expires ])
+        if cache.max_size is not None:
+            while len(cache.data) > cache.max_size: cache._unlink_(cache.root[NEXT])
+    def pop(cache, key, default=None):
+        cache.lock.acquire()
+        try:
+            cache.generation += 1
+            node = cache.data.get(key)
+            if node is None: return default
+            cache._unlink_(node)
+            return node[VALUE]
+        finally: cache.lock.release()
+    def clear(cache):
+        cache.lock.acquire()
+        try:
+            cache.generation += 1
+            cache._clear_()
+        finally: cache.lock.release()
+    def _link_(cache, node):
+        root = cache.root
+        last = root[PREV]
+        node[PREV] = last
+        node[NEXT] = root
+        last[NEXT] = root[PREV] = node
+        cache.data[node[KEY]] = node
+    def _unlink_(cache, node):
+        prev, next = node[PREV], node[NEXT]
+        prev[NEXT] = next
+        next[PREV] = prev
+        del cache.data[node[KEY]]
+
+class QueryResultCache(LRUCache):
+    def __init__(cache, max_size=1000, ttl=None):
+        cache.table_versions = {}  # incremented on each invalidation of the table
+        LRUCache.__init__(cache, max_size, ttl)
+    def _clear_(cache):
+        LRUCache._clear_(cache)
+        cache.table_keys = {}
+    def get(cache, key, default=None):
+        entry = LRUCache.get(cache, key)
+        if entry is None: return default
+        return entry[0]
+    def set(cache, key, value, tables=(), ttl=None, versions=None):
+        if ttl is None: ttl = cache.ttl
+        expires = ttl is not None and time() + ttl or None
+        cache.lock.acquire()
+        try:
+            if versions is not None and cache.get_versions(tables) != versions: return
+            cache._set_(key, (value, frozenset(tables)), expires)
+        finally: cache.lock.release()
+    def get_versions(cache, tables):
+        table_versions = cache.table_versions
+        return tuple(table_versions.get(table, 0) for table in tables)
+    def pop(cache, key, default=None):
+        entry = LRUCache.pop(cache, key)
+        if entry is None: return default
+        return entry[0]
+    def invalidate(cache, tables):
+        cache.lock.acquire()
+        try:
+            data = cache.data
+            table_versions = cache.table_versions
+            for table in tables:
+                table_versions[table] = table_versions.get(table, 0) + 1
+                for key in list(cache.table_keys.get(table, ())):
+                    node = data.get(key)
+                    if node is not None: cache._unlink_(node)
+        finally: cache.lock.release()
+    def _link_(cache, node):
+        LRUCache._link_(cache, node)
+        key = node[KEY]
+        for table in node[VALUE][1]: cache.table_keys.setdefault(table, set()).add(key)
+    def _unlink_(cache, node):
+        LRUCache._unlink_(cache, node)
+        key = node[KEY]
+        table_keys = cache.table_keys
+        for table in node[VALUE][1]:
+            keys = table_keys[table]
+            keys.discard(key)
+            if not keys: del table_keys[table]
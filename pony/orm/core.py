@@ -1,13 +1,15 @@
 import __builtin__, re, sys, types, inspect, logging
 from compiler import ast, parse
-from cPickle import loads, dumps
+from cPickle import loads, dumps, HIGHEST_PROTOCOL
+from hashlib import md5
 from copy import deepcopy, _deepcopy_dispatch
 from operator import attrgetter, itemgetter
 from itertools import count as _count, ifilter, ifilterfalse, imap, izip, chain, starmap
 from collections import defaultdict
 from time import time
 import datetime
-from threading import Lock
+from threading import Lock, Thread, Event
+from Queue import Queue
 from __builtin__ import min as _min, max as _max, sum as _sum
 
 # deepcopy instance method patch for Python < 2.7:
@@ -21,26 +23,28 @@ from pony import options
 from pony.orm.decompiling import decompile
 from pony.orm.ormtypes import AsciiStr, LongStr, LongUnicode, numeric_types, get_normalized_type_of
 from pony.orm.asttranslation import create_extractors, TranslationError
+from pony.orm.caching import LRUCache, QueryResultCache
+from pony.orm.sqlbuilding import Param, make_adapter
 from pony.orm.dbapiprovider import (
-    DBException, RowNotFound, MultipleRowsFound, TooManyRowsFound,
+    DBException, RowNotFound, MultipleRowsFound, TooManyRowsFound, PoolTimeoutError,
     Warning, Error, InterfaceError, DatabaseError, DataError, OperationalError,
     IntegrityError, InternalError, ProgrammingError, NotSupportedError
     )
 from pony.utils import (
     localbase, simple_decorator, decorator_with_params, cut_traceback, throw,
-    import_module, parse_expr, is_ident, count, avg as _avg, tostring
+    import_module, parse_expr, is_ident, count, avg as _avg, tostring, write_file_atomically
     )
 
 __all__ = '''
     pony
 
-    DBException RowNotFound MultipleRowsFound TooManyRowsFound
+    DBException RowNotFound MultipleRowsFound TooManyRowsFound PoolTimeoutError
 
     Warning Error InterfaceError DatabaseError DataError OperationalError
     IntegrityError InternalError ProgrammingError NotSupportedError
 
     OrmError ERDiagramError DBSchemaError MappingError ConstraintError CacheIndexError ObjectNotFound
-    MultipleObjectsFoundError TooManyObjectsFoundError OperationWithDeletedObjectError
+    MultipleObjectsFoundError TooManyObjectsFoundError OperationWithDeletedObjectError ReadOnlyError
     TransactionError TransactionIntegrityError IsolationError CommitException RollbackException
     UnrepeatableReadError UnresolvableCyclicDependency UnexpectedError
 
@@ -48,9 +52,9 @@ __all__ = '''
 
     Database sql_debug show
 
-    PrimaryKey Required Optional Set
+    PrimaryKey Required Optional Set Version
     composite_key
-    flush commit rollback with_transaction
+    flush commit rollback with_transaction TransactionExecutor
 
     AsciiStr LongStr LongUnicode
 
@@ -128,6 +132,7 @@ class ObjectNotFound(OrmError):
 class MultipleObjectsFoundError(OrmError): pass
 class TooManyObjectsFoundError(OrmError): pass
 class OperationWithDeletedObjectError(OrmError): pass
+class ReadOnlyError(OrmError): pass
 class TransactionError(OrmError): pass
 
 class TransactionIntegrityError(TransactionError):
@@ -233,6 +238,7 @@ next_num = _count().next
 class Local(localbase):
     def __init__(local):
         local.db2cache = {}
+        local.readonly = False
 
 local = Local()
 
@@ -283,6 +289,31 @@ class QueryStat(object):
 
 select_re = re.compile(r'\s*select\b', re.IGNORECASE)
 
+MAPPING_FILE_VERSION = 1
+
+def read_mapping_file(filename, fingerprint):
+    try: f = open(filename, 'rb')
+    except IOError: return None
+    try:
+        try: version, file_fingerprint, mapping = loads(f.read())
+        except Exception: return None  # corrupted file will be regenerated
+    finally: f.close()
+    if version != MAPPING_FILE_VERSION or file_fingerprint != fingerprint: return None
+    return mapping
+
+def write_mapping_file(filename, fingerprint, mapping):
+    write_file_atomically(filename, dumps((MAPPING_FILE_VERSION, fingerprint, mapping), HIGHEST_PROTOCOL))
+
+def fingerprint_value(value):
+    if isinstance(value, (list, tuple)): return [ fingerprint_value(item) for item in value ]
+    if callable(value):  # repr() of functions and instances contains memory address
+        name = getattr(value, '__name__', None)
+        if name is None:
+            value = value.__class__
+            name = value.__name__
+        return '%s.%s' % (getattr(value, '__module__', None), name)
+    return value
+
 class Database(object):
     def __deepcopy__(self, memo):
         return self  # Database cannot be cloned by deepcopy()
@@ -311,7 +342,9 @@ class Database(object):
         # ER-diagram related stuff:
         self._translator_cache = {}
         self._constructed_sql_cache = {}
+        self.query_cache = QueryResultCache()
         self.entities = {}
+        self.shared_cache_entities = []
         self._unmapped_attrs = {}
         self.schema = None
         self.Entity = type.__new__(EntityMeta, 'Entity', (Entity,), {})
@@ -320,12 +353,17 @@ class Database(object):
         self.global_stats = {}
         self.global_stats_lock = Lock()
         self.dblocal = DbLocal()
+        self._query_executor = None
+        self._query_executor_lock = Lock()
     @property
     def last_sql(database):
         return database.dblocal.last_sql
     @property
     def local_stats(database):
         return database.dblocal.stats
+    @property
+    def pool_stats(database):
+        return database.provider.pool.stats
     def _update_local_stat(database, sql, query_start_time):
         dblocal = database.dblocal
         dblocal.last_sql = sql
@@ -345,6 +383,7 @@ class Database(object):
     @cut_traceback
     def get_connection(database):
         cache = database._get_cache()
+        if cache.readonly: throw(ReadOnlyError, 'Cannot get connection for writing: transaction is read-only')
         cache.optimistic = False
         return cache.connection
     def _get_cache(database):
@@ -367,7 +406,9 @@ class Database(object):
         if cache is not None: cache.rollback()
     @cut_traceback
     def execute(database, sql, globals=None, locals=None):
-        database._get_cache().optimistic = False
+        cache = database._get_cache()
+        if cache.readonly: throw(ReadOnlyError, 'Cannot execute raw SQL: transaction is read-only')
+        cache.optimistic = False
         return database._execute(sql, globals, locals, 2)
     def _execute(database, sql, globals, locals, frame_depth):
         sql = sql[:]  # sql = templating.plainstr(sql)
@@ -380,8 +421,7 @@ class Database(object):
         adapted_sql, code = adapt_sql(sql, provider.paramstyle)
         values = eval(code, globals, locals)
         if values is None: values = ()
-        cache = database._get_cache()
-        cursor = cache.connection.cursor()
+        cursor = database._get_sql_connection_().cursor()
         if debug: log_sql(adapted_sql, values)
         t = time()
         provider.execute(cursor, adapted_sql, values)
@@ -420,9 +460,65 @@ class Database(object):
         result = cursor.fetchone()
         return bool(result)
     @cut_traceback
+    def gather(database, *queries):
+        for query in queries:
+            if not isinstance(query, Query): throw(TypeError, 'Query object expected. Got: %r' % query)
+            if query._database is not database: throw(TypeError, 'Query %r belongs to another database' % query)
+        cache = database._get_cache()
+        prepared = []
+        pending = []
+        for query in queries:
+            sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments()
+            prepared.append((query, sql, arguments, attr_offsets, query_key))
+            if query_key in cache.query_results or query._use_query_cache: continue
+            pending.append(len(prepared) - 1)
+        # rows written by the current transaction are not visible to other connections
+        if not database.provider.parallel_queries or not cache.optimistic: pending = []
+        workers = {}
+        if len(pending) > 1: executor = database._get_query_executor_()
+        for i in pending[1:]:
+            query, sql, arguments, attr_offsets, query_key = prepared[i]
+            entity = query._translator.expr_type
+            if not isinstance(entity, EntityMeta): entity = None
+            workers[i] = executor.submit(database._fetch_rows_in_worker_, entity, sql, arguments)
+        result = []
+        for i, (query, sql, arguments, attr_offsets, query_key) in enumerate(prepared):
+            async_result = workers.get(i)
+            if async_result is None: rows = None
+            else:
+                rows, duration = async_result.get()
+                if debug: log_sql(sql, arguments)
+                database._update_local_stat(sql, time() - duration)
+            result.append(query._fetch_result(sql, arguments, attr_offsets, query_key, rows))
+        return result
+    def _get_query_executor_(database):
+        database._query_executor_lock.acquire()
+        try:
+            if database._query_executor is None:
+                database._query_executor = QueryExecutor(max_gather_workers)
+            return database._query_executor
+        finally: database._query_executor_lock.release()
+    def _fetch_rows_in_worker_(database, entity, sql, arguments):
+        provider = database.provider
+        connection = provider.connect()
+        try:
+            cursor = connection.cursor()
+            t = time()
+            provider.execute(cursor, sql, arguments)
+            if entity is not None: rows = entity._fetch_rows_(cursor)
+            else: rows = cursor.fetchall()
+        except:
+            provider.drop(connection)
+            raise
+        # per-thread pools keep the connection in the worker's thread-local storage
+        if provider.connection_per_thread: provider.drop(connection)
+        else: provider.release(connection)
+        return rows, time() - t
+    @cut_traceback
     def insert(database, table_name, returning=None, **kwargs):
         table_name = table_name[:]  # table_name = templating.plainstr(table_name)
         cache = database._get_cache()
+        if cache.readonly: throw(ReadOnlyError, 'Cannot insert into %s: transaction is read-only' % table_name)
         cache.optimistic = False
         query_key = (table_name,) + tuple(kwargs)  # keys are not sorted deliberately!!
         if returning is not None: query_key = query_key + (returning,)
@@ -439,12 +535,61 @@ class Database(object):
             return getattr(cursor, 'lastrowid', None)
         new_id = database._exec_sql_returning_id(sql, arguments)
         return new_id
+    def _get_mapping_fingerprint_(database):
+        provider = database.provider
+        description = [ provider.__class__.__module__, provider.__class__.__name__, provider.paramstyle ]
+        for entity in sorted(database.entities.values(), key=attrgetter('_id_')):
+            description.append((entity.__name__, [ base.__name__ for base in entity._direct_bases_ ],
+                                entity._table_, entity._discriminator_,
+                                sorted([ attr.name for attr in key ] for key in entity._keys_)))
+            for attr in entity._new_attrs_:
+                py_type = attr.py_type
+                if isinstance(py_type, EntityMeta): type_name = py_type.__name__
+                elif isinstance(py_type, basestring): type_name = py_type
+                else: type_name = '%s.%s' % (py_type.__module__, py_type.__name__)
+                reverse = attr.reverse and attr.reverse.name
+                if attr.is_collection: collection_options = attr.table, attr.reverse_columns, attr.symmetric
+                else: collection_options = None
+                description.append((attr.__class__.__name__, attr.name, type_name, fingerprint_value(attr.args),
+                                    fingerprint_value(sorted(attr.kwargs.items())), attr.columns, reverse,
+                                    attr.is_pk, attr.is_unique, attr.nullable, attr.auto, attr.hilo, attr.sql_type,
+                                    attr.lazy, attr.fetch_group, collection_options))
+        return md5(repr(description)).hexdigest()
+    def _apply_mapping_(database, mapping):
+        for entity in database.entities.itervalues():
+            table_name, attr_columns, sql = mapping[entity.__name__]
+            if entity._root_ is entity: entity._table_ = table_name
+            for attr in entity._new_attrs_:
+                columns, reverse_columns, m2m_table = attr_columns[attr.name]
+                if columns:
+                    attr.columns = list(columns)
+                    if len(columns) == 1: attr.column = columns[0]
+                if reverse_columns: attr.reverse_columns = list(reverse_columns)
+                if m2m_table: attr.table = m2m_table
+    def _get_mapping_(database, include_sql=True):
+        mapping = {}
+        for entity in database.entities.itervalues():
+            attr_columns = {}
+            for attr in entity._new_attrs_:
+                if not attr.is_collection: attr_columns[attr.name] = attr.columns, None, None
+                elif attr.reverse.is_collection:
+                    attr_columns[attr.name] = attr.columns, attr.reverse_columns, attr.table
+                else: attr_columns[attr.name] = None, None, None
+            sql = include_sql and entity._get_mapping_sql_() or None
+            mapping[entity.__name__] = entity._table_, attr_columns, sql
+        return mapping
     def _ast2sql(database, sql_ast):
         sql, adapter = database.provider.ast2sql(sql_ast)
         return sql, adapter
-    def _exec_sql(database, sql, arguments=None):
+    def _get_sql_connection_(database):
         cache = database._get_cache()
-        cursor = cache.connection.cursor()
+        if cache.streaming: throw(ProgrammingError,
+            'Cannot execute SQL query while Query.iter_chunks() is streaming results from the same connection')
+        return cache.connection
+    def _exec_sql(database, sql, arguments=None, streaming=False, arraysize=None, connection=None):
+        if connection is None: connection = database._get_sql_connection_()
+        if streaming: cursor = database.provider.server_side_cursor(connection, arraysize)
+        else: cursor = connection.cursor()
         if debug: log_sql(sql, arguments)
         t = time()
         if arguments is None: database.provider.execute(cursor, sql)
@@ -452,8 +597,7 @@ class Database(object):
         database._update_local_stat(sql, t)
         return cursor
     def _exec_sql_returning_id(database, sql, arguments):
-        cache = database._get_cache()
-        cursor = cache.connection.cursor()
+        cursor = database._get_sql_connection_().cursor()
         if debug: log_sql(sql, arguments)
         t = time()
         new_id = database.provider.execute_returning_id(cursor, sql, arguments)
@@ -461,15 +605,14 @@ class Database(object):
         if type(new_id) is long: new_id = int(new_id)
         return new_id
     def _exec_sql_many(database, sql, arguments_list):
-        cache = database._get_cache()
-        cursor = cache.connection.cursor()
+        cursor = database._get_sql_connection_().cursor()
         if debug: log_sql_many(sql, arguments_list)
         t = time()
         database.provider.executemany(cursor, sql, arguments_list)
         database._update_local_stat(sql, t)
         return cursor
     @cut_traceback
-    def generate_mapping(database, filename=None, check_tables=False, create_tables=False):
+    def generate_mapping(database, filename=None, check_tables=False, create_tables=False, include_sql=True):
         if create_tables and check_tables: throw(TypeError,
             "Parameters 'check_tables' and 'create_tables' cannot be set to True at the same time")
 
@@ -477,10 +620,15 @@ class Database(object):
             return tuple(map(table.column_dict.__getitem__, column_names))
 
         if database.schema: throw(MappingError, 'Mapping was already generated')
-        if filename is not None: throw(NotImplementedError)
         for entity_name in database._unmapped_attrs:
             throw(ERDiagramError, 'Entity definition %s was not found' % entity_name)
 
+        mapping = None
+        if filename is not None:
+            fingerprint = database._get_mapping_fingerprint_()
+            mapping = read_mapping_file(filename, fingerprint)
+            if mapping is not None: database._apply_mapping_(mapping)
+
         provider = database.provider
         schema = database.schema = provider.dbschema_cls(provider)
         entities = list(sorted(database.entities.values(), key=attrgetter('_id_')))
@@ -607,9 +755,30 @@ class Database(object):
                     parent_columns = get_columns(parent_table, rentity._pk_columns_)
                     child_columns = get_columns(table, attr.columns)
                     table.add_foreign_key(None, child_columns, parent_table, parent_columns)
+        hilo_entities = []
+        for entity in entities:
+            if entity._root_ is not entity or entity._pk_is_composite_ or not entity._pk_.hilo: continue
+            table_name = entity._table_
+            if isinstance(table_name, tuple): hilo_table_name = table_name[:-1] + (table_name[-1] + '_hilo',)
+            else: hilo_table_name = table_name + '_hilo'
+            if hilo_table_name in schema.tables:
+                if isinstance(hilo_table_name, tuple): hilo_table_name = '.'.join(hilo_table_name)
+                throw(MappingError, "Table name '%s' is already in use" % hilo_table_name)
+            hilo_table = schema.add_table(hilo_table_name)
+            hilo_table.add_column('next_hi', entity._pk_.converters[0].sql_type(), True)
+            hilo_table.add_index(None, get_columns(hilo_table, [ 'next_hi' ]), is_pk=True)
+            entity._hilo_table_ = hilo_table_name
+            hilo_entities.append(entity)
+
+        if mapping is not None:
+            for entity in entities: entity._install_mapping_sql_(mapping[entity.__name__][2])
+        elif filename is not None:
+            write_mapping_file(filename, fingerprint, database._get_mapping_(include_sql))
 
         database.rollback()
         if create_tables: schema.create_tables()
+        if create_tables or check_tables:
+            for entity in hilo_entities: entity._seed_hilo_table_()
 
         if not check_tables and not create_tables: return
         for table in schema.tables.values():
@@ -661,7 +830,7 @@ class Attribute(object):
     __slots__ = 'nullable', 'is_required', 'is_discriminator', 'is_unique', 'is_part_of_unique_index', \
                 'is_pk', 'is_collection', 'is_ref', 'is_basic', 'is_string', \
                 'id', 'pk_offset', 'pk_columns_offset', 'py_type', 'sql_type', 'entity', 'name', \
-                'lazy', 'lazy_sql_cache', 'args', 'auto', 'default', 'reverse', 'composite_keys', \
+                'lazy', 'lazy_sql_cache', 'fetch_group', 'args', 'auto', 'hilo', 'default', 'reverse', 'composite_keys', \
                 'column', 'columns', 'col_paths', '_columns_checked', 'converters', 'kwargs', \
                 'cascade_delete'
     def __deepcopy__(attr, memo):
@@ -697,6 +866,12 @@ class Attribute(object):
         attr.entity = attr.name = None
         attr.args = args
         attr.auto = kwargs.pop('auto', False)
+        attr.hilo = kwargs.pop('hilo', None)
+        if attr.hilo is None: pass
+        elif not attr.is_pk or not attr.auto or py_type not in (int, long):
+            throw(TypeError, "'hilo' option can be specified for auto primary keys of int type only")
+        elif not isinstance(attr.hilo, (int, long)) or attr.hilo < 1:
+            throw(TypeError, "'hilo' option must be positive integer. Got: %r" % attr.hilo)
         attr.cascade_delete = kwargs.pop('cascade_delete', None)
 
         attr.reverse = kwargs.pop('reverse', None)
@@ -726,7 +901,10 @@ class Attribute(object):
         attr._columns_checked = False
         attr.composite_keys = []
         attr.lazy = kwargs.pop('lazy', getattr(py_type, 'lazy', False))
-        attr.lazy_sql_cache = None
+        attr.lazy_sql_cache = {}
+        attr.fetch_group = kwargs.pop('fetch_group', None)
+        if attr.fetch_group is not None and not attr.lazy:
+            throw(TypeError, "'fetch_group' option can be specified for lazy attributes only")
         attr.kwargs = kwargs
         attr.converters = []
     def _init_(attr, entity, name):
@@ -845,31 +1023,82 @@ class Attribute(object):
         if attr.lazy:
             entity = attr.entity
             database = entity._database_
-            if not attr.lazy_sql_cache:
-                select_list = [ 'ALL' ] + [ [ 'COLUMN', None, column ] for column in attr.columns ]
-                from_list = [ 'FROM', [ None, 'TABLE', entity._table_ ] ]
-                pk_columns = entity._pk_columns_
-                pk_converters = entity._pk_converters_
-                criteria_list = [ [ 'EQ', [ 'COLUMN', None, column ], [ 'PARAM', i, converter ] ]
-                                  for i, (column, converter) in enumerate(izip(pk_columns, pk_converters)) ]
-                sql_ast = [ 'SELECT', select_list, from_list, [ 'WHERE' ] + criteria_list ]
-                sql, adapter = database._ast2sql(sql_ast)
-                offsets = tuple(range(len(attr.columns)))
-                attr.lazy_sql_cache = sql, adapter, offsets
-            else: sql, adapter, offsets = attr.lazy_sql_cache
-            arguments = adapter(obj._get_raw_pkval_())
+            cache = obj._cache_
+            max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+            objects = [ obj ]
+            lazy_seeds = cache.lazy_seeds.get(attr)
+            if lazy_seeds:
+                lazy_seeds.discard(obj)
+                while lazy_seeds and len(objects) < max_batch_size:
+                    obj2 = lazy_seeds.pop()
+                    if attr.name in obj2._vals_ or obj2._status_ in ('deleted', 'cancelled'): continue
+                    objects.append(obj2)
+            sql, adapter, attr_offsets = attr._construct_lazy_sql_(len(objects))
+            arguments = adapter(dict(enumerate(objects)))
             cursor = database._exec_sql(sql, arguments)
-            row = cursor.fetchone()
-            dbval = attr.parse_value(row, offsets)
-            attr.db_set(obj, dbval)
+            pk_len = len(entity._pk_columns_)
+            group_seeds = [ cache.lazy_seeds[attr2] for attr2, offsets in attr_offsets
+                            if attr2 is not attr and attr2 in cache.lazy_seeds ]
+            for row in cursor.fetchall():
+                obj2 = entity._get_by_raw_pkval_(row[:pk_len])
+                for attr2, offsets in attr_offsets: attr2.db_set(obj2, attr2.parse_value(row, offsets))
+                for seeds in group_seeds: seeds.discard(obj2)
+            if attr.name not in obj._vals_: throw(UnrepeatableReadError, '%s disappeared' % obj)
         else: obj._load_()
         return obj._vals_[attr.name]
+    def _get_fetch_group_(attr):
+        if attr.fetch_group is None: return [ attr ]
+        return [ attr2 for attr2 in attr.entity._attrs_
+                 if attr2.fetch_group == attr.fetch_group and attr2.lazy and attr2.columns ]
+    def _construct_lazy_sql_(attr, batch_size):
+        cached_sql = attr.lazy_sql_cache.get(batch_size)
+        if cached_sql is not None: return cached_sql
+        entity = attr.entity
+        database = entity._database_
+        pk_columns = entity._pk_columns_
+        select_list = [ 'ALL' ] + [ [ 'COLUMN', None, column ] for column in pk_columns ]
+        attr_offsets = []
+        for attr2 in attr._get_fetch_group_():
+            offset = len(select_list) - 1
+            attr_offsets.append((attr2, range(offset, offset + len(attr2.columns))))
+            select_list.extend([ 'COLUMN', None, column ] for column in attr2.columns)
+        from_list = [ 'FROM', [ None, 'TABLE', entity._table_ ] ]
+        row_value_syntax = database.provider.translator_cls.row_value_syntax
+        criteria_list = construct_batch_criteria_list(batch_size, pk_columns, entity._pk_converters_, row_value_syntax)
+        sql_ast = [ 'SELECT', select_list, from_list, [ 'WHERE' ] + criteria_list ]
+        sql, adapter = database._ast2sql(sql_ast)
+        cached_sql = attr.lazy_sql_cache[batch_size] = sql, adapter, attr_offsets
+        return cached_sql
+    def prefetch(attr, objects):
+        reverse = attr.reverse
+        if not reverse: throw(TypeError, 'Attribute %s is not a relationship attribute' % attr)
+        entity = attr.entity
+        rentity = reverse.entity
+        objects = [ obj for obj in objects if obj._status_ not in ('deleted', 'cancelled') ]
+        if attr.columns:
+            entity._load_many_(objects)
+            result = set(obj._vals_[attr.name] for obj in objects if obj._vals_.get(attr.name) is not None)
+            rentity._load_many_(result)
+            return result
+        database = entity._database_
+        objects_to_load = sorted((obj for obj in objects if obj._status_ != 'created' and attr.name not in obj._vals_),
+                                 key=attrgetter('_pkval_'))
+        max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+        for i in xrange(0, len(objects_to_load), max_batch_size):
+            batch = objects_to_load[i:i+max_batch_size]
+            sql, adapter, attr_offsets = rentity._construct_batchload_sql_(len(batch), reverse)
+            arguments = adapter(dict(enumerate(batch)))
+            cursor = database._exec_sql(sql, arguments)
+            rentity._fetch_objects(cursor, attr_offsets)
+            for obj in batch: obj._vals_.setdefault(attr.name, None)
+        return set(obj._vals_[attr.name] for obj in objects if obj._vals_.get(attr.name) is not None)
     @cut_traceback
     def __get__(attr, obj, cls=None):
         if obj is None: return attr
-        if not obj._cache_.is_alive: throw(TransactionRolledBack, 'Object belongs to obsolete cache')
+        cache = obj._cache_
+        if not cache.is_alive: throw(TransactionRolledBack, 'Object belongs to obsolete cache')
         result = attr.get(obj)
-        if attr.pk_offset is not None: return result
+        if attr.pk_offset is not None or cache.readonly: return result
         bit = obj._bits_[attr]
         wbits = obj._wbits_
         if wbits is not None and not wbits & bit: obj._rbits_ |= bit
@@ -887,6 +1116,7 @@ class Attribute(object):
     def __set__(attr, obj, new_val, undo_funcs=None):
         cache = obj._cache_
         if not cache.is_alive: throw(TransactionRolledBack, 'Object belongs to obsolete cache')
+        if cache.readonly: throw(ReadOnlyError, 'Cannot modify %s: transaction is read-only' % obj)
         if obj._status_ in ('deleted', 'cancelled'): throw(OperationWithDeletedObjectError, '%s was deleted' % obj)
         is_reverse_call = undo_funcs is not None
         reverse = attr.reverse
@@ -978,9 +1208,6 @@ class Attribute(object):
                 'Value of %s.%s for %s was updated outside of current transaction%s'
                 % (obj.__class__.__name__, attr.name, obj, diff))
 
-        if new_dbval is NOT_LOADED: obj._dbvals_.pop(attr.name, None)
-        else: obj._dbvals_[attr.name] = new_dbval
-
         wbit = bool(obj._wbits_ & bit)
         if not wbit:
             old_val = obj._vals_.get(attr.name, NOT_LOADED)
@@ -997,6 +1224,9 @@ class Attribute(object):
             if new_dbval is NOT_LOADED: obj._vals_.pop(attr.name, None)
             else: obj._vals_[attr.name] = new_dbval
 
+        if new_dbval is NOT_LOADED: obj._dbvals_.pop(attr.name, None)
+        else: obj._dbvals_[attr.name] = new_dbval
+
         reverse = attr.reverse
         if not reverse: pass
         elif not is_reverse_call: attr.db_update_reverse(obj, old_dbval, new_dbval)
@@ -1083,6 +1313,7 @@ class Attribute(object):
         options = []
         if attr.args: options.append(', '.join(map(str, attr.args)))
         if attr.auto: options.append('auto=True')
+        if attr.hilo: options.append('hilo=%d' % attr.hilo)
         if not isinstance(attr, PrimaryKey) and attr.is_unique: options.append('unique=True')
         if attr.default is not None: options.append('default=%s' % attr.default)
         if not options: options = ''
@@ -1157,6 +1388,22 @@ class Discriminator(Required):
     def update_reverse(attr, obj, old_val, new_val, undo_funcs):
         assert False
 
+class Version(Required):
+    __slots__ = []
+    def __init__(attr, py_type=int, *args, **kwargs):
+        if py_type not in (int, long): throw(TypeError, 'Version attribute must be of int or long type. Got: %r' % py_type)
+        kwargs.setdefault('default', 1)
+        Required.__init__(attr, py_type, *args, **kwargs)
+    def _init_(attr, entity, name):
+        if entity._root_ is not entity: throw(ERDiagramError,
+            'Version attribute %s.%s cannot be declared in subclass' % (entity.__name__, name))
+        if entity._version_attr_ is not None: throw(ERDiagramError,
+            'Entity %s cannot have more than one version attribute' % entity.__name__)
+        Required._init_(attr, entity, name)
+        entity._version_attr_ = attr
+    def __set__(attr, obj, new_val, undo_funcs=None):
+        throw(TypeError, 'Cannot assign value to version attribute %s' % attr)
+
 def composite_key(*attrs):
     if len(attrs) < 2: throw(TypeError,
         'composite_key() must receive at least two attributes as arguments')
@@ -1238,7 +1485,7 @@ class Collection(Attribute):
         for option in attr.kwargs: throw(TypeError, 'Unknown option %r' % option)
         attr.cached_load_sql = {}
         attr.cached_add_m2m_sql = None
-        attr.cached_remove_m2m_sql = None
+        attr.cached_remove_m2m_sql = {}
     def _init_(attr, entity, name):
         Attribute._init_(attr, entity, name)
         if attr.is_unique: throw(TypeError,
@@ -1311,7 +1558,6 @@ class Set(Collection):
         if cache is not database._get_cache():
             throw(TransactionError, "Transaction of object %s belongs to different thread")
         objects = [ obj ]
-        setdata_list = [ setdata ]
         assert cache.is_alive
         counter = cache.collection_statistics.setdefault(attr, 0)
         if counter >= attr.nplus1_threshold:
@@ -1324,9 +1570,37 @@ class Set(Collection):
                 if setdata2 is NOT_LOADED: setdata2 = obj2._vals_[attr.name] = SetData()
                 elif setdata2.is_fully_loaded: continue
                 objects.append(obj2)
-                setdata_list.append(setdata2)
                 if len(objects) >= max_batch_size: break
-
+        attr._load_batch_(objects)
+        cache.collection_statistics[attr] = counter + 1
+        return setdata
+    def prefetch(attr, objects):
+        entity = attr.entity
+        database = entity._database_
+        cache = database._get_cache()
+        objects_to_load = []
+        for obj in objects:
+            if obj._status_ in ('created', 'deleted', 'cancelled'): continue
+            if obj._cache_ is not cache:
+                throw(TransactionError, 'An attempt to mix objects belongs to different caches')
+            setdata = obj._vals_.get(attr.name, NOT_LOADED)
+            if setdata is NOT_LOADED: setdata = obj._vals_[attr.name] = SetData()
+            elif setdata.is_fully_loaded: continue
+            objects_to_load.append(obj)
+        objects_to_load.sort(key=attrgetter('_pkval_'))
+        max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+        for i in xrange(0, len(objects_to_load), max_batch_size):
+            attr._load_batch_(objects_to_load[i:i+max_batch_size])
+        result = set()
+        for obj in objects:
+            setdata = obj._vals_.get(attr.name)
+            if setdata: result.update(setdata)
+        return result
+    def _load_batch_(attr, objects):
+        entity = attr.entity
+        reverse = attr.reverse
+        rentity = reverse.entity
+        database = entity._database_
         value_dict = dict(enumerate(objects))
 
         if not reverse.is_collection:
@@ -1335,7 +1609,6 @@ class Set(Collection):
             cursor = database._exec_sql(sql, arguments)
             items = rentity._fetch_objects(cursor, attr_offsets)
         else:
-            rentity = reverse.entity
             sql, adapter = attr.construct_sql_m2m(len(objects))
             arguments = adapter(value_dict)
             cursor = database._exec_sql(sql, arguments)
@@ -1348,23 +1621,21 @@ class Set(Collection):
                     items = d.get(obj2)
                     if items is None: items = d[obj2] = set()
                     items.add(item)
-            else: d[obj] = set(imap(rentity._get_by_raw_pkval_, cursor.fetchall()))
+            else: d[objects[0]] = set(imap(rentity._get_by_raw_pkval_, cursor.fetchall()))
             for obj2, items in d.iteritems():
                 setdata2 = obj2._vals_.get(attr.name, NOT_LOADED)
-                if setdata2 is NOT_LOADED: setdata2 = obj._vals_[attr.name] = SetData()
+                if setdata2 is NOT_LOADED: setdata2 = obj2._vals_[attr.name] = SetData()
                 else:
                     phantoms = setdata2 - items
                     phantoms.difference_update(setdata2.added)
                     if phantoms: throw(UnrepeatableReadError,
-                        'Phantom object %r disappeared from collection %r.%s' % (phantoms.pop(), obj, attr.name))
+                        'Phantom object %r disappeared from collection %r.%s' % (phantoms.pop(), obj2, attr.name))
                 items -= setdata2
                 items.difference_update(setdata2.removed)
                 setdata2 |= items
                 reverse.db_reverse_add(items, obj2)
 
-        for setdata2 in setdata_list: setdata2.is_fully_loaded = True
-        cache.collection_statistics[attr] = counter + 1
-        return setdata
+        for obj in objects: obj._vals_[attr.name].is_fully_loaded = True
     def construct_sql_m2m(attr, batch_size=1):
         cached_sql = attr.cached_load_sql.get(batch_size)
         if cached_sql is not None: return cached_sql
@@ -1413,7 +1684,7 @@ class Set(Collection):
         setdata = obj._vals_.get(attr.name, NOT_LOADED)
         if setdata is NOT_LOADED or not setdata.is_fully_loaded: setdata = attr.load(obj)
         reverse = attr.reverse
-        if not reverse.is_collection and reverse.pk_offset is None:
+        if not reverse.is_collection and reverse.pk_offset is None and not obj._cache_.readonly:
             for item in setdata:
                 bit = item._bits_[reverse]
                 wbits = item._wbits_
@@ -1431,6 +1702,7 @@ class Set(Collection):
     def __set__(attr, obj, new_items, undo_funcs=None):
         cache = obj._cache_
         if not cache.is_alive: throw(TransactionRolledBack, 'Object belongs to obsolete cache')
+        if cache.readonly: throw(ReadOnlyError, 'Cannot modify %s: transaction is read-only' % obj)
         if obj._status_ in ('deleted', 'cancelled'): throw(OperationWithDeletedObjectError, '%s was deleted' % obj)
         new_items = attr.check(new_items, obj)
         reverse = attr.reverse
@@ -1495,12 +1767,30 @@ class Set(Collection):
                 if in_removed: setdata.removed.add(item)
                 if not was_modified_earlier: objects_with_modified_collections.remove(obj)
         undo_funcs.append(undo_func)
+    def reverse_add_new(attr, obj, items, undo_funcs):
+        # items are just created, so they cannot be in the collection yet
+        cache = obj._cache_
+        objects_with_modified_collections = cache.modified_collections.setdefault(attr, set())
+        was_modified_earlier = obj in objects_with_modified_collections
+        setdata = obj._vals_.get(attr.name, NOT_LOADED)
+        if setdata is NOT_LOADED:
+            setdata = obj._vals_[attr.name] = SetData()
+        if setdata.added is EMPTY: setdata.added = set()
+        setdata.update(items)
+        setdata.added.update(items)
+        objects_with_modified_collections.add(obj)
+        def undo_func():
+            setdata = obj._vals_[attr.name]
+            setdata.difference_update(items)
+            setdata.added.difference_update(items)
+            if not was_modified_earlier: objects_with_modified_collections.remove(obj)
+        undo_funcs.append(undo_func)
     def db_reverse_add(attr, objects, item):
         for obj in objects:
             setdata = obj._vals_.get(attr.name, NOT_LOADED)
             if setdata is NOT_LOADED:
                 setdata = obj._vals_[attr.name] = SetData()
-            elif setdata.is_fully_loaded:
+            elif setdata.is_fully_loaded and item not in setdata:
                 throw(UnrepeatableReadError, 'Phantom object %r appeared in collection %r.%s' % (item, obj, attr.name))
             setdata.add(item)
     def reverse_remove(attr, objects, item, undo_funcs):
@@ -1530,7 +1820,9 @@ class Set(Collection):
                 if not was_modified_earlier: objects_with_modified_collections.remove(obj)
         undo_funcs.append(undo_func)
     def db_reverse_remove(attr, objects, item):
-        raise AssertionError
+        for obj in objects:
+            setdata = obj._vals_.get(attr.name, NOT_LOADED)
+            if setdata is not NOT_LOADED: setdata.discard(item)
     def get_m2m_columns(attr, is_reverse=False):
         entity = attr.entity
         if attr.symmetric:
@@ -1562,29 +1854,43 @@ class Set(Collection):
         attr._columns_checked = True
         return reverse.columns
     def remove_m2m(attr, removed):
-        entity = attr.entity
-        database = entity._database_
-        cached_sql = attr.cached_remove_m2m_sql
-        if cached_sql is None:
-            reverse = attr.reverse
-            table_name = attr.table
-            assert table_name is not None
-            where_list = [ 'WHERE' ]
-            if attr.symmetric:
-                columns = attr.columns + attr.reverse_columns
-                converters = attr.converters + attr.converters
-            else:
-                columns = reverse.columns + attr.columns
-                converters = reverse.converters + attr.converters
-            for i, (column, converter) in enumerate(zip(columns, converters)):
-                where_list.append([ 'EQ', ['COLUMN', None, column], [ 'PARAM', i, converter ] ])
-            sql_ast = [ 'DELETE', table_name, where_list ]
-            sql, adapter = database._ast2sql(sql_ast)
-            attr.cached_remove_m2m_sql = sql, adapter
-        else: sql, adapter = cached_sql
-        arguments_list = [ adapter(obj._get_raw_pkval_() + robj._get_raw_pkval_())
-                           for obj, robj in removed ]
-        database._exec_sql_many(sql, arguments_list)
+        database = attr.entity._database_
+        groups = {}
+        for obj, robj in removed: groups.setdefault(obj, []).append(robj)
+        if attr.symmetric: owner_columns, item_columns = attr.columns, attr.reverse_columns
+        else: owner_columns, item_columns = attr.reverse.columns, attr.columns
+        max_batch_size = _max((database.provider.max_params_count - len(owner_columns)) // len(item_columns), 1)
+        statements = {}
+        for obj, robjects in groups.iteritems():
+            for i in xrange(0, len(robjects), max_batch_size):
+                chunk = robjects[i:i+max_batch_size]
+                sql, adapter = attr._construct_remove_m2m_sql_(len(chunk))
+                value_dict = dict(enumerate(chunk))
+                value_dict['owner'] = obj
+                statements.setdefault(sql, []).append(adapter(value_dict))
+        for sql, arguments_list in statements.iteritems():
+            if len(arguments_list) == 1: database._exec_sql(sql, arguments_list[0])
+            else: database._exec_sql_many(sql, arguments_list)
+    def _construct_remove_m2m_sql_(attr, batch_size):
+        cached_sql = attr.cached_remove_m2m_sql.get(batch_size)
+        if cached_sql is not None: return cached_sql
+        reverse = attr.reverse
+        table_name = attr.table
+        assert table_name is not None
+        if attr.symmetric:
+            owner_columns, item_columns = attr.columns, attr.reverse_columns
+            owner_converters = item_converters = attr.converters
+        else:
+            owner_columns, item_columns = reverse.columns, attr.columns
+            owner_converters, item_converters = reverse.converters, attr.converters
+        where_list = [ 'WHERE' ]
+        for i, (column, converter) in enumerate(izip(owner_columns, owner_converters)):
+            where_list.append([ 'EQ', [ 'COLUMN', None, column ], [ 'PARAM', ('owner', i), converter ] ])
+        row_value_syntax = attr.entity._database_.provider.translator_cls.row_value_syntax
+        where_list.extend(construct_batch_criteria_list(batch_size, item_columns, item_converters, row_value_syntax))
+        sql_ast = [ 'DELETE', table_name, where_list ]
+        cached_sql = attr.cached_remove_m2m_sql[batch_size] = attr.entity._database_._ast2sql(sql_ast)
+        return cached_sql
     def add_m2m(attr, added):
         entity = attr.entity
         database = entity._database_
@@ -1681,6 +1987,7 @@ class SetWrapper(object):
     def add(wrapper, new_items):
         obj = wrapper._obj_
         if not obj._cache_.is_alive: throw(TransactionRolledBack, 'Object belongs to obsolete cache')
+        if obj._cache_.readonly: throw(ReadOnlyError, 'Cannot modify %s: transaction is read-only' % obj)
         if obj._status_ in ('deleted', 'cancelled'): throw(OperationWithDeletedObjectError, '%s was deleted' % obj)
         attr = wrapper._attr_
         reverse = attr.reverse
@@ -1710,6 +2017,7 @@ class SetWrapper(object):
     def remove(wrapper, items):
         obj = wrapper._obj_
         if not obj._cache_.is_alive: throw(TransactionRolledBack, 'Object belongs to obsolete cache')
+        if obj._cache_.readonly: throw(ReadOnlyError, 'Cannot modify %s: transaction is read-only' % obj)
         if obj._status_ in ('deleted', 'cancelled'): throw(OperationWithDeletedObjectError, '%s was deleted' % obj)
         attr = wrapper._attr_
         reverse = attr.reverse
@@ -1878,6 +2186,7 @@ class EntityMeta(type):
         else:
             entity._root_ = entity
             entity._discriminator_attr_ = None
+            entity._version_attr_ = None
 
         base_attrs = []
         base_attrs_dict = {}
@@ -1953,6 +2262,7 @@ class EntityMeta(type):
         entity._new_attrs_ = new_attrs
         entity._attrs_ = base_attrs + new_attrs
         entity._adict_ = dict((attr.name, attr) for attr in entity._attrs_)
+        entity._lazy_attrs_ = [ attr for attr in entity._attrs_ if attr.lazy and not attr.is_collection ]
         entity._subclass_attrs_ = set()
         for base in entity._all_bases_:
             base._subclass_attrs_.update(new_attrs)
@@ -1986,10 +2296,30 @@ class EntityMeta(type):
         entity._cached_create_sql_ = None
         entity._cached_create_sql_auto_pk_ = None
         entity._cached_delete_sql_ = None
+        entity._hilo_table_ = None
+        entity._hilo_sql_ = None
         entity._find_sql_cache_ = {}
         entity._batchload_sql_cache_ = {}
+        entity._batch_delete_sql_cache_ = {}
+        entity._batch_create_sql_cache_ = {}
         entity._update_sql_cache_ = {}
         entity._lock_sql_cache_ = {}
+        entity._row_parsers_ = {}
+
+        if '_shared_cache_' in entity.__dict__:
+            shared_cache = entity._shared_cache_
+            if entity._root_ is not entity: throw(ERDiagramError,
+                '_shared_cache_ option cannot be specified for entity %s, because it is not a root entity'
+                % entity.__name__)
+            if shared_cache is True: entity._shared_cache_ = shared_cache = LRUCache()
+            elif shared_cache is False: entity._shared_cache_ = shared_cache = None
+            if shared_cache is not None:
+                for attr in entity._pk_attrs_:
+                    if isinstance(attr.py_type, basestring) or issubclass(attr.py_type, Entity): throw(ERDiagramError,
+                        'Entity %s cannot use shared cache, because its primary key contains reference attribute %s'
+                        % (entity.__name__, attr))
+                database.shared_cache_entities.append(entity)
+        elif entity._root_ is entity: entity._shared_cache_ = None
 
         entity._propagation_mixin_ = None
         entity._set_wrapper_subclass_ = None
@@ -2174,7 +2504,11 @@ class EntityMeta(type):
         try:
             objects = entity._find_in_cache_(pkval, avdict)
         except KeyError:  # not found in cache, can exist in db
-            objects = entity._find_in_db_(avdict, max_fetch_count)
+            obj = None
+            if entity._shared_cache_ is not None and pkval is not None and len(avdict) == len(entity._pk_attrs_):
+                obj = entity._find_in_shared_cache_(pkval)
+            if obj is not None: objects = [ obj ]
+            else: objects = entity._find_in_db_(avdict, max_fetch_count)
         return objects
     def _find_in_cache_(entity, pkval, avdict):
         cache = entity._get_cache_()
@@ -2299,23 +2633,8 @@ class EntityMeta(type):
         else:
             columns = attr.columns
             converters = attr.converters
-        if batch_size == 1:
-            criteria_list = [ [ 'EQ', [ 'COLUMN', None, column ], [ 'PARAM', (0, i), converter ] ]
-                              for i, (column, converter) in enumerate(izip(columns, converters)) ]
-        elif len(columns) == 1:
-            converter = converters[0]
-            criteria_list = [ [ 'IN', [ 'COLUMN', None, columns[0] ],
-                                   [ [ 'PARAM', (i, 0), converter ] for i in xrange(batch_size) ] ] ]
-        elif entity._database_.provider.translator_cls.row_value_syntax:
-            criteria_list = [ [ 'IN', [ 'ROW' ] + [ [ 'COLUMN', None, column ] for column in columns ],
-                                    [ [ 'ROW' ] + [ [ 'PARAM', (i, j), converter ] for j, converter in enumerate(converters) ]
-                                     for i in xrange(batch_size) ] ] ]
-        else:
-            pairs = zip(columns, converters)
-            criteria_list = [ [ 'OR' ] + [ [ 'AND' ] + [ [ 'EQ', [ 'COLUMN', None, column ], [ 'PARAM', (i, j), converter ] ]
-                                                     for j, (column, converter) in enumerate(pairs) ]
-                                         for i in xrange(batch_size) ] ]
-
+        row_value_syntax = entity._database_.provider.translator_cls.row_value_syntax
+        criteria_list = construct_batch_criteria_list(batch_size, columns, converters, row_value_syntax)
         discr_criteria = entity._construct_discriminator_criteria_()
         if discr_criteria: criteria_list.insert(0, discr_criteria)
 
@@ -2325,6 +2644,109 @@ class EntityMeta(type):
         cached_sql = sql, adapter, attr_offsets
         entity._batchload_sql_cache_[query_key] = cached_sql
         return cached_sql
+    def _construct_create_sql_(entity, auto_pk=False):
+        if auto_pk: cached_sql = entity._cached_create_sql_auto_pk_
+        else: cached_sql = entity._cached_create_sql_
+        if cached_sql is not None: return cached_sql
+        if auto_pk:
+            columns = entity._columns_without_pk_
+            converters = entity._converters_without_pk_
+        else:
+            columns = entity._columns_
+            converters = entity._converters_
+        assert len(columns) == len(converters)
+        params = [ [ 'PARAM', i,  converter ] for i, converter in enumerate(converters) ]
+        sql_ast = [ 'INSERT', entity._table_, columns, params ]
+        if auto_pk:
+            assert len(entity._pk_columns_) == 1
+            assert entity._pk_.auto
+            sql_ast.append(entity._pk_columns_[0])
+        cached_sql = entity._database_._ast2sql(sql_ast)
+        if auto_pk: entity._cached_create_sql_auto_pk_ = cached_sql
+        else: entity._cached_create_sql_ = cached_sql
+        return cached_sql
+    def _construct_batch_create_sql_(entity, batch_size):
+        cached_sql = entity._batch_create_sql_cache_.get(batch_size)
+        if cached_sql is not None: return cached_sql
+        converters = entity._converters_without_pk_
+        rows = [ [ [ 'PARAM', (i, j), converter ] for j, converter in enumerate(converters) ]
+                 for i in xrange(batch_size) ]
+        sql_ast = [ 'INSERT_MANY', entity._table_, entity._columns_without_pk_, rows, entity._pk_columns_[0] ]
+        cached_sql = entity._batch_create_sql_cache_[batch_size] = entity._database_._ast2sql(sql_ast)
+        return cached_sql
+    def _construct_delete_sql_(entity):
+        cached_sql = entity._cached_delete_sql_
+        if cached_sql is not None: return cached_sql
+        where_list = [ 'WHERE' ]
+        populate_criteria_list(where_list, entity._pk_columns_, entity._pk_converters_)
+        sql_ast = [ 'DELETE', entity._table_, where_list ]
+        cached_sql = entity._cached_delete_sql_ = entity._database_._ast2sql(sql_ast)
+        return cached_sql
+    def _get_mapping_sql_(entity):
+        result = {}
+        if entity._pk_is_composite_ or not entity._pk_.auto: auto_pk_variants = False,
+        else: auto_pk_variants = False, True
+        for auto_pk in auto_pk_variants: result['create', auto_pk] = entity._construct_create_sql_(auto_pk)[0]
+        result['delete'] = entity._construct_delete_sql_()[0]
+        sql, adapter, attr_offsets = entity._construct_batchload_sql_(1)
+        attr_offsets = dict(((attr.entity.__name__, attr.name), offsets) for attr, offsets in attr_offsets.iteritems())
+        result['batchload'] = sql, attr_offsets
+        return result
+    def _install_mapping_sql_(entity, sql_dict):
+        if not sql_dict: return
+        paramstyle = entity._database_.provider.paramstyle
+        def make_sql(sql, keys, converters):
+            params = tuple(Param(paramstyle, i+1, key, converter)
+                           for i, (key, converter) in enumerate(izip(keys, converters)))
+            return sql, make_adapter(paramstyle, params)
+        converters = entity._converters_
+        if ('create', False) in sql_dict: entity._cached_create_sql_ = make_sql(
+            sql_dict['create', False], xrange(len(converters)), converters)
+        converters = entity._converters_without_pk_
+        if ('create', True) in sql_dict: entity._cached_create_sql_auto_pk_ = make_sql(
+            sql_dict['create', True], xrange(len(converters)), converters)
+        converters = entity._pk_converters_
+        entity._cached_delete_sql_ = make_sql(sql_dict['delete'], xrange(len(converters)), converters)
+        sql, attr_offsets = sql_dict['batchload']
+        sql, adapter = make_sql(sql, [ (0, i) for i in xrange(len(converters)) ], converters)
+        database = entity._database_
+        attr_offsets = dict((database.entities[entity_name]._adict_[attr_name], offsets)
+                            for (entity_name, attr_name), offsets in attr_offsets.iteritems())
+        entity._batchload_sql_cache_[1, None] = sql, adapter, attr_offsets
+    def _construct_batch_delete_sql_(entity, batch_size):
+        cached_sql = entity._batch_delete_sql_cache_.get(batch_size)
+        if cached_sql is not None: return cached_sql
+        database = entity._database_
+        row_value_syntax = database.provider.translator_cls.row_value_syntax
+        criteria_list = construct_batch_criteria_list(batch_size, entity._pk_columns_, entity._pk_converters_,
+                                                      row_value_syntax)
+        sql_ast = [ 'DELETE', entity._table_, [ 'WHERE' ] + criteria_list ]
+        cached_sql = database._ast2sql(sql_ast)
+        entity._batch_delete_sql_cache_[batch_size] = cached_sql
+        return cached_sql
+    def _construct_batch_lock_sql_(entity, batch_size, attrs, null_mask):
+        query_key = batch_size, attrs, null_mask
+        cached_sql = entity._lock_sql_cache_.get(query_key)
+        if cached_sql is not None: return cached_sql
+        database = entity._database_
+        columns = list(entity._pk_columns_)
+        converters = list(entity._pk_converters_)
+        null_columns = []
+        check_columns = [ column for attr in attrs for column in attr.columns ]
+        check_converters = [ converter for attr in attrs for converter in attr.converters ]
+        for column, converter, is_null in izip(check_columns, check_converters, null_mask):
+            if is_null: null_columns.append(column)
+            else:
+                columns.append(column)
+                converters.append(converter)
+        row_value_syntax = database.provider.translator_cls.row_value_syntax
+        criteria_list = construct_batch_criteria_list(batch_size, columns, converters, row_value_syntax)
+        criteria_list.extend([ 'IS_NULL', [ 'COLUMN', None, column ] ] for column in null_columns)
+        select_list = [ 'ALL' ] + [ [ 'COLUMN', None, column ] for column in entity._pk_columns_ ]
+        sql_ast = [ 'SELECT', select_list, [ 'FROM', [ None, 'TABLE', entity._table_ ] ], [ 'WHERE' ] + criteria_list ]
+        cached_sql = database._ast2sql(sql_ast)
+        entity._lock_sql_cache_[query_key] = cached_sql
+        return cached_sql
     def _construct_sql_(entity, query_attrs, order_by_pk=False):
         query_key = query_attrs, order_by_pk
         cached_sql = entity._find_sql_cache_.get(query_key)
@@ -2364,6 +2786,9 @@ class EntityMeta(type):
         entity._find_sql_cache_[query_key] = cached_sql
         return cached_sql
     def _fetch_objects(entity, cursor, attr_offsets, max_fetch_count=None):
+        rows = entity._fetch_rows_(cursor, max_fetch_count)
+        return entity._make_objects_(rows, attr_offsets)
+    def _fetch_rows_(entity, cursor, max_fetch_count=None):
         if max_fetch_count is None: max_fetch_count = options.MAX_FETCH_COUNT
         if max_fetch_count is not None:
             rows = cursor.fetchmany(max_fetch_count + 1)
@@ -2373,34 +2798,77 @@ class EntityMeta(type):
                 throw(TooManyObjectsFoundError,
                     'Found more then pony.options.MAX_FETCH_COUNT=%d objects' % options.MAX_FETCH_COUNT)
         else: rows = cursor.fetchall()
+        return rows
+    def _make_objects_(entity, rows, attr_offsets):
         objects = []
         if attr_offsets is None:
             objects = [ entity._get_by_raw_pkval_(row) for row in rows ]
             entity._load_many_(objects)
         else:
+            shared_cache = entity._shared_cache_
+            if shared_cache is not None:
+                cache = entity._get_cache_()
+                generation = cache.shared_cache_generations.get(entity._root_)
+                if generation is None or entity._root_ in cache.shared_cache_modified: shared_cache = None
+            parse_row = entity._get_row_parser_(attr_offsets)
             for row in rows:
-                real_entity_subclass, pkval, avdict = entity._parse_row_(row, attr_offsets)
+                real_entity_subclass, pkval, avdict = parse_row(row)
                 obj = real_entity_subclass._new_(pkval, 'loaded')
                 if obj._status_ in ('deleted', 'cancelled'): continue
                 obj._db_set_(avdict)
                 objects.append(obj)
+                if shared_cache is not None:
+                    real_entity_subclass._store_in_shared_cache_(pkval, row, attr_offsets, generation)
         return objects
+    def _get_shared_cache_attrs_(entity):
+        attrs = entity.__dict__.get('_shared_cache_attrs_')
+        if attrs is None:
+            attrs = entity._shared_cache_attrs_ = [ attr for attr in entity._attrs_
+                if attr.columns and not attr.is_collection and not attr.lazy
+                   and not attr.is_discriminator and attr.pk_offset is None ]
+        return attrs
+    def _store_in_shared_cache_(entity, pkval, row, attr_offsets, generation):
+        raw_values = []
+        for attr in entity._get_shared_cache_attrs_():
+            offsets = attr_offsets.get(attr)
+            if offsets is None: return
+            raw_values.append(tuple(row[offset] for offset in offsets))
+        entity._shared_cache_.set(pkval, (entity, tuple(raw_values)), generation=generation)
+    def _find_in_shared_cache_(entity, pkval):
+        item = entity._shared_cache_.get(pkval)
+        if item is None: return None
+        real_entity_subclass, raw_values = item
+        if not issubclass(real_entity_subclass, entity): return None
+        avdict = {}
+        for attr, vals in izip(real_entity_subclass._get_shared_cache_attrs_(), raw_values):
+            avdict[attr] = attr.parse_value(vals, range(len(vals)))
+        obj = real_entity_subclass._new_(pkval, 'loaded')
+        if obj._status_ in ('deleted', 'cancelled'): return None
+        obj._db_set_(avdict)
+        return obj
     def _parse_row_(entity, row, attr_offsets):
+        return entity._get_row_parser_(attr_offsets)(row)
+    def _get_row_parser_(entity, attr_offsets):
+        key = tuple(sorted((attr.id, tuple(offsets)) for attr, offsets in attr_offsets.iteritems()))
+        parser = entity._row_parsers_.get(key)
+        if parser is not None: return parser
         discr_attr = entity._discriminator_attr_
-        if not discr_attr: real_entity_subclass = entity
+        if not discr_attr: parser = generate_row_parser(entity, entity, attr_offsets)
         else:
             discr_offset = attr_offsets[discr_attr][0]
-            discr_value = discr_attr.check(row[discr_offset], None, entity, from_db=True)
-            real_entity_subclass = discr_attr.code2cls[discr_value]
-
-        avdict = {}
-        for attr in real_entity_subclass._attrs_:
-            offsets = attr_offsets.get(attr)
-            if offsets is None or attr.is_discriminator: continue
-            avdict[attr] = attr.parse_value(row, offsets)
-        if not entity._pk_is_composite_: pkval = avdict.pop(entity._pk_, None)
-        else: pkval = tuple(avdict.pop(attr, None) for attr in entity._pk_attrs_)
-        return real_entity_subclass, pkval, avdict
+            discr_check = discr_attr.check
+            code2cls = discr_attr.code2cls
+            subclass_parsers = {}
+            def parser(row):
+                discr_value = discr_check(row[discr_offset], None, entity, from_db=True)
+                real_entity_subclass = code2cls[discr_value]
+                subclass_parser = subclass_parsers.get(real_entity_subclass)
+                if subclass_parser is None:
+                    subclass_parser = subclass_parsers[real_entity_subclass] = \
+                        generate_row_parser(entity, real_entity_subclass, attr_offsets)
+                return subclass_parser(row)
+        entity._row_parsers_[key] = parser
+        return parser
     def _load_many_(entity, objects):
         database = entity._database_
         cache = database._get_cache()
@@ -2473,8 +2941,9 @@ class EntityMeta(type):
             obj.__class__ = entity
             return obj
         obj = object.__new__(entity)
-        obj._dbvals_ = {}
         obj._vals_ = {}
+        if cache.readonly: obj._dbvals_ = obj._vals_  # no snapshot of database values is needed
+        else: obj._dbvals_ = {}
         obj._cache_ = cache
         obj._status_ = status
         obj._pkval_ = pkval
@@ -2492,6 +2961,7 @@ class EntityMeta(type):
                 if attr.reverse: attr.db_update_reverse(obj, NOT_LOADED, val)
             seeds = cache.seeds.setdefault(entity._pk_, set())
             seeds.add(obj)
+            for attr in entity._lazy_attrs_: cache.lazy_seeds.setdefault(attr, set()).add(obj)
         elif status == 'created':
             assert undo_funcs is not None
             obj._rbits_ = obj._wbits_ = None
@@ -2500,6 +2970,164 @@ class EntityMeta(type):
                 if attr.reverse: attr.update_reverse(obj, NOT_LOADED, val, undo_funcs)
         else: assert False
         return obj
+    def _allocate_pkval_(entity):
+        root = entity._root_
+        blocks = entity._get_cache_().pk_blocks
+        block = blocks.get(root)
+        if block is None or block[0] == block[1]: block = blocks[root] = root._reserve_pk_block_()
+        pkval = block[0]
+        block[0] += 1
+        return pkval
+    def _reserve_pk_block_(entity):
+        database = entity._database_
+        provider = database.provider
+        if provider.autonomous_transactions:
+            connection = provider.connect()
+            try:
+                next_hi = entity._increment_next_hi_(connection)
+                provider.commit(connection)
+            except:
+                provider.drop(connection)
+                raise
+            provider.release(connection)
+        else:
+            cache = database._get_cache()
+            next_hi = entity._increment_next_hi_(cache.connection)
+            if cache.optimistic: provider.commit(cache.connection)
+        block_size = entity._pk_.hilo
+        start = (next_hi - 1) * block_size
+        return [ start, start + block_size ]
+    def _increment_next_hi_(entity, connection):
+        database = entity._database_
+        update_sql, select_sql, max_sql, (insert_sql, insert_adapter) = entity._get_hilo_sql_()
+        cursor = database._exec_sql(update_sql, connection=connection)
+        if select_sql is not None: cursor = database._exec_sql(select_sql, connection=connection)
+        rows = cursor.fetchall()
+        if len(rows) != 1: throw(MappingError, 'Table %s must contain exactly one row. Got: %d'
+                                               % (entity._hilo_table_, len(rows)))
+        return rows[0][0]
+    def _seed_hilo_table_(entity):
+        database = entity._database_
+        provider = database.provider
+        update_sql, select_sql, max_sql, (insert_sql, insert_adapter) = entity._get_hilo_sql_()
+        count_sql = database._ast2sql([ 'SELECT', [ 'AGGREGATES', [ 'COUNT', 'ALL' ] ],
+                                        [ 'FROM', [ None, 'TABLE', entity._hilo_table_ ] ] ])[0]
+        connection = provider.connect()
+        try:
+            if not database._exec_sql(count_sql, connection=connection).fetchone()[0]:
+                max_pkval = database._exec_sql(max_sql, connection=connection).fetchone()[0] or 0
+                try: database._exec_sql(insert_sql, insert_adapter([ max_pkval // entity._pk_.hilo + 1 ]), connection=connection)
+                except IntegrityError: provider.rollback(connection)
+                else: provider.commit(connection)
+        except:
+            provider.drop(connection)
+            raise
+        provider.release(connection)
+    def _get_hilo_sql_(entity):
+        cached_sql = entity._hilo_sql_
+        if cached_sql is not None: return cached_sql
+        table_name = entity._hilo_table_
+        column_ast = [ 'COLUMN', None, 'next_hi' ]
+        pk_column_ast = [ 'COLUMN', None, entity._pk_columns_[0] ]
+        ast2sql = entity._database_._ast2sql
+        pairs = [ ('next_hi', [ 'ADD', column_ast, [ 'VALUE', 1 ] ]) ]
+        if entity._database_.provider.update_returning:
+            update_sql = ast2sql([ 'UPDATE', table_name, pairs, None, 'next_hi' ])[0]
+            select_sql = None
+        else:
+            update_sql = ast2sql([ 'UPDATE', table_name, pairs ])[0]
+            select_sql = ast2sql([ 'SELECT', [ 'ALL', column_ast ], [ 'FROM', [ None, 'TABLE', table_name ] ] ])[0]
+        cached_sql = entity._hilo_sql_ = (
+            update_sql, select_sql,
+            ast2sql([ 'SELECT', [ 'AGGREGATES', [ 'MAX', pk_column_ast ] ], [ 'FROM', [ None, 'TABLE', entity._table_ ] ] ])[0],
+            ast2sql([ 'INSERT', table_name, [ 'next_hi' ], [ [ 'PARAM', 0, entity._pk_.converters[0] ] ] ]))
+        return cached_sql
+    @cut_traceback
+    def create_many(entity, rows):
+        if entity._database_.schema is None:
+            throw(ERDiagramError, 'Mapping is not generated for entity %r' % entity.__name__)
+        cache = entity._get_cache_()
+        if cache.readonly: throw(ReadOnlyError, 'Cannot create %s: transaction is read-only' % entity.__name__)
+        normalized = [ entity._normalize_args_(kwargs, True) for kwargs in rows ]
+        if not normalized: return []
+        if entity._root_._hilo_table_ is not None:
+            pk_attr = entity._pk_
+            for i, (pkval, avdict) in enumerate(normalized):
+                if pkval is not None: continue
+                pkval = avdict[pk_attr] = entity._allocate_pkval_()
+                normalized[i] = pkval, avdict
+        indexes = cache.indexes
+        pk_index = indexes.setdefault(entity._pk_, {})
+        pkvals = [ pkval for pkval, avdict in normalized if pkval is not None ]
+        if len(set(pkvals)) != len(pkvals) or any(imap(pk_index.__contains__, pkvals)):
+            seen = set()
+            for pkval in pkvals:
+                if pkval in pk_index or pkval in seen:
+                    if entity._pk_is_composite_: pkval = ', '.join(str(item) for item in pkval)
+                    throw(CacheIndexError, 'Cannot create %s: instance with primary key %s already exists'
+                                           % (entity.__name__, pkval))
+                seen.add(pkval)
+        key_vals = []
+        for attr in entity._simple_keys_:
+            vals = [ avdict[attr] for pkval, avdict in normalized ]
+            index = indexes.setdefault(attr, {})
+            if len(set(vals)) != len(vals) or any(imap(index.__contains__, vals)):
+                seen = set()
+                for val in vals:
+                    if val in index or val in seen: throw(CacheIndexError,
+                        'Cannot create %s: value %s for key %s already exists' % (entity.__name__, val, attr.name))
+                    seen.add(val)
+            key_vals.append((index, vals))
+        for attrs in entity._composite_keys_:
+            vals = [ tuple(map(avdict.__getitem__, attrs)) for pkval, avdict in normalized ]
+            index = indexes.setdefault(attrs, {})
+            if len(set(vals)) != len(vals) or any(imap(index.__contains__, vals)):
+                seen = set()
+                for val in vals:
+                    if val in index or val in seen:
+                        attr_names = ', '.join(attr.name for attr in attrs)
+                        throw(CacheIndexError, 'Cannot create %s: value %s for composite key (%s) already exists'
+                                               % (entity.__name__, val, attr_names))
+                    seen.add(val)
+            key_vals.append((index, vals))
+        undo_funcs = []
+        objects = []
+        reverse_items = {}
+        try:
+            for pkval, avdict in normalized:
+                obj = object.__new__(entity)
+                obj._dbvals_ = {}
+                obj._vals_ = vals = {}
+                obj._cache_ = cache
+                obj._status_ = 'created'
+                obj._pkval_ = pkval
+                obj._rbits_ = obj._wbits_ = None
+                if pkval is not None:
+                    pk_index[pkval] = obj
+                    obj._newid_ = None
+                else: obj._newid_ = next_new_instance_id()
+                objects.append(obj)
+                for attr, val in avdict.iteritems():
+                    if not attr.is_collection:
+                        vals[attr.name] = val
+                        if val is None or not attr.reverse: pass
+                        elif isinstance(attr.reverse, Set):
+                            reverse_items.setdefault((attr.reverse, val), []).append(obj)
+                        else: attr.update_reverse(obj, None, val, undo_funcs)
+                    elif not val:
+                        setdata = vals[attr.name] = SetData()
+                        setdata.is_fully_loaded = True
+                    else: attr.__set__(obj, val, undo_funcs)
+            for (reverse, val), items in reverse_items.iteritems(): reverse.reverse_add_new(val, items, undo_funcs)
+        except:
+            for undo_func in reversed(undo_funcs): undo_func()
+            for obj in objects:
+                if obj._pkval_ is not None: pk_index.pop(obj._pkval_, None)
+            raise
+        for index, vals in key_vals: index.update(izip(vals, objects))
+        cache.created.update(objects)
+        cache.to_be_checked.extend(objects)
+        return objects
     def _get_by_raw_pkval_(entity, raw_pkval):
         i = 0
         pkval = []
@@ -2585,6 +3213,73 @@ def populate_criteria_list(criteria_list, columns, converters, params_count=0, t
         params_count += 1
     return params_count
 
+def generate_row_parser(entity, real_entity_subclass, attr_offsets):
+    namespace = { 'entity' : real_entity_subclass }
+    lines = [ 'def parse_row(row):' ]
+    value_names = {}
+    for attr in real_entity_subclass._attrs_:
+        offsets = attr_offsets.get(attr)
+        if offsets is None or attr.is_discriminator: continue
+        assert len(attr.columns) == len(offsets)
+        id = attr.id
+        name = value_names[attr] = 'value%d' % id
+        namespace['attr%d' % id] = attr
+        namespace['owner%d' % id] = attr.entity
+        if attr.reverse:
+            namespace['get_by_raw_pkval%d' % id] = attr.py_type._get_by_raw_pkval_
+            if len(offsets) == 1:
+                lines.append('    %s = row[%d]' % (name, offsets[0]))
+                lines.append('    if %s is not None: %s = get_by_raw_pkval%d((%s,))' % (name, name, id, name))
+            else:
+                lines.append('    %s = (%s)' % (name, ''.join('row[%d], ' % offset for offset in offsets)))
+                lines.append('    if None in %s: %s = None' % (name, name))
+                lines.append('    else: %s = get_by_raw_pkval%d(%s)' % (name, id, name))
+            continue
+        if len(offsets) > 1: throw(NotImplementedError)
+        namespace['check%d' % id] = attr.check
+        lines.append('    %s = row[%d]' % (name, offsets[0]))
+        check_func = attr.__class__.check.im_func
+        converters = attr.converters
+        if len(converters) != 1 or converters[0] is None \
+           or check_func not in (Attribute.check.im_func, Required.check.im_func):
+            lines.append('    %s = check%d(%s, None, owner%d, True)' % (name, id, name, id))
+            continue
+        # inlined equivalent of attr.check(value, None, attr.entity, from_db=True)
+        namespace['sql2py%d' % id] = converters[0].sql2py
+        if check_func is Attribute.check.im_func: lines.append('    if %s is not None:' % name)
+        else:
+            lines.append('    if %s is None: %s = check%d(%s, None, owner%d, True)' % (name, name, id, name, id))
+            lines.append('    else:')
+        lines.append('        try: %s = sql2py%d(%s)' % (name, id, name))
+        lines.append('        except UnicodeDecodeError: %s = check%d(%s, None, owner%d, True)' % (name, id, name, id))
+        if check_func is Required.check.im_func and attr.is_string:
+            lines.append("        if %s == '': %s = check%d(row[%d], None, owner%d, True)"
+                         % (name, name, id, offsets[0], id))
+    pk_names = [ value_names.get(attr, 'None') for attr in entity._pk_attrs_ ]
+    if entity._pk_is_composite_: lines.append('    pkval = (%s)' % ''.join('%s, ' % name for name in pk_names))
+    else: lines.append('    pkval = %s' % pk_names[0])
+    items = [ 'attr%d: %s' % (attr.id, name) for attr, name in value_names.iteritems() if attr.pk_offset is None ]
+    lines.append('    return entity, pkval, {%s}' % ', '.join(items))
+    exec '\n'.join(lines) in namespace
+    return namespace['parse_row']
+
+def construct_batch_criteria_list(batch_size, columns, converters, row_value_syntax):
+    if batch_size == 1:
+        return [ [ 'EQ', [ 'COLUMN', None, column ], [ 'PARAM', (0, i), converter ] ]
+                 for i, (column, converter) in enumerate(izip(columns, converters)) ]
+    if len(columns) == 1:
+        converter = converters[0]
+        return [ [ 'IN', [ 'COLUMN', None, columns[0] ],
+                    [ [ 'PARAM', (i, 0), converter ] for i in xrange(batch_size) ] ] ]
+    if row_value_syntax:
+        return [ [ 'IN', [ 'ROW' ] + [ [ 'COLUMN', None, column ] for column in columns ],
+                    [ [ 'ROW' ] + [ [ 'PARAM', (i, j), converter ] for j, converter in enumerate(converters) ]
+                      for i in xrange(batch_size) ] ] ]
+    pairs = zip(columns, converters)
+    return [ [ 'OR' ] + [ [ 'AND' ] + [ [ 'EQ', [ 'COLUMN', None, column ], [ 'PARAM', (i, j), converter ] ]
+                                        for j, (column, converter) in enumerate(pairs) ]
+                          for i in xrange(batch_size) ] ]
+
 class Entity(object):
     __metaclass__ = EntityMeta
     __slots__ = '_cache_', '_status_', '_pkval_', '_newid_', '_dbvals_', '_vals_', '_rbits_', '_wbits_', '__weakref__'
@@ -2595,9 +3290,12 @@ class Entity(object):
         if entity._database_.schema is None:
             throw(ERDiagramError, 'Mapping is not generated for entity %r' % entity.__name__)
 
+        cache = entity._get_cache_()
+        if cache.readonly: throw(ReadOnlyError, 'Cannot create %s: transaction is read-only' % entity.__name__)
         pkval, avdict = entity._normalize_args_(kwargs, True)
+        if pkval is None and entity._root_._hilo_table_ is not None:
+            pkval = avdict[entity._pk_] = entity._allocate_pkval_()
         undo_funcs = []
-        cache = entity._get_cache_()
         indexes = {}
         for attr in entity._simple_keys_:
             val = avdict[attr]
@@ -2654,6 +3352,7 @@ class Entity(object):
         database = entity._database_
         if cache is not database._get_cache():
             throw(TransactionError, "Object %s doesn't belong to current transaction" % obj)
+        if entity._shared_cache_ is not None and entity._find_in_shared_cache_(obj._pkval_) is obj: return
         seeds = cache.seeds[entity._pk_]
         max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
         objects = [ obj ]
@@ -2815,12 +3514,14 @@ class Entity(object):
     @cut_traceback
     def delete(obj):
         if not obj._cache_.is_alive: throw(TransactionRolledBack, 'Object belongs to obsolete cache')
+        if obj._cache_.readonly: throw(ReadOnlyError, 'Cannot delete %s: transaction is read-only' % obj)
         if obj._status_ in ('deleted', 'cancelled'): throw(OperationWithDeletedObjectError, '%s was deleted' % obj)
         obj._delete_()
     @cut_traceback
     def set(obj, **kwargs):
         cache = obj._cache_
         if not cache.is_alive: throw(TransactionRolledBack, 'Object belongs to obsolete cache')
+        if cache.readonly: throw(ReadOnlyError, 'Cannot modify %s: transaction is read-only' % obj)
         if obj._status_ in ('deleted', 'cancelled'): throw(OperationWithDeletedObjectError, '%s was deleted' % obj)
         avdict, collection_avdict = obj._keyargs_to_avdicts_(kwargs)
         status = obj._status_
@@ -2902,6 +3603,7 @@ class Entity(object):
                 if attr.pk_offset is not None:
                     old_val = obj._vals_.get(attr.name, NOT_LOADED)
                     if old_val != new_val: throw(TypeError, 'Cannot change value of primary key attribute %s' % attr.name)
+                elif isinstance(attr, Version): throw(TypeError, 'Cannot assign value to version attribute %s' % attr)
                 else: avdict[attr] = new_val
             else: collection_avdict[attr] = new_val
         return avdict, collection_avdict
@@ -2940,52 +3642,38 @@ class Entity(object):
                 assert val._status_ == 'saved'
     def _save_created_(obj):
         values = []
+        principals = []
         auto_pk = (obj._pkval_ is None)
         if auto_pk: pk_attr = obj.__class__._pk_
+        database = obj._database_
+        cache = obj._cache_
         for attr in obj._attrs_:
             if not attr.columns: continue
             if attr.is_collection: continue
             val = obj._vals_[attr.name]
             if auto_pk and attr.is_pk: continue
+            if attr.reverse and val is not None:
+                if val._pkval_ is None: cache.flush_batches()  # val waits for its id in INSERT ... RETURNING batch
+                principals.append(val)
             values.extend(attr.get_raw_values(val))
-        database = obj._database_
-        if auto_pk: cached_sql = obj._cached_create_sql_auto_pk_
-        else: cached_sql = obj._cached_create_sql_
-        if cached_sql is None:
-            entity = obj.__class__
-            if auto_pk:
-                columns = entity._columns_without_pk_
-                converters = entity._converters_without_pk_
-            else:
-                columns = entity._columns_
-                converters = entity._converters_
-            assert len(columns) == len(converters)
-            params = [ [ 'PARAM', i,  converter ] for i, converter in enumerate(converters) ]
-            sql_ast = [ 'INSERT', entity._table_, columns, params ]
-            if auto_pk:
-                assert len(entity._pk_columns_) == 1
-                assert pk_attr.auto
-                sql_ast.append(obj._pk_columns_[0])
-            sql, adapter = database._ast2sql(sql_ast)
-            if auto_pk: entity._cached_create_sql_auto_pk_ = sql, adapter
-            else: entity._cached_create_sql_ = sql, adapter
-        else: sql, adapter = cached_sql
-        arguments = adapter(values)
-        try:
-            if auto_pk: new_id = database._exec_sql_returning_id(sql, arguments)
-            else: database._exec_sql(sql, arguments)
-        except IntegrityError, e:
-            msg = " ".join(tostring(arg) for arg in e.args)
-            throw(TransactionIntegrityError,
-                  'Object %r cannot be stored in the database (probably it already exists). %s: %s'
-                  % (obj, e.__class__.__name__, msg), e)
-        except DatabaseError, e:
-            msg = " ".join(tostring(arg) for arg in e.args)
-            throw(UnexpectedError, 'Object %r cannot be stored in the database. %s: %s'
-                                   % (obj, e.__class__.__name__, msg), e)
-
-        if auto_pk:
-            index = obj._cache_.indexes.setdefault(pk_attr, {})
+        sql, adapter = obj.__class__._construct_create_sql_(auto_pk)
+        if not auto_pk: cache.add_to_batch('INSERT', sql, obj, adapter(values), principals)
+        elif values and database.provider.multirow_insert_returning:
+            cache.add_to_batch('INSERT_RETURNING', sql, obj, tuple(values), principals)
+        else:
+            arguments = adapter(values)
+            cache.flush_batches()
+            try: new_id = database._exec_sql_returning_id(sql, arguments)
+            except IntegrityError, e:
+                msg = " ".join(tostring(arg) for arg in e.args)
+                throw(TransactionIntegrityError,
+                      'Object %r cannot be stored in the database (probably it already exists). %s: %s'
+                      % (obj, e.__class__.__name__, msg), e)
+            except DatabaseError, e:
+                msg = " ".join(tostring(arg) for arg in e.args)
+                throw(UnexpectedError, 'Object %r cannot be stored in the database. %s: %s'
+                                       % (obj, e.__class__.__name__, msg), e)
+            index = cache.indexes.setdefault(pk_attr, {})
             obj2 = index.setdefault(new_id, obj)
             if obj2 is not obj: throw(TransactionIntegrityError,
                 'Newly auto-generated id value %s was already used in transaction cache for another object' % new_id)
@@ -3002,18 +3690,35 @@ class Entity(object):
     def _save_updated_(obj):
         update_columns = []
         values = []
+        update_attrs = []
         for attr in obj._attrs_with_bit_(obj._wbits_):
             if not attr.columns: continue
+            update_attrs.append(attr)
             update_columns.extend(attr.columns)
             val = obj._vals_[attr.name]
+            if attr.reverse and val is not None and val._pkval_ is None: obj._cache_.flush_batches()
             values.extend(attr.get_raw_values(val))
         if update_columns:
+            version_attr = obj.__class__._version_attr_
+            if version_attr is not None:
+                version = obj._dbvals_.get(version_attr.name, NOT_LOADED)
+                if version is NOT_LOADED:
+                    obj._load_()
+                    version = obj._dbvals_[version_attr.name]
+                update_attrs.append(version_attr)
+                update_columns.append(version_attr.column)
+                values.append(version + 1)
+                obj._vals_[version_attr.name] = version + 1
             for attr in obj._pk_attrs_:
                 val = obj._vals_[attr.name]
                 values.extend(attr.get_raw_values(val))
             optimistic_check_columns = []
             optimistic_check_converters = []
-            if obj._cache_.optimistic:
+            if version_attr is not None:
+                optimistic_check_columns.append(version_attr.column)
+                optimistic_check_converters.append(version_attr.converters[0])
+                values.append(version)
+            elif obj._cache_.optimistic:
                 for attr in obj._attrs_with_bit_(obj._rbits_):
                     if not attr.columns: continue
                     dbval = obj._dbvals_.get(attr.name, NOT_LOADED)
@@ -3032,6 +3737,7 @@ class Entity(object):
                 for attr in obj._attrs_with_bit_(obj._wbits_):
                     if not attr.columns: continue
                     update_converters.extend(attr.converters)
+                if version_attr is not None: update_converters.append(version_attr.converters[0])
                 assert len(update_columns) == len(update_converters)
                 update_params = [ [ 'PARAM', i, converter ] for i, converter in enumerate(update_converters) ]
                 params_count = len(update_params)
@@ -3045,9 +3751,8 @@ class Entity(object):
                 obj._update_sql_cache_[query_key] = sql, adapter
             else: sql, adapter = cached_sql
             arguments = adapter(values)
-            cursor = database._exec_sql(sql, arguments)
-            if cursor.rowcount != 1:
-                throw(UnrepeatableReadError, 'Object %r was updated outside of current transaction' % obj)
+            batch = obj._cache_.add_to_batch('UPDATE', sql, obj, arguments)
+            if batch.attrs is None: batch.attrs = tuple(update_attrs)
         obj._status_ = 'saved'
         obj._rbits_ |= obj._wbits_
         obj._wbits_ = 0
@@ -3060,54 +3765,38 @@ class Entity(object):
         if not obj._cache_.optimistic:
             obj._status_ = 'loaded'
             return
-        values = []
-        for attr in obj._pk_attrs_:
-            val = obj._vals_[attr.name]
-            values.extend(attr.get_raw_values(val))
-        optimistic_check_columns = []
-        optimistic_check_converters = []
-        for attr in obj._attrs_with_bit_(obj._rbits_):
-            if not attr.columns: continue
+        values = list(obj._get_raw_pkval_())
+        attrs = []
+        null_mask = []
+        version_attr = obj.__class__._version_attr_
+        if version_attr is not None and version_attr.name in obj._dbvals_: check_attrs = [ version_attr ]
+        else: check_attrs = [ attr for attr in obj._attrs_with_bit_(obj._rbits_) if attr.columns ]
+        for attr in check_attrs:
             dbval = obj._dbvals_.get(attr.name, NOT_LOADED)
             assert dbval is not NOT_LOADED
-            optimistic_check_columns.extend(attr.columns)
-            optimistic_check_converters.extend(attr.converters)
-            values.extend(attr.get_raw_values(dbval))
-        query_key = tuple(optimistic_check_columns)
-        database = obj._database_
-        cached_sql = obj._lock_sql_cache_.get(query_key)
-        if cached_sql is None:
-            where_list = [ 'WHERE' ]
-            params_count = populate_criteria_list(where_list, obj._pk_columns_, obj._pk_converters_)
-            populate_criteria_list(where_list, optimistic_check_columns, optimistic_check_converters, params_count)
-            sql_ast = [ 'SELECT', [ 'ALL', [ 'VALUE', 1 ]], [ 'FROM', [ None, 'TABLE', obj._table_ ] ], where_list ]
-            sql, adapter = database._ast2sql(sql_ast)
-            obj._lock_sql_cache_[query_key] = sql, adapter
-        else: sql, adapter = cached_sql
-        arguments = adapter(values)
-        cursor = database._exec_sql(sql, arguments)
-        row = cursor.fetchone()
-        if row is None: throw(UnrepeatableReadError, 'Object %r was updated outside of current transaction' % obj)
-        obj._status_ = 'loaded'
+            attrs.append(attr)
+            for raw_value in attr.get_raw_values(dbval):
+                null_mask.append(raw_value is None)
+                if raw_value is not None: values.append(raw_value)
+        key = obj.__class__, tuple(attrs), tuple(null_mask)
+        obj._cache_.optimistic_checks.setdefault(key, []).append((obj, tuple(values)))
     def _save_deleted_(obj):
-        database = obj._database_
-        cached_sql = obj._cached_delete_sql_
-        if cached_sql is None:
-            where_list = [ 'WHERE' ]
-            populate_criteria_list(where_list, obj._pk_columns_, obj._pk_converters_)
-            sql_ast = [ 'DELETE', obj._table_, where_list ]
-            sql, adapter = database._ast2sql(sql_ast)
-            obj.__class__._cached_delete_sql_ = sql, adapter
-        else: sql, adapter = cached_sql
+        sql, adapter = obj.__class__._construct_delete_sql_()
         values = obj._get_raw_pkval_()
         arguments = adapter(values)
-        database._exec_sql(sql, arguments)
+        principals = []
+        for attr in obj._attrs_:
+            if not attr.reverse or attr.is_collection: continue
+            val = obj._dbvals_.get(attr.name)
+            if val is not None: principals.append(val)
+        obj._cache_.add_to_batch('DELETE', sql, obj, arguments, principals)
     def _save_(obj, dependent_objects=None):
         assert obj._cache_.is_alive
         status = obj._status_
         if status in ('loaded', 'saved', 'cancelled'): return
         if status in ('created', 'updated'):
             obj._save_principal_objects_(dependent_objects)
+        if status != 'locked' and obj._shared_cache_ is not None: obj._cache_.invalidate_shared_cache(obj)
 
         if status == 'created': obj._save_created_()
         elif status == 'updated': obj._save_updated_()
@@ -3115,6 +3804,21 @@ class Entity(object):
         elif status == 'locked': obj._save_locked_()
         else: assert False
 
+def batch_repr(objects, limit=5):
+    result = ', '.join(repr(obj) for obj in objects[:limit])
+    if len(objects) > limit: result += ', ... (%d objects total)' % len(objects)
+    return result
+
+class SaveBatch(object):
+    __slots__ = 'kind', 'sql', 'table', 'objects', 'arguments_list', 'attrs'
+    def __init__(batch, kind, sql, table):
+        batch.kind = kind
+        batch.sql = sql
+        batch.table = table
+        batch.objects = []
+        batch.arguments_list = []
+        batch.attrs = None  # attributes assigned by UPDATE batch
+
 class Cache(object):
     def __init__(cache, database, connection):
         cache.is_alive = True
@@ -3122,9 +3826,12 @@ class Cache(object):
         cache.connection = connection
         cache.num = next_num()
         cache.optimistic = database.optimistic
+        cache.readonly = local.readonly
         cache.ignore_none = True  # todo : get from provider
         cache.indexes = {}
+        cache.streaming = False
         cache.seeds = {}
+        cache.lazy_seeds = {}  # lazy attribute -> set of loaded objects for which the attribute is not loaded yet
         cache.collection_statistics = {}
         cache.created = set()
         cache.deleted = []
@@ -3132,12 +3839,23 @@ class Cache(object):
         cache.modified_collections = {}
         cache.to_be_checked = []
         cache.query_results = {}
+        cache.batches = []
+        cache.batched_objects = {}
+        cache.batch_barriers = {}
+        cache.optimistic_checks = {}
+        cache.shared_cache_modified = set()
+        cache.shared_cache_evicted = set()
+        cache.shared_cache_cleared = set()
+        cache.save_shared_cache_generations()
+        cache.pk_blocks = {}
+        cache.modified_tables = set()
     def flush(cache):
         assert cache.is_alive
         cache.query_results.clear()
         cache.save(False)
     def commit(cache):
         assert cache.is_alive
+        if cache.readonly: return
         database = cache.database
         provider = database.provider
         connection = cache.connection
@@ -3160,6 +3878,15 @@ class Cache(object):
         except:
             cache.rollback()
             raise
+        for entity, pkval in cache.shared_cache_evicted: entity._shared_cache_.pop(pkval)
+        cache.shared_cache_evicted.clear()
+        for entity in cache.shared_cache_cleared: entity._shared_cache_.clear()
+        cache.shared_cache_cleared.clear()
+        cache.shared_cache_modified.clear()
+        cache.save_shared_cache_generations()
+        if cache.modified_tables:
+            database.query_cache.invalidate(cache.modified_tables)
+            cache.modified_tables.clear()
     def rollback(cache, close_connection=False):
         assert cache.is_alive
         database = cache.database
@@ -3191,17 +3918,62 @@ class Cache(object):
         cache.connection = None
         if debug: log_orm('RELEASE_CONNECTION')
         provider.release(connection)
+    def save_shared_cache_generations(cache):
+        # rows read after this point may be stored in shared caches only if no invalidation happened meanwhile
+        cache.shared_cache_generations = dict((entity, entity._shared_cache_.generation)
+                                              for entity in cache.database.shared_cache_entities)
+    def invalidate_shared_cache(cache, obj):
+        entity = obj._root_
+        cache.shared_cache_modified.add(entity)
+        pkval = obj._pkval_
+        if pkval is None: return
+        entity._shared_cache_.pop(pkval)
+        cache.shared_cache_evicted.add((entity, pkval))
+    def clear_shared_cache(cache, entity):
+        entity = entity._root_
+        cache.shared_cache_modified.add(entity)
+        entity._shared_cache_.clear()
+        cache.shared_cache_cleared.add(entity)
+    def evict(cache, obj):
+        if obj._status_ not in ('loaded', 'saved'): return False
+        indexes = cache.indexes
+        entity = obj.__class__
+        pkval = obj._pkval_
+        index = indexes.get(entity._pk_)
+        if index is not None and index.get(pkval) is obj: del index[pkval]
+        get_val = obj._vals_.get
+        for attr in obj._simple_keys_:
+            val = get_val(attr.name)
+            index = indexes.get(attr)
+            if index is not None and val is not None and index.get(val) is obj: del index[val]
+        for attrs in obj._composite_keys_:
+            vals = tuple(get_val(attr.name) for attr in attrs)
+            index = indexes.get(attrs)
+            if index is not None and index.get(vals) is obj: del index[vals]
+        seeds = cache.seeds.get(entity._pk_)
+        if seeds: seeds.discard(obj)
+        for attr in entity._lazy_attrs_:
+            lazy_seeds = cache.lazy_seeds.get(attr)
+            if lazy_seeds: lazy_seeds.discard(obj)
+        return True
     def has_anything_to_save(cache):
         return bool(cache.created or cache.updated or cache.deleted or cache.modified_collections)
     def save(cache, optimistic=True):
         cache.optimistic = optimistic
         if not cache.has_anything_to_save(): return
         modified_m2m = cache.calc_modified_m2m()
+        modified_tables = set(attr.table for attr in modified_m2m)
+        for obj in cache.to_be_checked:
+            if obj._status_ in ('created', 'updated', 'deleted'): modified_tables.add(obj._table_)
+        cache.modified_tables.update(modified_tables)
+        cache.database.query_cache.invalidate(modified_tables)
         for attr, (added, removed) in modified_m2m.iteritems():
             if not removed: continue
             attr.remove_m2m(removed)
         for obj in cache.to_be_checked:
             obj._save_()
+        cache.execute_optimistic_checks()
+        cache.flush_batches()
         for attr, (added, removed) in modified_m2m.iteritems():
             if not added: continue
             attr.add_m2m(added)
@@ -3218,6 +3990,172 @@ class Cache(object):
         cache.deleted[:] = []
         cache.modified_collections.clear()
         cache.to_be_checked[:] = []
+    def add_to_batch(cache, kind, sql, obj, arguments, principals=()):
+        batches = cache.batches
+        batched_objects = cache.batched_objects
+        batch_barriers = cache.batch_barriers
+        if kind == 'DELETE': start = batch_barriers.pop(obj, -1) + 1  # dependents must be deleted by earlier statement
+        else:
+            barrier = -1
+            for principal in principals:
+                i = batched_objects.get(principal, -1)
+                if i > barrier: barrier = i
+            start = _max(barrier, 0)
+        target = None
+        for i in xrange(len(batches) - 1, start - 1, -1):
+            batch = batches[i]
+            if batch.kind != kind: break
+            if batch.sql == sql: target = i; break
+            if kind != 'INSERT' and batch.table == obj._table_: break
+        if target is None:
+            target = len(batches)
+            batches.append(SaveBatch(kind, sql, obj._table_))
+        batch = batches[target]
+        batch.objects.append(obj)
+        batch.arguments_list.append(arguments)
+        batched_objects[obj] = target
+        if kind == 'DELETE':
+            for principal in principals:
+                if batch_barriers.get(principal, -1) < target: batch_barriers[principal] = target
+        return batch
+    def flush_batches(cache):
+        batches = cache.batches
+        if not batches: return
+        cache.batches = []
+        cache.batched_objects.clear()
+        cache.batch_barriers.clear()
+        for batch in batches:
+            if batch.kind == 'INSERT': cache.execute_insert_batch(batch)
+            elif batch.kind == 'INSERT_RETURNING': cache.execute_insert_returning_batch(batch)
+            elif batch.kind == 'UPDATE': cache.execute_update_batch(batch)
+            elif batch.kind == 'DELETE': cache.execute_delete_batch(batch)
+            else: assert False
+    def execute_insert_batch(cache, batch):
+        database = cache.database
+        objects = batch.objects
+        try:
+            if len(objects) == 1: database._exec_sql(batch.sql, batch.arguments_list[0])
+            else: database._exec_sql_many(batch.sql, batch.arguments_list)
+        except IntegrityError, e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            if len(objects) == 1: throw(TransactionIntegrityError,
+                'Object %r cannot be stored in the database (probably it already exists). %s: %s'
+                % (objects[0], e.__class__.__name__, msg), e)
+            throw(TransactionIntegrityError,
+                'Objects %s cannot be stored in the database (probably one of them already exists). %s: %s'
+                % (batch_repr(objects), e.__class__.__name__, msg), e)
+        except DatabaseError, e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            if len(objects) == 1: throw(UnexpectedError,
+                'Object %r cannot be stored in the database. %s: %s'
+                % (objects[0], e.__class__.__name__, msg), e)
+            throw(UnexpectedError, 'Objects %s cannot be stored in the database. %s: %s'
+                                   % (batch_repr(objects), e.__class__.__name__, msg), e)
+    def execute_insert_returning_batch(cache, batch):
+        database = cache.database
+        objects = batch.objects
+        entity = objects[0].__class__
+        pk_attr = entity._pk_
+        index = cache.indexes.setdefault(pk_attr, {})
+        if len(objects) == 1:
+            sql, adapter = entity._construct_create_sql_(True)
+            chunks = [ (sql, adapter(batch.arguments_list[0]), objects) ]
+        else:
+            chunk_size = _max(database.provider.max_params_count // len(entity._columns_without_pk_), 1)
+            chunks = []
+            for i in xrange(0, len(objects), chunk_size):
+                chunk = objects[i:i+chunk_size]
+                sql, adapter = entity._construct_batch_create_sql_(len(chunk))
+                chunks.append((sql, adapter(batch.arguments_list[i:i+chunk_size]), chunk))
+        for sql, arguments, chunk in chunks:
+            try:
+                if len(chunk) == 1: new_ids = [ database._exec_sql_returning_id(sql, arguments) ]
+                else: new_ids = sorted(row[0] for row in database._exec_sql(sql, arguments).fetchall())
+            except IntegrityError, e:
+                msg = " ".join(tostring(arg) for arg in e.args)
+                throw(TransactionIntegrityError,
+                      'Objects %s cannot be stored in the database (probably one of them already exists). %s: %s'
+                      % (batch_repr(chunk), e.__class__.__name__, msg), e)
+            except DatabaseError, e:
+                msg = " ".join(tostring(arg) for arg in e.args)
+                throw(UnexpectedError, 'Objects %s cannot be stored in the database. %s: %s'
+                                       % (batch_repr(chunk), e.__class__.__name__, msg), e)
+            if len(new_ids) != len(chunk): throw(UnexpectedError,
+                'Expected %d generated ids for %s, got %d' % (len(chunk), batch_repr(chunk), len(new_ids)))
+            # auto-increment values are generated in the order of VALUES rows, while the order of rows
+            # returned by RETURNING is not guaranteed, so ids are matched to objects after sorting
+            for obj, new_id in izip(chunk, new_ids):
+                if type(new_id) is long: new_id = int(new_id)
+                obj2 = index.setdefault(new_id, obj)
+                if obj2 is not obj: throw(TransactionIntegrityError,
+                    'Newly auto-generated id value %s was already used in transaction cache for another object' % new_id)
+                obj._pkval_ = obj._vals_[pk_attr.name] = new_id
+                obj._newid_ = None
+    def execute_optimistic_checks(cache):
+        checks = cache.optimistic_checks
+        if not checks: return
+        cache.optimistic_checks = {}
+        for (entity, attrs, null_mask), items in checks.iteritems():
+            missing = cache.find_missing_objects(entity, attrs, null_mask, items)
+            if missing: throw(UnrepeatableReadError, 'Object %r was updated outside of current transaction' % missing[0])
+            for obj, values in items: obj._status_ = 'loaded'
+    def find_missing_objects(cache, entity, attrs, null_mask, items):
+        # items is a list of (obj, values) pairs, where values are raw pk values followed by non-null values of attrs
+        database = cache.database
+        params_per_object = len(entity._pk_columns_) + null_mask.count(False)
+        max_batch_size = _max(database.provider.max_params_count // params_per_object, 1)
+        missing = []
+        for i in xrange(0, len(items), max_batch_size):
+            chunk = items[i:i+max_batch_size]
+            sql, adapter = entity._construct_batch_lock_sql_(len(chunk), attrs, null_mask)
+            arguments = adapter(dict(enumerate(values for obj, values in chunk)))
+            cursor = database._exec_sql(sql, arguments)
+            found = set(entity._get_by_raw_pkval_(row) for row in cursor.fetchall())
+            missing.extend(obj for obj, values in chunk if obj not in found)
+        return missing
+    def find_stale_object(cache, batch):
+        entity = batch.objects[0]._root_
+        groups = {}
+        for obj in batch.objects:
+            values = list(obj._get_raw_pkval_())
+            null_mask = []
+            for attr in batch.attrs:
+                for value in attr.get_raw_values(obj._vals_[attr.name]):
+                    null_mask.append(value is None)
+                    if value is not None: values.append(value)
+            groups.setdefault(tuple(null_mask), []).append((obj, tuple(values)))
+        for null_mask, items in groups.iteritems():
+            missing = cache.find_missing_objects(entity, batch.attrs, null_mask, items)
+            if missing: return missing[0]
+        return None
+    def execute_update_batch(cache, batch):
+        database = cache.database
+        objects = batch.objects
+        if len(objects) > 1 and database.provider.executemany_reports_rowcount:
+            cursor = database._exec_sql_many(batch.sql, batch.arguments_list)
+            if cursor.rowcount == len(objects): return
+            obj = cache.find_stale_object(batch)
+            if obj is not None:
+                throw(UnrepeatableReadError, 'Object %r was updated outside of current transaction' % obj)
+            throw(UnrepeatableReadError,
+                'Some of objects %s were updated outside of current transaction' % batch_repr(objects))
+        for obj, arguments in izip(objects, batch.arguments_list):
+            cursor = database._exec_sql(batch.sql, arguments)
+            if cursor.rowcount != 1:
+                throw(UnrepeatableReadError, 'Object %r was updated outside of current transaction' % obj)
+    def execute_delete_batch(cache, batch):
+        database = cache.database
+        objects = batch.objects
+        if len(objects) == 1:
+            database._exec_sql(batch.sql, batch.arguments_list[0])
+            return
+        entity = objects[0].__class__
+        max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+        for i in xrange(0, len(objects), max_batch_size):
+            chunk = objects[i:i+max_batch_size]
+            sql, adapter = entity._construct_batch_delete_sql_(len(chunk))
+            arguments = adapter(dict(enumerate(chunk)))
+            database._exec_sql(sql, arguments)
     def calc_modified_m2m(cache):
         modified_m2m = {}
         for attr, objects in sorted(cache.modified_collections.iteritems(),
@@ -3350,7 +4288,9 @@ def _release():
     for cache in _get_caches(): cache.release()
     assert not local.db2cache
 
-def _with_transaction(func, args, kwargs, allowed_exceptions=[]):
+def _with_transaction(func, args, kwargs, allowed_exceptions=[], readonly=False):
+    prev_readonly = local.readonly
+    local.readonly = readonly
     try:
         try: result = func(*args, **kwargs)
         except Exception, e:
@@ -3368,15 +4308,17 @@ def _with_transaction(func, args, kwargs, allowed_exceptions=[]):
                 finally: del exc_info
         commit()
         return result
-    finally: _release()
+    finally:
+        local.readonly = prev_readonly
+        _release()
 
 @decorator_with_params
-def with_transaction(func, retry=1, retry_exceptions=[ TransactionError ], allowed_exceptions=[]):
+def with_transaction(func, retry=1, retry_exceptions=[ TransactionError ], allowed_exceptions=[], readonly=False):
     @cut_traceback
     def new_func(*args, **kwargs):
         counter = retry
         while counter > 0:
-            try: return _with_transaction(func, args, kwargs, allowed_exceptions)
+            try: return _with_transaction(func, args, kwargs, allowed_exceptions, readonly)
             except Exception, e:
                 for exc_class in retry_exceptions:
                     if isinstance(e, exc_class): break # for
@@ -3384,14 +4326,79 @@ def with_transaction(func, retry=1, retry_exceptions=[ TransactionError ], allow
             counter -= 1
     return new_func
 
-@simple_decorator
-def db_decorator(func, *args, **kwargs):
-    web = sys.modules.get('pony.web')
-    allowed_exceptions = web and [ web.HttpRedirect ] or []
-    try: return _with_transaction(func, args, kwargs, allowed_exceptions)
-    except (ObjectNotFound, RowNotFound):
-        if web: throw(web.Http404NotFound)
-        raise
+@decorator_with_params
+def db_decorator(func, readonly=False):
+    def new_func(*args, **kwargs):
+        web = sys.modules.get('pony.web')
+        allowed_exceptions = web and [ web.HttpRedirect ] or []
+        try: return _with_transaction(func, args, kwargs, allowed_exceptions, readonly)
+        except (ObjectNotFound, RowNotFound):
+            if web: throw(web.Http404NotFound)
+            raise
+    return new_func
+
+class AsyncResult(object):
+    def __init__(async_result):
+        async_result.event = Event()
+        async_result.value = None
+        async_result.exc_info = None
+    def done(async_result):
+        return async_result.event.isSet()
+    def wait(async_result, timeout=None):
+        async_result.event.wait(timeout)
+        return async_result.event.isSet()
+    def get(async_result, timeout=None):
+        if not async_result.wait(timeout): throw(TransactionError,
+            'Transaction was not completed in %s seconds' % timeout)
+        exc_info = async_result.exc_info
+        if exc_info is None: return async_result.value
+        try: raise exc_info[0], exc_info[1], exc_info[2]
+        finally: del exc_info
+
+class TransactionExecutor(object):
+    thread_name = 'TransactionExecutorThread-%d'
+    def __init__(executor, max_workers=4, readonly=False):
+        if max_workers < 1: throw(ValueError, 'max_workers must be positive number. Got: %r' % max_workers)
+        executor.readonly = readonly
+        executor.queue = Queue()
+        executor.workers = []
+        for i in xrange(max_workers):
+            worker = Thread(target=executor._work_, name=executor.thread_name % i)
+            worker.setDaemon(True)
+            worker.start()
+            executor.workers.append(worker)
+    def submit(executor, func, *args, **kwargs):
+        if not executor.workers: throw(TypeError, 'Cannot submit transaction: executor is shut down')
+        async_result = AsyncResult()
+        executor.queue.put((func, args, kwargs, async_result))
+        return async_result
+    def shutdown(executor, wait=True):
+        workers = executor.workers
+        executor.workers = []
+        for worker in workers: executor.queue.put(None)
+        if wait:
+            for worker in workers: worker.join()
+    def _work_(executor):
+        # each worker thread has its own local.db2cache, so every submitted function
+        # runs in a separate transaction with its own connection taken from the pool
+        while True:
+            task = executor.queue.get()
+            if task is None: break
+            func, args, kwargs, async_result = task
+            try: async_result.value = executor._run_(func, args, kwargs)
+            except: async_result.exc_info = sys.exc_info()
+            async_result.event.set()
+            del task, async_result
+    def _run_(executor, func, args, kwargs):
+        return _with_transaction(func, args, kwargs, readonly=executor.readonly)
+
+max_gather_workers = 4
+
+class QueryExecutor(TransactionExecutor):
+    thread_name = 'QueryExecutorThread-%d'
+    def _run_(executor, func, args, kwargs):
+        # Database.gather() workers execute plain SQL outside of any db_session
+        return func(*args, **kwargs)
 
 ###############################################################################
 
@@ -3495,6 +4502,14 @@ def extract_vars(extractors, globals, locals):
         vars[src] = value
     return vars, vartypes
 
+NOT_CACHED = object()
+
+def get_sql_ast_tables(sql_ast):
+    for item in sql_ast:
+        if type(item) is not list: continue
+        if len(item) >= 3 and item[1] == 'TABLE': yield item[2]
+        for table in get_sql_ast_tables(item): yield table
+
 class Query(object):
     def __init__(query, code_key, tree, globals, locals, left_join=False):
         assert isinstance(tree, ast.GenExprInner)
@@ -3510,6 +4525,9 @@ class Query(object):
             if node.src == '.0': throw(TypeError, 'Cannot iterate over non-entity object')
             else: throw(TypeError, 'Cannot iterate over non-entity object %s' % node.src)
         query._database = database = origin._database_
+        query._use_query_cache = False
+        query._query_cache_ttl = None
+        query._prefetch_attrs = ()
         if database is None: throw(TranslationError, 'Entity %s is not mapped to a database' % origin.__name__)
         if database.schema is None: throw(ERDiagramError, 'Mapping is not generated for entity %r' % origin.__name__)
         query._cache = database._get_cache()
@@ -3536,9 +4554,11 @@ class Query(object):
             sql_ast, attr_offsets = translator.construct_sql_ast(range, distinct, aggr_func_name)
             cache = database._get_cache()
             sql, adapter = database.provider.ast2sql(sql_ast)
-            cache_entry = sql, adapter, attr_offsets
+            tables = frozenset(get_sql_ast_tables(sql_ast))
+            cache_entry = sql, adapter, attr_offsets, tables
             database._constructed_sql_cache[sql_key] = cache_entry
-        else: sql, adapter, attr_offsets = cache_entry
+        else: sql, adapter, attr_offsets, tables = cache_entry
+        query._tables = tables
         arguments = adapter(query._vars)
         arguments_type = type(arguments)
         if arguments_type is tuple: arguments_key = arguments
@@ -3547,26 +4567,47 @@ class Query(object):
         except: query_key = None  # arguments are unhashable
         else: query_key = sql_key + (arguments_key)
         return sql, arguments, attr_offsets, query_key
+    def _get_shared_result(query, sql, query_key):
+        if not query._use_query_cache or query_key is None: return NOT_CACHED
+        if query._cache.modified_tables.intersection(query._tables): return NOT_CACHED
+        result = query._database.query_cache.get(query_key, NOT_CACHED)
+        if result is not NOT_CACHED:
+            stats = query._database.dblocal.stats
+            stat = stats.get(sql)
+            if stat is not None: stat.cache_count += 1
+            else: stats[sql] = QueryStat(sql)
+        return result
+    def _get_table_versions(query):
+        if not query._use_query_cache: return None
+        return query._database.query_cache.get_versions(query._tables)
+    def _set_shared_result(query, query_key, result, versions):
+        if not query._use_query_cache or query_key is None: return
+        if query._cache.modified_tables.intersection(query._tables): return
+        query._database.query_cache.set(query_key, result, query._tables, query._query_cache_ttl, versions)
+    @cut_traceback
+    def cached(query, ttl=None):
+        new_query = query._clone()
+        new_query._use_query_cache = True
+        new_query._query_cache_ttl = ttl
+        return new_query
     def _fetch(query, range=None, distinct=None):
-        translator = query._translator
         sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments(range, distinct)
+        return query._fetch_result(sql, arguments, attr_offsets, query_key)
+    def _fetch_result(query, sql, arguments, attr_offsets, query_key, rows=None):
+        translator = query._translator
         cache = query._cache
         try: result = cache.query_results[query_key]
         except KeyError:
-            cursor = query._database._exec_sql(sql, arguments)
-            if isinstance(translator.expr_type, EntityMeta):
-                entity = translator.expr_type
-                result = entity._fetch_objects(cursor, attr_offsets)
-            elif len(translator.row_layout) == 1:
-                func, slice_or_offset, src = translator.row_layout[0]
-                result = list(starmap(func, cursor.fetchall()))
-            else:
-                result = [ tuple(func(sql_row[slice_or_offset])
-                                 for func, slice_or_offset, src in translator.row_layout)
-                           for sql_row in cursor.fetchall() ]
-                for i, t in enumerate(translator.expr_type):
-                    if isinstance(t, EntityMeta) and t._discriminator_ and t._subclasses_:
-                        t._load_many_(row[i] for row in result)
+            entity = translator.expr_type
+            if not isinstance(entity, EntityMeta): entity = None
+            if rows is None: rows = query._get_shared_result(sql, query_key)
+            if rows is NOT_CACHED:
+                versions = query._get_table_versions()
+                cursor = query._database._exec_sql(sql, arguments)
+                if entity is not None: rows = entity._fetch_rows_(cursor)
+                else: rows = cursor.fetchall()
+                query._set_shared_result(query_key, rows, versions)
+            result = query._make_result(rows, attr_offsets)
             if query_key is not None:
                 query._cache.query_results[query_key] = result
         else:
@@ -3574,8 +4615,92 @@ class Query(object):
             stat = stats.get(sql)
             if stat is not None: stat.cache_count += 1
             else: stats[sql] = QueryStat(sql)
+        if query._prefetch_attrs: query._prefetch(result)
         return QueryResult(result, translator.expr_type, translator.row_layout)
     @cut_traceback
+    def prefetch(query, *args):
+        expr_type = query._translator.expr_type
+        attrs = list(query._prefetch_attrs)
+        for arg in args:
+            if isinstance(arg, basestring):
+                if not isinstance(expr_type, EntityMeta): throw(TypeError,
+                    'Attribute path %r can be used only in queries which return entity instances' % arg)
+                entity = expr_type
+                for name in arg.split('.'):
+                    if not isinstance(entity, EntityMeta): throw(TypeError,
+                        'Invalid attribute path %r: %s is not an entity' % (arg, entity))
+                    attr = entity._adict_.get(name)
+                    if attr is None: throw(AttributeError, 'Entity %s does not have attribute %s' % (entity.__name__, name))
+                    if attr not in attrs: attrs.append(attr)
+                    entity = attr.py_type
+            elif isinstance(arg, Attribute):
+                if arg not in attrs: attrs.append(arg)
+            else: throw(TypeError, 'Attribute or attribute path expected. Got: %r' % arg)
+        for attr in attrs:
+            if not attr.reverse: throw(TypeError, 'Attribute %s is not a relationship attribute' % attr)
+        new_query = query._clone()
+        new_query._prefetch_attrs = tuple(attrs)
+        return new_query
+    def _prefetch(query, result):
+        expr_type = query._translator.expr_type
+        if isinstance(expr_type, EntityMeta): objects = set(result)
+        elif type(expr_type) is tuple:
+            positions = [ i for i, t in enumerate(expr_type) if isinstance(t, EntityMeta) ]
+            objects = set(row[i] for row in result for i in positions if row[i] is not None)
+        else: return
+        for attr in query._prefetch_attrs:
+            entity = attr.entity
+            targets = [ obj for obj in objects if isinstance(obj, entity) ]
+            if targets: objects.update(attr.prefetch(targets))
+    def _make_result(query, rows, attr_offsets):
+        translator = query._translator
+        expr_type = translator.expr_type
+        if isinstance(expr_type, EntityMeta): return expr_type._make_objects_(rows, attr_offsets)
+        if len(translator.row_layout) == 1:
+            func, slice_or_offset, src = translator.row_layout[0]
+            return list(starmap(func, rows))
+        result = map(translator.row_factory, rows)
+        for i, t in enumerate(expr_type):
+            if isinstance(t, EntityMeta) and t._discriminator_ and t._subclasses_:
+                t._load_many_(row[i] for row in result)
+        return result
+    @cut_traceback
+    def iter_chunks(query, size=1000, evict=False):
+        if size < 1: throw(ValueError, 'Chunk size must be positive number. Got: %r' % size)
+        sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments()
+        return query._iter_chunks(sql, arguments, attr_offsets, size, evict)
+    def _iter_chunks(query, sql, arguments, attr_offsets, size, evict):
+        database = query._database
+        cursor = database._exec_sql(sql, arguments, streaming=True, arraysize=size)
+        cache = query._cache
+        cache.streaming = database.provider.streaming_blocks_connection
+        try:
+            for chunk in query._iter_cursor_chunks(cursor, attr_offsets, size, evict): yield chunk
+        finally:
+            try: cursor.close()
+            finally: cache.streaming = False
+    def _iter_cursor_chunks(query, cursor, attr_offsets, size, evict):
+        expr_type = query._translator.expr_type
+        if not evict: entity_positions = None
+        elif isinstance(expr_type, EntityMeta): entity_positions = ()
+        elif type(expr_type) is tuple:
+            entity_positions = [ i for i, t in enumerate(expr_type) if isinstance(t, EntityMeta) ]
+        else: entity_positions = None
+        cache = query._cache
+        chunk = None
+        while True:
+            if chunk and entity_positions is not None:
+                if not entity_positions:
+                    for obj in chunk: cache.evict(obj)
+                else:
+                    for row in chunk:
+                        for i in entity_positions:
+                            if row[i] is not None: cache.evict(row[i])
+            rows = cursor.fetchmany(size)
+            if not rows: break
+            chunk = query._make_result(rows, attr_offsets)
+            yield chunk
+    @cut_traceback
     def show(query, width=None):
         query._fetch().show(width)
     @cut_traceback
@@ -3611,9 +4736,13 @@ class Query(object):
         cache = new_query._cache
         try: result = cache.query_results[query_key]
         except KeyError:
-            cursor = new_query._database._exec_sql(sql, arguments)
-            row = cursor.fetchone()
-            result = row is not None
+            result = new_query._get_shared_result(sql, query_key)
+            if result is NOT_CACHED:
+                versions = new_query._get_table_versions()
+                cursor = new_query._database._exec_sql(sql, arguments)
+                row = cursor.fetchone()
+                result = row is not None
+                new_query._set_shared_result(query_key, result, versions)
             if query_key is not None: cache.query_results[query_key] = result
         return result
     @cut_traceback
@@ -3793,18 +4922,22 @@ class Query(object):
         cache = query._cache
         try: result = cache.query_results[query_key]
         except KeyError:
-            cursor = query._database._exec_sql(sql, arguments)
-            row = cursor.fetchone()
-            if row is not None: result = row[0]
-            else: result = None
-            if result is None and aggr_func_name == 'SUM': result = 0
-            if result is None: pass
-            elif aggr_func_name == 'COUNT': pass
-            else:
-                expr_type = translator.expr_type
-                provider = query._database.provider
-                converter = provider.get_converter_by_py_type(expr_type)
-                result = converter.sql2py(result)
+            result = query._get_shared_result(sql, query_key)
+            if result is NOT_CACHED:
+                versions = query._get_table_versions()
+                cursor = query._database._exec_sql(sql, arguments)
+                row = cursor.fetchone()
+                if row is not None: result = row[0]
+                else: result = None
+                if result is None and aggr_func_name == 'SUM': result = 0
+                if result is None: pass
+                elif aggr_func_name == 'COUNT': pass
+                else:
+                    expr_type = translator.expr_type
+                    provider = query._database.provider
+                    converter = provider.get_converter_by_py_type(expr_type)
+                    result = converter.sql2py(result)
+                query._set_shared_result(query_key, result, versions)
             if query_key is not None: cache.query_results[query_key] = result
         return result
     @cut_traceback
@@ -3822,6 +4955,138 @@ class Query(object):
     @cut_traceback
     def count(query):
         return query._aggregate('COUNT')
+    @cut_traceback
+    def update(query, **kwargs):
+        if not kwargs: throw(TypeError, 'update() method requires at least one keyword argument')
+        if query._cache.readonly: throw(ReadOnlyError, 'Cannot update objects: transaction is read-only')
+        entity = query._translator.expr_type
+        if not isinstance(entity, EntityMeta): throw(TypeError,
+            'Bulk update and delete can be applied to queries which return entity instances only')
+        attrs = []
+        vals = []
+        for name in sorted(kwargs):
+            attr = entity._adict_.get(name)
+            if attr is None: throw(TypeError, 'Unknown attribute %r' % name)
+            if attr.is_collection or attr.pk_offset is not None or isinstance(attr, (Discriminator, Version)) \
+               or not attr.columns:
+                throw(TypeError, 'Attribute %s cannot be updated in bulk' % attr)
+            attrs.append(attr)
+            vals.append(attr.check(kwargs[name], None, entity))
+        attrs = tuple(attrs)
+        query._cache.flush()
+        objects = query._find_bulk_affected_objects_()
+        sql, adapter = query._get_bulk_sql_('UPDATE', attrs)
+        arguments = dict(query._vars)
+        for i, (attr, val) in enumerate(izip(attrs, vals)): arguments['set:%d' % i] = tuple(attr.get_raw_values(val))
+        cursor = query._database._exec_sql(sql, adapter(arguments))
+        query._invalidate_bulk_caches_()
+        version_attr = entity._version_attr_
+        for obj in objects:
+            if version_attr is not None:
+                version = obj._dbvals_.get(version_attr.name)
+                if version is not None:
+                    obj._rbits_ &= ~obj._bits_[version_attr]
+                    version_attr.db_set(obj, version + 1)
+            for attr, val in izip(attrs, vals):
+                obj._rbits_ &= ~obj._bits_[attr]
+                reverse = attr.reverse
+                if reverse and reverse.is_collection and val is not None:
+                    setdata = val._vals_.get(reverse.name)
+                    if setdata is not None: setdata.add(obj)  # the object was moved by this transaction, not a phantom
+                attr.db_set(obj, val)
+        return cursor.rowcount
+    @cut_traceback
+    def delete(query, bulk=False):
+        if query._cache.readonly: throw(ReadOnlyError, 'Cannot delete objects: transaction is read-only')
+        if not bulk:
+            objects = query._fetch()
+            for obj in objects: obj._delete_()
+            return len(objects)
+        entity = query._translator.expr_type
+        if not isinstance(entity, EntityMeta): throw(TypeError,
+            'Bulk update and delete can be applied to queries which return entity instances only')
+        cache = query._cache
+        cache.flush()
+        objects = query._find_bulk_affected_objects_()
+        query._check_bulk_dependents_(objects)
+        sql, adapter = query._get_bulk_sql_('DELETE')
+        cursor = query._database._exec_sql(sql, adapter(query._vars))
+        query._invalidate_bulk_caches_()
+        for obj in objects:
+            for attr in obj._attrs_:
+                if not attr.reverse or attr.is_collection: continue
+                dbval = obj._dbvals_.get(attr.name)
+                if dbval is not None: attr.db_update_reverse(obj, dbval, None)
+            cache.evict(obj)
+            obj._status_ = 'deleted'
+        return cursor.rowcount
+    def _get_bulk_sql_(query, kind, attrs=()):
+        sql_key = query._key + (kind, attrs, options.INNER_JOIN_SYNTAX)
+        database = query._database
+        cache_entry = database._constructed_sql_cache.get(sql_key)
+        if cache_entry is None:
+            translator = query._translator
+            if kind == 'SELECT': sql_ast = translator.construct_pk_select_ast()
+            elif kind == 'DELETE': sql_ast = translator.construct_bulk_sql_ast()
+            else:
+                pairs = []
+                for i, attr in enumerate(attrs):
+                    for j, (column, converter) in enumerate(izip(attr.columns, attr.converters)):
+                        pairs.append((column, [ 'PARAM', ('set:%d' % i, j), converter ]))
+                version_attr = translator.expr_type._version_attr_
+                if version_attr is not None:
+                    column = version_attr.column
+                    pairs.append((column, [ 'ADD', [ 'COLUMN', None, column ], [ 'VALUE', 1 ] ]))
+                sql_ast = translator.construct_bulk_sql_ast(pairs)
+            cache_entry = database.provider.ast2sql(sql_ast)
+            database._constructed_sql_cache[sql_key] = cache_entry
+        return cache_entry
+    def _find_bulk_affected_objects_(query):
+        entity = query._translator.expr_type
+        index = query._cache.indexes.get(entity._pk_)
+        if not index: return []
+        objects = [ obj for obj in index.itervalues() if isinstance(obj, entity) ]
+        if not objects: return []
+        sql, adapter = query._get_bulk_sql_('SELECT')
+        cursor = query._database._exec_sql(sql, adapter(query._vars))
+        converters = entity._pk_converters_
+        raw_pkvals = set(tuple(converter.sql2py(value) for converter, value in izip(converters, row))
+                         for row in cursor.fetchall())
+        return [ obj for obj in objects if obj._get_raw_pkval_() in raw_pkvals ]
+    def _check_bulk_dependents_(query, objects):
+        if not objects: return
+        deleted = set(objects)
+        indexes = query._cache.indexes
+        checked = set()
+        for obj in objects:
+            for attr in obj._attrs_:
+                reverse = attr.reverse
+                if not reverse or not attr.is_collection and attr.columns: continue
+                if attr.is_collection:
+                    setdata = obj._vals_.get(attr.name)
+                    if setdata:
+                        for robj in setdata:
+                            if robj not in deleted: query._throw_bulk_dependent_(obj, robj)
+                if reverse in checked: continue
+                checked.add(reverse)
+                for robj in indexes.get(reverse.entity._pk_, {}).itervalues():
+                    if robj in deleted or robj._status_ in ('deleted', 'cancelled'): continue
+                    val = robj._vals_.get(reverse.name)
+                    if not val: continue
+                    if reverse.is_collection: referenced = val & deleted
+                    elif val in deleted: referenced = (val,)
+                    else: continue
+                    for obj2 in referenced: query._throw_bulk_dependent_(obj2, robj)
+    def _throw_bulk_dependent_(query, obj, robj):
+        throw(ConstraintError, 'Cannot delete object %s in bulk, because it is referenced by %s. '
+                               'Use delete() without bulk=True to process related objects' % (obj, robj))
+    def _invalidate_bulk_caches_(query):
+        entity = query._translator.expr_type
+        cache = query._cache
+        cache.modified_tables.add(entity._table_)
+        query._database.query_cache.invalidate((entity._table_,))
+        cache.query_results.clear()
+        if entity._root_._shared_cache_ is not None: cache.clear_shared_cache(entity)
 
 def strcut(s, width):
     if len(s) <= width:
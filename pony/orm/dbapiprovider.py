@@ -1,5 +1,9 @@
 from decimal import Decimal, InvalidOperation
 from datetime import datetime, date, time
+from threading import Lock, Condition, local as _local
+from time import time as _time
+from weakref import ref as _weakref
+from bisect import bisect
 
 from pony.utils import is_utf8, simple_decorator, throw
 from pony.converting import str2date, str2datetime
@@ -18,6 +22,7 @@ class DBException(Exception):
 class RowNotFound(DBException): pass
 class MultipleRowsFound(DBException): pass
 class TooManyRowsFound(DBException): pass
+class PoolTimeoutError(DBException): pass
 
 ##StandardError
 ##        |__Warning
@@ -64,6 +69,13 @@ class DBAPIProvider(object):
     paramstyle = 'qmark'
     quote_char = '"'
     max_params_count = 200
+    executemany_reports_rowcount = True
+    multirow_insert_returning = False
+    update_returning = False
+    parallel_queries = True
+    autonomous_transactions = True
+    streaming_blocks_connection = False
+    connection_per_thread = False
 
     dbschema_cls = None
     translator_cls = None
@@ -108,15 +120,34 @@ class DBAPIProvider(object):
 
     @wrap_dbapi_exceptions
     def connect(provider):
-        return provider.pool.connect()
+        pool = provider.pool
+        t = _time()
+        connection = pool.connect()
+        pool.stats.record('acquire', t)
+        return connection
 
     @wrap_dbapi_exceptions
     def release(provider, connection):
-        return provider.pool.release(connection)
+        pool = provider.pool
+        t = _time()
+        try: pool.release(connection)
+        except:
+            pool.stats.record('drop', t)
+            raise
+        pool.stats.record('release', t)
 
     @wrap_dbapi_exceptions
     def drop(provider, connection):
-        return provider.pool.drop(connection)
+        pool = provider.pool
+        t = _time()
+        try: pool.drop(connection)
+        finally: pool.stats.record('drop', t)
+
+    @wrap_dbapi_exceptions
+    def server_side_cursor(provider, connection, arraysize=None):
+        cursor = connection.cursor()
+        if arraysize is not None: cursor.arraysize = arraysize
+        return cursor
 
     @wrap_dbapi_exceptions
     def execute(provider, cursor, sql, arguments=None):
@@ -157,6 +188,214 @@ class DBAPIProvider(object):
         converter_cls = provider._get_converter_type_by_py_type(py_type)
         return converter_cls(py_type, attr)
 
+class Histogram(object):
+    bounds = 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0
+    def __init__(hist):
+        hist.buckets = [ 0 ] * (len(hist.bounds) + 1)
+        hist.count = 0
+        hist.sum = 0.0
+        hist.min = hist.max = None
+    def add(hist, value):
+        hist.buckets[bisect(hist.bounds, value)] += 1
+        hist.count += 1
+        hist.sum += value
+        if hist.min is None or value < hist.min: hist.min = value
+        if hist.max is None or value > hist.max: hist.max = value
+    @property
+    def avg(hist):
+        if not hist.count: return None
+        return hist.sum / hist.count
+    def items(hist):
+        return zip(hist.bounds + (None,), hist.buckets)
+
+class PoolStats(object):
+    events = 'acquire', 'release', 'drop', 'connect'
+    def __init__(stats):
+        stats.lock = Lock()
+        stats.close_count = 0
+        for event in stats.events:
+            setattr(stats, event + '_count', 0)
+            setattr(stats, event + '_time', Histogram())
+    def record(stats, event, start_time):
+        duration = _time() - start_time
+        stats.lock.acquire()
+        try:
+            setattr(stats, event + '_count', getattr(stats, event + '_count') + 1)
+            getattr(stats, event + '_time').add(duration)
+        finally: stats.lock.release()
+    def closed(stats):
+        stats.lock.acquire()
+        try: stats.close_count += 1
+        finally: stats.lock.release()
+    @property
+    def active(stats):
+        return stats.acquire_count - stats.release_count - stats.drop_count
+    @property
+    def opened(stats):
+        return stats.connect_count - stats.close_count
+    @property
+    def idle(stats):
+        return max(stats.opened - stats.active, 0)
+
+pool_option_names = 'min_size', 'max_size', 'idle_timeout', 'wait_timeout', 'check_sql'
+
+def pop_pool_options(kwargs):
+    options = {}
+    for name in pool_option_names:
+        key = 'pony_pool_' + name
+        if key in kwargs: options[name] = kwargs.pop(key)
+    return options
+
+class ThreadToken(object):
+    pass
+
+class ConnectionPool(object):
+    def __init__(pool, connect_func, min_size=0, max_size=10, idle_timeout=300, wait_timeout=30,
+                 check_sql='SELECT 1'):
+        if max_size is not None and max_size < 1: throw(ValueError,
+            'max_size must be positive number or None. Got: %r' % max_size)
+        if max_size is not None and min_size > max_size: throw(ValueError,
+            'min_size cannot be greater than max_size. Got: %r > %r' % (min_size, max_size))
+        pool.connect_func = connect_func
+        pool.min_size = min_size
+        pool.max_size = max_size
+        pool.idle_timeout = idle_timeout
+        pool.wait_timeout = wait_timeout
+        pool.check_sql = check_sql
+        pool.lock = Condition(Lock())
+        pool.idle = []  # list of (connection, release_time) pairs, most recently released connection is last
+        pool.size = 0   # count of opened connections, both idle and checked out
+        pool.stats = PoolStats()
+        pool.local = _local()
+        pool.checkouts = {}  # weakref to thread token -> set of connections checked out by that thread
+        pool.owners = {}     # connection -> weakref to token of the thread which checked it out
+        for i in xrange(min_size):
+            t = _time()
+            con = connect_func()
+            pool.stats.record('connect', t)
+            pool.size += 1
+            pool.idle.append((con, _time()))
+    def connect(pool):
+        con = pool._acquire_()
+        pool._checkout_(con)
+        return con
+    def _acquire_(pool):
+        expired = []
+        deadline = None
+        pool.lock.acquire()
+        try:
+            while True:
+                pool._collect_expired_(expired)
+                if pool.idle:
+                    con, release_time = pool.idle.pop()
+                    break
+                if pool.max_size is None or pool.size < pool.max_size:
+                    pool.size += 1
+                    con = None
+                    break
+                if pool.wait_timeout is None: pool.lock.wait()
+                else:
+                    now = _time()
+                    if deadline is None: deadline = now + pool.wait_timeout
+                    elif now >= deadline: throw(PoolTimeoutError,
+                        'Cannot get connection from the pool in %s seconds: all %d connections are in use'
+                        % (pool.wait_timeout, pool.size))
+                    pool.lock.wait(deadline - now)
+        finally: pool.lock.release()
+        for expired_con in expired: pool._close_(expired_con)
+        if con is not None:
+            if pool._check_(con): return con
+            pool._close_(con)
+        t = _time()
+        try: con = pool.connect_func()
+        except:
+            pool._forget_()
+            raise
+        pool.stats.record('connect', t)
+        return con
+    def release(pool, con):
+        pool._checkin_(con)
+        try: con.rollback()
+        except:
+            pool.drop(con)
+            raise
+        expired = []
+        pool.lock.acquire()
+        try:
+            pool._collect_expired_(expired)
+            pool.idle.append((con, _time()))
+            pool.lock.notify()
+        finally: pool.lock.release()
+        for expired_con in expired: pool._close_(expired_con)
+    def drop(pool, con):
+        pool._checkin_(con)
+        try: con.close()
+        finally:
+            pool.stats.closed()
+            pool._forget_()
+    def _checkout_(pool, con):
+        token = getattr(pool.local, 'token', None)
+        if token is None:
+            token = pool.local.token = ThreadToken()
+            token.ref = _weakref(token, pool._reclaim_)
+        pool.lock.acquire()
+        try:
+            pool.checkouts.setdefault(token.ref, set()).add(con)
+            pool.owners[con] = token.ref
+        finally: pool.lock.release()
+    def _checkin_(pool, con):
+        pool.lock.acquire()
+        try:
+            ref = pool.owners.pop(con, None)
+            if ref is not None: pool.checkouts[ref].discard(con)
+        finally: pool.lock.release()
+    def _reclaim_(pool, ref):
+        # called when a thread which did not release its connections has finished
+        pool.lock.acquire()
+        try:
+            connections = pool.checkouts.pop(ref, ())
+            for con in connections: del pool.owners[con]
+        finally: pool.lock.release()
+        for con in connections:
+            try: pool.release(con)
+            except Exception: pass
+    def disconnect(pool):
+        pool.lock.acquire()
+        try:
+            idle = pool.idle
+            pool.idle = []
+            pool.size -= len(idle)
+            pool.lock.notifyAll()
+        finally: pool.lock.release()
+        for con, release_time in idle: pool._close_(con)
+    def _forget_(pool):
+        pool.lock.acquire()
+        try:
+            pool.size -= 1
+            pool.lock.notify()
+        finally: pool.lock.release()
+    def _collect_expired_(pool, expired):
+        if pool.idle_timeout is None: return
+        idle = pool.idle
+        oldest_allowed = _time() - pool.idle_timeout
+        while idle and pool.size > pool.min_size and idle[0][1] < oldest_allowed:
+            con, release_time = idle.pop(0)
+            pool.size -= 1
+            expired.append(con)
+    def _check_(pool, con):
+        if pool.check_sql is None: return True
+        try:
+            cursor = con.cursor()
+            cursor.execute(pool.check_sql)
+            cursor.fetchall()
+            con.rollback()
+        except Exception: return False
+        return True
+    def _close_(pool, con):
+        pool.stats.closed()
+        try: con.close()
+        except Exception: pass
+
 class Converter(object):
     def __deepcopy__(converter, memo):
         return converter  # Converter instances are "immutable"
@@ -6,12 +6,12 @@ warnings.filterwarnings('ignore', '^Table.+already exists$', Warning, '^pony\\.o
 
 import MySQLdb
 import MySQLdb.converters
+import MySQLdb.cursors
 from MySQLdb.constants import FIELD_TYPE, FLAG
 
-from pony.utils import localbase
 from pony.orm import dbschema
 from pony.orm import dbapiprovider
-from pony.orm.dbapiprovider import DBAPIProvider
+from pony.orm.dbapiprovider import DBAPIProvider, ConnectionPool, pop_pool_options, wrap_dbapi_exceptions
 from pony.orm.sqltranslation import SQLTranslator
 from pony.orm.sqlbuilding import Value, SQLBuilder
 
@@ -28,6 +28,7 @@ class MyValue(Value):
 
 class MySQLTranslator(SQLTranslator):
     dialect = 'MySQL'
+    materialize_bulk_subquery = True  # MySQL cannot select from the table being updated in a subquery
 
 class MySQLBuilder(SQLBuilder):
     dialect = 'MySQL'
@@ -72,6 +73,7 @@ class MySQLBlobConverter(dbapiprovider.BlobConverter):
 class MySQLProvider(DBAPIProvider):
     paramstyle = 'format'
     quote_char = "`"
+    streaming_blocks_connection = True
 
     dbapi_module = MySQLdb
     dbschema_cls = MySQLSchema
@@ -91,6 +93,20 @@ class MySQLProvider(DBAPIProvider):
         (date, dbapiprovider.DateConverter)
     ]
 
+    @wrap_dbapi_exceptions
+    def server_side_cursor(provider, connection, arraysize=None):
+        """Return unbuffered SSCursor.
+
+        MySQL does not accept any other statement on the connection until all rows
+        of the cursor are read or the cursor is closed, so while Query.iter_chunks()
+        is streaming, lazy loads, flushes and other queries of the same transaction
+        raise ProgrammingError. Load the needed attributes within the streamed query
+        itself or iterate over a regular query instead.
+        """
+        cursor = connection.cursor(MySQLdb.cursors.SSCursor)
+        if arraysize is not None: cursor.arraysize = arraysize
+        return cursor
+
     def _get_pool(provider, *args, **kwargs):
         if 'conv' not in kwargs:
             conv = MySQLdb.converters.conversions.copy()
@@ -98,26 +114,7 @@ class MySQLProvider(DBAPIProvider):
             kwargs['conv'] = conv
         if 'charset' not in kwargs:
             kwargs['charset'] = 'utf8'
-        return Pool(*args, **kwargs)
+        options = pop_pool_options(kwargs)
+        return ConnectionPool(lambda: MySQLdb.connect(*args, **kwargs), **options)
 
 provider_cls = MySQLProvider
-
-class Pool(localbase):
-    def __init__(pool, *args, **kwargs): # called separately in each thread
-        pool.args = args
-        pool.kwargs = kwargs
-        pool.con = None
-    def connect(pool):
-        if pool.con is None:
-            pool.con = MySQLdb.connect(*pool.args, **pool.kwargs)
-        return pool.con
-    def release(pool, con):
-        assert con is pool.con
-        try: con.rollback()
-        except:
-            pool.close(con)
-            raise
-    def drop(pool, con):
-        assert con is pool.con
-        pool.con = None
-        con.close()
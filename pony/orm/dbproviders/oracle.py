@@ -3,13 +3,14 @@ os.environ["NLS_LANG"] = "AMERICAN_AMERICA.UTF8"
 
 from types import NoneType
 from datetime import date, datetime
+from time import time as _time
 from decimal import Decimal
 
 import cx_Oracle
 
 from pony.orm import core, dbschema, sqlbuilding, dbapiprovider, sqltranslation
 from pony.orm.core import log_orm, log_sql, DatabaseError
-from pony.orm.dbapiprovider import DBAPIProvider, wrap_dbapi_exceptions
+from pony.orm.dbapiprovider import DBAPIProvider, PoolStats, wrap_dbapi_exceptions
 from pony.utils import is_utf8, throw
 
 trigger_template = """
@@ -282,14 +283,19 @@ def output_type_handler(cursor, name, defaultType, size, precision, scale):
 class Pool(object):
     def __init__(pool, **kwargs):
         pool._pool = cx_Oracle.SessionPool(**kwargs)
+        pool.stats = PoolStats()
     def connect(pool):
+        opened = pool._pool.opened
+        t = _time()
         con = pool._pool.acquire()
+        if pool._pool.opened > opened: pool.stats.record('connect', t)
         con.outputtypehandler = output_type_handler
         return con
     def release(pool, con):
         pool._pool.release(con)
     def drop(pool, con):
         pool._pool.drop(con)
+        pool.stats.closed()
 
 def get_inputsize(arg):
     if isinstance(arg, datetime):
@@ -1,5 +1,5 @@
 import re
-from itertools import imap
+from itertools import imap, count as _count
 from decimal import Decimal, InvalidOperation
 from datetime import datetime, date, time
 from binascii import unhexlify
@@ -8,9 +8,9 @@ import pgdb
 
 from pony.orm import core, dbschema, sqlbuilding, dbapiprovider
 from pony.orm.core import log_orm, DatabaseError
-from pony.orm.dbapiprovider import DBAPIProvider, wrap_dbapi_exceptions
+from pony.orm.dbapiprovider import DBAPIProvider, ConnectionPool, pop_pool_options, wrap_dbapi_exceptions
 from pony.orm.sqltranslation import SQLTranslator
-from pony.utils import localbase, timestamp2datetime
+from pony.utils import timestamp2datetime
 
 class PGColumn(dbschema.Column):
     auto_template = 'SERIAL PRIMARY KEY'
@@ -106,6 +106,9 @@ class PGDatetimeConverter(dbapiprovider.DatetimeConverter):
 
 class PGProvider(DBAPIProvider):
     paramstyle = 'pyformat'
+    executemany_reports_rowcount = False
+    multirow_insert_returning = True
+    update_returning = True
 
     dbapi_module = pgdb
     dbschema_cls = PGSchema
@@ -124,6 +127,10 @@ class PGProvider(DBAPIProvider):
     def get_default_m2m_column_names(provider, entity):
         return [ column.lower() for column in DBAPIProvider.get_default_m2m_column_names(provider, entity) ]
 
+    @wrap_dbapi_exceptions
+    def server_side_cursor(provider, connection, arraysize=None):
+        return PGServerSideCursor(connection, arraysize)
+
     @wrap_dbapi_exceptions
     def execute(provider, cursor, sql, arguments=None):
         if isinstance(sql, unicode): sql = sql.encode('utf8')
@@ -155,26 +162,44 @@ class PGProvider(DBAPIProvider):
     ]
 
     def _get_pool(provider, *args, **kwargs):
-        return Pool(*args, **kwargs)
+        options = pop_pool_options(kwargs)
+        return ConnectionPool(lambda: pgdb.connect(*args, **kwargs), **options)
 
 provider_cls = PGProvider
 
-class Pool(localbase):
-    def __init__(pool, *args, **kwargs):
-        pool.args = args
-        pool.kwargs = kwargs
-        pool.con = None
-    def connect(pool):
-        if pool.con is None:
-            pool.con = pgdb.connect(*pool.args, **pool.kwargs)
-        return pool.con
-    def release(pool, con):
-        assert con is pool.con
-        try: con.rollback()
-        except:
-            pool.close(con)
-            raise
-    def drop(pool, con):
-        assert con is pool.con
-        pool.con = None
-        con.close()
+next_cursor_num = _count(1).next
+
+class PGServerSideCursor(object):
+    def __init__(cursor, connection, arraysize=None):
+        cursor.cursor = connection.cursor()
+        cursor.name = 'pony_cursor_%d' % next_cursor_num()
+        cursor.arraysize = arraysize or 1000
+        cursor.declared = False
+        cursor.description = None
+        cursor.rowcount = -1
+    def execute(cursor, sql, arguments=None):
+        sql = 'DECLARE %s NO SCROLL CURSOR FOR %s' % (cursor.name, sql)
+        if arguments is None: cursor.cursor.execute(sql)
+        else: cursor.cursor.execute(sql, arguments)
+        cursor.declared = True
+    def _fetch(cursor, size):
+        if not cursor.declared: return []
+        if size is None: cursor.cursor.execute('FETCH ALL FROM %s' % cursor.name)
+        else: cursor.cursor.execute('FETCH FORWARD %d FROM %s' % (size, cursor.name))
+        cursor.description = cursor.cursor.description
+        return cursor.cursor.fetchall()
+    def fetchone(cursor):
+        rows = cursor._fetch(1)
+        if not rows: return None
+        return rows[0]
+    def fetchmany(cursor, size=None):
+        if size is None: size = cursor.arraysize
+        return cursor._fetch(size)
+    def fetchall(cursor):
+        return cursor._fetch(None)
+    def close(cursor):
+        if cursor.declared:
+            cursor.declared = False
+            try: cursor.cursor.execute('CLOSE %s' % cursor.name)
+            except pgdb.Error: pass  # transaction is already aborted or finished
+        cursor.cursor.close()
@@ -5,10 +5,10 @@ from threading import Lock, Thread
 from Queue import Queue
 from decimal import Decimal
 from datetime import datetime, date, time
-from time import strptime
+from time import strptime, time as _time
 
 from pony.orm import dbschema, sqltranslation, sqlbuilding, dbapiprovider
-from pony.orm.dbapiprovider import DBAPIProvider, wrap_dbapi_exceptions
+from pony.orm.dbapiprovider import DBAPIProvider, PoolStats, wrap_dbapi_exceptions
 from pony.utils import localbase, datetime2timestamp, timestamp2datetime, simple_decorator, absolutize_path, throw
 
 class SQLiteForeignKey(dbschema.ForeignKey):
@@ -79,6 +79,11 @@ class SQLiteDatetimeConverter(dbapiprovider.DatetimeConverter):
         return datetime2timestamp(val)
 
 class SQLiteProvider(DBAPIProvider):
+    multirow_insert_returning = sqlite.sqlite_version_info >= (3, 35)
+    update_returning = sqlite.sqlite_version_info >= (3, 35)
+    autonomous_transactions = False
+    connection_per_thread = True
+
     dbapi_module = sqlite
     dbschema_cls = SQLiteSchema
     translator_cls = SQLiteTranslator
@@ -97,7 +102,9 @@ class SQLiteProvider(DBAPIProvider):
     ]
 
     def _get_pool(provider, filename, create_db=False):
-        if filename == ':memory:': return MemPool()
+        if filename == ':memory:':
+            provider.parallel_queries = False  # all threads share the same in-memory connection
+            return MemPool()
         else:
             # When relative filename is specified, it is considered
             # not relative to cwd, but to user module where
@@ -110,14 +117,15 @@ class SQLiteProvider(DBAPIProvider):
             # 0 - pony.dbproviders.sqlite._get_pool()
 
             filename = absolutize_path(filename, frame_depth=4)
-            return Pool(filename, create_db)
+            return Pool(filename, create_db, PoolStats())
 
 provider_cls = SQLiteProvider
 
 class Pool(localbase):
-    def __init__(pool, filename, create_db): # called separately in each thread
+    def __init__(pool, filename, create_db, stats): # called separately in each thread
         pool.filename = filename
         pool.create_db = create_db
+        pool.stats = stats  # shared between threads
         pool.con = None
     def connect(pool):
         con = pool.con
@@ -125,8 +133,10 @@ class Pool(localbase):
         filename = pool.filename
         if not pool.create_db and not os.path.exists(filename):
             throw(IOError, "Database file is not found: %r" % filename)
+        t = _time()
         pool.con = con = sqlite.connect(filename)
         _init_connection(con)
+        pool.stats.record('connect', t)
         return con
     def release(pool, con):
         assert con is pool.con
@@ -137,13 +147,17 @@ class Pool(localbase):
     def drop(pool, con):
         assert con is pool.con
         pool.con = None
+        pool.stats.closed()
         con.close()
 
 mem_connect_lock = Lock()
 
 class MemPool(object):
     def __init__(mempool):
+        mempool.stats = PoolStats()
+        t = _time()
         mempool.con = MemoryConnectionWrapper()
+        mempool.stats.record('connect', t)
         mem_connect_lock.acquire()
         try:
             if mempool.con is None:
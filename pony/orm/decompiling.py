@@ -1,9 +1,12 @@
-import types
+import types, atexit, marshal
 from compiler import ast
+from cPickle import load, loads, dumps, HIGHEST_PROTOCOL
+from hashlib import md5
 from opcode import opname as opnames, HAVE_ARGUMENT, EXTENDED_ARG, cmp_op
 from opcode import hasconst, hasname, hasjrel, haslocal, hascompare, hasfree
 
-from pony.utils import throw
+from pony import options
+from pony.utils import throw, write_file_atomically
 
 ##ast.And.__repr__ = lambda self: "And(%s: %s)" % (getattr(self, 'endpos', '?'), repr(self.nodes),)
 ##ast.Or.__repr__ = lambda self: "Or(%s: %s)" % (getattr(self, 'endpos', '?'), repr(self.nodes),)
@@ -22,11 +25,66 @@ def decompile(x):
     result = ast_cache.get(key)
     if result is None:
         codeobjects[key] = codeobject
-        decompiler = Decompiler(codeobject)
-        result = decompiler.ast, decompiler.external_names
+        filename = options.DECOMPILE_CACHE_FILE
+        if filename: result = get_persistent_ast(filename, codeobject)
+        if result is None:
+            decompiler = Decompiler(codeobject)
+            result = decompiler.ast, decompiler.external_names
+            if filename: set_persistent_ast(filename, codeobject, result)
         ast_cache[key] = result
     return result
 
+PERSISTENT_CACHE_VERSION = 1
+
+persistent_cache = None
+persistent_cache_filename = None
+persistent_cache_modified = False
+
+def get_persistent_key(codeobject):
+    return codeobject.co_filename, codeobject.co_firstlineno, md5(marshal.dumps(codeobject)).hexdigest()
+
+def read_persistent_cache_file(filename):
+    try: f = open(filename, 'rb')
+    except IOError: return {}
+    try:
+        try: version, data = load(f)
+        except Exception: return {}  # corrupted or truncated file is silently ignored
+    finally: f.close()
+    if version != PERSISTENT_CACHE_VERSION: return {}
+    return data
+
+def load_persistent_cache(filename):
+    global persistent_cache, persistent_cache_filename, persistent_cache_modified
+    if persistent_cache_filename == filename: return persistent_cache
+    if persistent_cache_modified: save_persistent_cache()
+    persistent_cache = read_persistent_cache_file(filename)
+    persistent_cache_filename = filename
+    persistent_cache_modified = False
+    return persistent_cache
+
+def save_persistent_cache():
+    global persistent_cache_modified
+    if not persistent_cache_modified: return
+    filename = persistent_cache_filename
+    data = read_persistent_cache_file(filename)
+    data.update(persistent_cache)
+    write_file_atomically(filename, dumps((PERSISTENT_CACHE_VERSION, data), HIGHEST_PROTOCOL))
+    persistent_cache.update(data)
+    persistent_cache_modified = False
+
+atexit.register(save_persistent_cache)
+
+def get_persistent_ast(filename, codeobject):
+    data = load_persistent_cache(filename).get(get_persistent_key(codeobject))
+    if data is None: return None
+    return loads(data)
+
+def set_persistent_ast(filename, codeobject, result):
+    global persistent_cache_modified
+    cache = load_persistent_cache(filename)
+    cache[get_persistent_key(codeobject)] = dumps(result, HIGHEST_PROTOCOL)
+    persistent_cache_modified = True
+
 def simplify(clause):
     if isinstance(clause, ast.And):
         if len(clause.nodes) == 1: result = clause.nodes[0]
@@ -11,11 +11,12 @@ from pony.utils import datetime2timestamp, throw
 class AstError(Exception): pass
 
 class Param(object):
-    __slots__ = 'style', 'id', 'key', 'py2sql'
+    __slots__ = 'style', 'id', 'key', 'converter', 'py2sql'
     def __init__(param, paramstyle, id, key, converter=None):
         param.style = paramstyle
         param.id = id
         param.key = key
+        param.converter = converter
         param.py2sql = converter and converter.py2sql or (lambda val: val)
     def __unicode__(param):
         paramstyle = param.style
@@ -116,23 +117,45 @@ def indentable(method):
     new_method.__name__ = method.__name__
     return new_method
 
-def convert(values, params):
+adapter_code_cache = {}
+
+def make_adapter(paramstyle, params):
+    if paramstyle in ('qmark', 'format', 'numeric'): named = False
+    elif paramstyle in ('named', 'pyformat'): named = True
+    else: throw(NotImplementedError, paramstyle)
+    namespace = {}
+    lines = [ 'def adapter(values):' ]
+    value_names = []
     for param in params:
+        id = param.id
+        name = 'value%d' % id
+        value_names.append(name)
+        if 'key%d' % id in namespace: continue
         key = param.key
         if type(key) is tuple:
             key, i = key
             if type(key) is tuple:
                 key, j = key
-                tup = values[key]
-                obj = tup[j]
-                value = obj._get_raw_pkval_()[i]
+                lines.append('    %s = values[key%d][%d]._get_raw_pkval_()[%d]' % (name, id, j, i))
             else:
-                obj_or_tuple = values[key]
-                if type(obj_or_tuple) is tuple: value = obj_or_tuple[i]
-                else: value = obj_or_tuple._get_raw_pkval_()[i]
-        else: value = values[key]
-        if value is not None: value = param.py2sql(value)
-        yield value
+                lines.append('    %s = values[key%d]' % (name, id))
+                lines.append('    if type(%s) is tuple: %s = %s[%d]' % (name, name, name, i))
+                lines.append('    else: %s = %s._get_raw_pkval_()[%d]' % (name, name, i))
+        else: lines.append('    %s = values[key%d]' % (name, id))
+        namespace['key%d' % id] = key
+        if param.converter is not None:
+            namespace['py2sql%d' % id] = param.py2sql
+            lines.append('    if %s is not None: %s = py2sql%d(%s)' % (name, name, id, name))
+    if named: items = [ "'p%d': %s" % (param.id, value_names[i]) for i, param in enumerate(params) ]
+    else: items = value_names
+    if named: lines.append('    return {%s}' % ', '.join(items))
+    else: lines.append('    return (%s)' % ''.join('%s, ' % item for item in items))
+    source = '\n'.join(lines)
+    code = adapter_code_cache.get(source)
+    if code is None:
+        code = adapter_code_cache[source] = compile(source, '<adapter>', 'exec')
+    exec code in namespace
+    return namespace['adapter']
 
 class SQLBuilder(object):
     dialect = None
@@ -151,20 +174,12 @@ class SQLBuilder(object):
         builder.sql = u''.join(map(unicode, builder.result)).rstrip('\n')
         if paramstyle in ('qmark', 'format'):
             params = tuple(x for x in builder.result if isinstance(x, Param))
-            def adapter(values):
-                return tuple(convert(values, params))
-        elif paramstyle == 'numeric':
-            params = tuple(param for param in sorted(builder.keys.itervalues(), key=attrgetter('id')))
-            def adapter(values):
-                return tuple(convert(values, params))
-        elif paramstyle in ('named', 'pyformat'):
+        elif paramstyle in ('numeric', 'named', 'pyformat'):
             params = tuple(param for param in sorted(builder.keys.itervalues(), key=attrgetter('id')))
-            def adapter(values):
-                return dict(('p%d' % param.id, value) for param, value in zip(params, convert(values, params)))
         else: throw(NotImplementedError, paramstyle)
         builder.params = params
         builder.layout = tuple(param.key for param in params)
-        builder.adapter = adapter
+        builder.adapter = make_adapter(paramstyle, params)
     def __call__(builder, ast):
         if isinstance(ast, basestring):
             throw(AstError, 'An SQL AST list was expected. Got string: %r' % ast)
@@ -189,13 +204,19 @@ class SQLBuilder(object):
         return [ 'INSERT INTO ', builder.quote_name(table_name), ' (',
                  join(', ', [builder.quote_name(column) for column in columns ]),
                  ') VALUES (', join(', ', [builder(value) for value in values]), ')' ]
-    def UPDATE(builder, table_name, pairs, where=None):
+    def INSERT_MANY(builder, table_name, columns, rows, returning):
+        return [ 'INSERT INTO ', builder.quote_name(table_name), ' (',
+                 join(', ', [builder.quote_name(column) for column in columns ]), ') VALUES ',
+                 join(', ', [ ('(', join(', ', [builder(value) for value in values]), ')') for values in rows ]),
+                 ' RETURNING ', builder.quote_name(returning) ]
+    def UPDATE(builder, table_name, pairs, where=None, returning=None):
         return [ 'UPDATE ', builder.quote_name(table_name), '\nSET ',
                  join(', ', [ (builder.quote_name(name), '=', builder(param)) for name, param in pairs]),
-                 where and [ '\n', builder(where) ] or [] ]
+                 where and [ '\n', builder.subquery(where) ] or [],
+                 returning is not None and [ ' RETURNING ', builder.quote_name(returning) ] or [] ]
     def DELETE(builder, table_name, where=None):
         result = [ 'DELETE FROM ', builder.quote_name(table_name) ]
-        if where: result += [ '\n', builder(where) ]
+        if where: result += [ '\n', builder.subquery(where) ]
         return result
     def subquery(builder, *sections):
         builder.indent += 1
@@ -60,6 +60,7 @@ def type2str(t):
 class SQLTranslator(ASTTranslator):
     dialect = None
     row_value_syntax = True
+    materialize_bulk_subquery = False
 
     def default_post(translator, node):
         throw(NotImplementedError)
@@ -270,6 +271,7 @@ class SQLTranslator(ASTTranslator):
             translator.expr_type = entity
             translator.expr_columns = [ [ 'COLUMN', alias, column ] for column in pk_columns ]
             translator.row_layout = None
+            translator.row_factory = None
         else:
             translator.alias = None
             if isinstance(monad, translator.ListMonad):
@@ -301,7 +303,9 @@ class SQLTranslator(ASTTranslator):
             row_layout = []
             offset = 0
             provider = translator.database.provider
-            for m in expr_monads:
+            namespace = {}
+            lines = [ 'def row_factory(row):' ]
+            for i, m in enumerate(expr_monads):
                 expr_type = m.type
                 if isinstance(expr_type, SetType): expr_type = expr_type.item_type
                 if isinstance(expr_type, EntityMeta):
@@ -311,6 +315,10 @@ class SQLTranslator(ASTTranslator):
                         return constructor(values)
                     row_layout.append((func, slice(offset, next_offset), ast2src(m.node)))
                     m.orderby_columns = range(offset+1, next_offset+1)
+                    namespace['constructor%d' % i] = expr_type._get_by_raw_pkval_
+                    lines.append('    value%d = row[%d:%d]' % (i, offset, next_offset))
+                    lines.append('    if None in value%d: value%d = None' % (i, i))
+                    lines.append('    else: value%d = constructor%d(value%d)' % (i, i, i))
                     offset = next_offset
                 else:
                     converter = provider.get_converter_by_py_type(expr_type)
@@ -319,8 +327,14 @@ class SQLTranslator(ASTTranslator):
                         return sql2py(value)
                     row_layout.append((func, offset, ast2src(m.node)))
                     m.orderby_columns = (offset+1,)
+                    namespace['sql2py%d' % i] = converter.sql2py
+                    lines.append('    value%d = row[%d]' % (i, offset))
+                    lines.append('    if value%d is not None: value%d = sql2py%d(value%d)' % (i, i, i, i))
                     offset += 1
+            lines.append('    return (%s)' % ''.join('value%d, ' % i for i in xrange(len(expr_monads))))
+            exec '\n'.join(lines) in namespace
             translator.row_layout = row_layout
+            translator.row_factory = namespace['row_factory']
 
         first_from_item = translator.subquery.from_ast[1]
         if len(first_from_item) > 3:
@@ -391,6 +405,31 @@ class SQLTranslator(ASTTranslator):
 
         sql_ast = ast_transformer(sql_ast)
         return sql_ast, attr_offsets
+    def construct_pk_select_ast(translator):
+        entity = translator.expr_type
+        if not isinstance(entity, EntityMeta): throw(TypeError,
+            'Bulk update and delete can be applied to queries which return entity instances only')
+        sql_ast, attr_offsets = translator.construct_sql_ast(distinct=False)
+        select_ast = [ 'SELECT', [ 'ALL' ] + translator.expr_columns ]
+        select_ast.extend(section for section in sql_ast[2:] if section[0] != 'ORDER_BY')
+        return select_ast
+    def construct_bulk_sql_ast(translator, pairs=None):
+        entity = translator.expr_type
+        select_ast = translator.construct_pk_select_ast()
+        table_name = entity._table_
+        pk_columns = entity._pk_columns_
+        if translator.materialize_bulk_subquery or len(pk_columns) > 1 and not translator.row_value_syntax:
+            select_ast = [ 'SELECT', [ 'ALL' ] + [ [ 'COLUMN', 't', column ] for column in pk_columns ],
+                                     [ 'FROM', [ 't', 'SELECT', select_ast[1:] ] ] ]
+        if len(pk_columns) == 1:
+            where_ast = [ 'WHERE', [ 'IN', [ 'COLUMN', None, pk_columns[0] ], select_ast ] ]
+        elif translator.row_value_syntax:
+            where_ast = [ 'WHERE', [ 'IN', [ 'ROW' ] + [ [ 'COLUMN', None, column ] for column in pk_columns ], select_ast ] ]
+        else:
+            where_ast = [ 'WHERE', [ 'EXISTS', select_ast[2], [ 'WHERE' ] +
+                [ [ 'EQ', [ 'COLUMN', 't', column ], [ 'COLUMN', table_name, column ] ] for column in pk_columns ] ] ]
+        if pairs is None: return [ 'DELETE', table_name, where_ast ]
+        return [ 'UPDATE', table_name, pairs, where_ast ]
     def preGenExpr(translator, node):
         inner_tree = node.code
         subtranslator = translator.__class__(inner_tree, translator.extractors, translator.vartypes, translator)
@@ -16,6 +16,9 @@ from test_relations_symmetric_m2m import *
 from test_relations_one2many import *
 from test_relations_m2m import *
 from test_crud_raw_sql import *
+from test_crud_batching import *
+from test_connection_pool import *
+from test_shared_cache import *
 from test_declarative_attr_set_monad import *
 from test_declarative_date import *
 from test_declarative_func_monad import *
@@ -32,6 +35,22 @@ from test_collections import *
 from test_sqlbuilding_formatstyles import *
 from test_sqlbuilding_sqlast import *
 from test_orm_query import *
+from test_query_streaming import *
+from test_decompile_cache import *
+from test_mapping_file import *
+from test_hydration import *
+from test_prefetch import *
+from test_lazy_loading import *
+from test_bulk_operations import *
+from test_create_many import *
+from test_hilo import *
+from test_insert_returning import *
+from test_m2m_remove import *
+from test_readonly import *
+from test_optimistic_checks import *
+from test_version import *
+from test_transaction_executor import *
+from test_gather import *
 
 #from new_tests import *
 
@@ -0,0 +1,127 @@
+import unittest
+from decimal import Decimal
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Category(db.Entity):
+    name = Required(unicode)
+    products = Set('Product')
+
+class Product(db.Entity):
+    name = Required(unicode)
+    price = Required(Decimal)
+    category = Optional(Category)
+
+class Mark(db.Entity):
+    student = Required(int)
+    subject = Required(unicode)
+    PrimaryKey(student, subject)
+    value = Required(int)
+
+db.generate_mapping(create_tables=True)
+
+def select_cheap(price):
+    return select(p for p in Product if p.price < price)
+
+def select_by_category(name):
+    return select(p for p in Product if p.category.name == name)
+
+def select_bad_marks():
+    return select(m for m in Mark if m.value < 3)
+
+def select_category(name):
+    return select(c for c in Category if c.name == name)
+
+def select_names():
+    return select(p.name for p in Product)
+
+class TestBulkOperations(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        for table in 'Product', 'Category', 'Mark':
+            db.execute('delete from %s' % table)
+        db.insert('Category', id=1, name='A')
+        db.insert('Category', id=2, name='B')
+        for i in range(1, 6):
+            db.insert('Product', id=i, name='P%d' % i, price=str(i), category=i % 2 + 1)
+        for i in range(1, 5):
+            db.insert('Mark', student=i, subject='Math', value=i)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def test1(self):
+        self.assertEqual(select_cheap(Decimal(3)).update(price=Decimal('0.5')), 2)
+        commit()
+        self.assertEqual(db.select('id from Product where price < 1 order by id'), [ 1, 2 ])
+    def test2(self):
+        p1 = Product[1]
+        p3 = Product[3]
+        self.assertEqual(p1.price, Decimal(1))
+        select_cheap(Decimal(3)).update(price=Decimal(10))
+        self.assertEqual(p1.price, Decimal(10))
+        self.assertEqual(p3.price, Decimal(3))
+        p1.name = u'New'
+        commit()
+        self.assertEqual(db.select('price from Product where id = 1'), [ Decimal(10) ])
+        self.assertEqual(db.select('name from Product where id = 1'), [ u'New' ])
+    def test3(self):
+        a = Category[1]
+        b = Category[2]
+        self.assertEqual(len(a.products), 2)
+        self.assertEqual(len(b.products), 3)
+        self.assertEqual(select_by_category(u'B').update(category=a), 3)
+        self.assertEqual(len(a.products), 5)
+        self.assertEqual(len(b.products), 0)
+    def test4(self):
+        p1 = Product[1]
+        b = Category[2]
+        self.assertEqual(len(b.products), 3)
+        self.assertEqual(select_cheap(Decimal(3)).delete(bulk=True), 2)
+        self.assertEqual(p1._status_, 'deleted')
+        self.assertEqual(len(b.products), 2)
+        commit()
+        self.assertEqual(db.select('id from Product order by id'), [ 3, 4, 5 ])
+    @raises_exception(OperationWithDeletedObjectError, 'Product[1] was deleted')
+    def test5(self):
+        p1 = Product[1]
+        select_cheap(Decimal(3)).delete(bulk=True)
+        p1.name
+    def test6(self):
+        self.assertEqual(select_cheap(Decimal(3)).delete(), 2)
+        commit()
+        self.assertEqual(db.select('id from Product order by id'), [ 3, 4, 5 ])
+    def test7(self):
+        m = Mark[1, u'Math']
+        self.assertEqual(select_bad_marks().update(value=3), 2)
+        self.assertEqual(m.value, 3)
+        self.assertEqual(select_bad_marks().delete(bulk=True), 0)
+        commit()
+        self.assertEqual(db.select('value from Mark order by student'), [ 3, 3, 3, 4 ])
+    @raises_exception(TypeError, 'update() method requires at least one keyword argument')
+    def test8(self):
+        select_cheap(Decimal(3)).update()
+    @raises_exception(TypeError, 'Attribute Product.id cannot be updated in bulk')
+    def test9(self):
+        select_cheap(Decimal(3)).update(id=10)
+    @raises_exception(TypeError, 'Bulk update and delete can be applied to queries which return entity instances only')
+    def test10(self):
+        select_names().delete(bulk=True)
+    @raises_exception(TypeError, "Unknown attribute 'foo'")
+    def test11(self):
+        select_cheap(Decimal(3)).update(foo=1)
+    @raises_exception(ConstraintError, 'Cannot delete object Category[2] in bulk, because it is referenced by Product[1]. '
+                                       'Use delete() without bulk=True to process related objects')
+    def test12(self):
+        Product[1].name
+        select_category(u'B').delete(bulk=True)
+    def test13(self):
+        Category[2]
+        Product[2].name
+        self.assertEqual(select_category(u'B').delete(bulk=True), 1)
+        self.assertEqual(Product[2].category, Category[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest, sqlite3, threading, time
+from pony.orm.core import *
+from pony.orm.dbapiprovider import ConnectionPool, PoolStats, pop_pool_options
+from testutils import raises_exception
+
+def connect():
+    return sqlite3.connect(':memory:', check_same_thread=False)
+
+class TestConnectionPool(unittest.TestCase):
+    def test1(self):
+        pool = ConnectionPool(connect, max_size=2)
+        con = pool.connect()
+        pool.release(con)
+        self.assertTrue(pool.connect() is con)
+        self.assertEqual(pool.size, 1)
+    def test2(self):
+        pool = ConnectionPool(connect, max_size=2)
+        con1 = pool.connect()
+        con2 = pool.connect()
+        self.assertTrue(con1 is not con2)
+        self.assertEqual(pool.size, 2)
+        pool.drop(con1)
+        self.assertEqual(pool.size, 1)
+    @raises_exception(PoolTimeoutError, 'Cannot get connection from the pool in 0.05 seconds: all 1 connections are in use')
+    def test3(self):
+        pool = ConnectionPool(connect, max_size=1, wait_timeout=0.05)
+        pool.connect()
+        pool.connect()
+    def test4(self):
+        pool = ConnectionPool(connect, max_size=1, wait_timeout=5)
+        con = pool.connect()
+        result = []
+        thread = threading.Thread(target=lambda: result.append(pool.connect()))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(result, [])
+        pool.release(con)
+        thread.join()
+        self.assertTrue(result[0] is con)
+    def test5(self):
+        pool = ConnectionPool(connect, idle_timeout=0)
+        con = pool.connect()
+        pool.release(con)
+        time.sleep(0.01)
+        self.assertTrue(pool.connect() is not con)
+        self.assertEqual(pool.size, 1)
+    def test6(self):
+        pool = ConnectionPool(connect, min_size=1, idle_timeout=0)
+        con = pool.connect()
+        pool.release(con)
+        self.assertTrue(pool.connect() is con)
+    def test7(self):
+        pool = ConnectionPool(connect)
+        con = pool.connect()
+        pool.release(con)
+        con.close()
+        con2 = pool.connect()
+        self.assertTrue(con2 is not con)
+        self.assertEqual(pool.size, 1)
+    def test9(self):
+        pool = ConnectionPool(connect, max_size=1, wait_timeout=0.05)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(pool.connect()))
+        thread.start()
+        thread.join()
+        self.assertEqual(pool.size, 1)
+        self.assertTrue(pool.connect() is result[0])
+    def test10(self):
+        pool = ConnectionPool(connect, min_size=2)
+        self.assertEqual((pool.size, len(pool.idle), pool.stats.connect_count), (2, 2, 2))
+    def test11(self):
+        pool = ConnectionPool(connect, idle_timeout=0)
+        con1 = pool.connect()
+        con2 = pool.connect()
+        pool.release(con1)
+        time.sleep(0.01)
+        pool.release(con2)
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(pool.stats.close_count, 1)
+    def test8(self):
+        kwargs = dict(host='localhost', pony_pool_max_size=5, pony_pool_wait_timeout=None)
+        self.assertEqual(pop_pool_options(kwargs), dict(max_size=5, wait_timeout=None))
+        self.assertEqual(kwargs, dict(host='localhost'))
+
+class TestPoolStats(unittest.TestCase):
+    def test1(self):
+        pool = ConnectionPool(connect)
+        con = pool.connect()
+        pool.release(con)
+        pool.drop(pool.connect())
+        stats = pool.stats
+        self.assertEqual((stats.connect_count, stats.close_count), (1, 1))
+        self.assertEqual(stats.connect_time.count, 1)
+    def test2(self):
+        db = Database('sqlite', ':memory:')
+        stats = db.pool_stats
+        acquire_count, release_count = stats.acquire_count, stats.release_count
+        db.select('1')
+        rollback()
+        self.assertEqual(stats.acquire_count - acquire_count, 1)
+        self.assertEqual(stats.release_count - release_count, 1)
+        self.assertEqual(stats.acquire_time.count, stats.acquire_count)
+        self.assertEqual(stats.active, 0)
+        self.assertEqual(stats.idle, 1)
+    def test3(self):
+        stats = PoolStats()
+        for value in 0.0005, 0.002, 0.002, 10:
+            stats.acquire_time.add(value)
+        hist = stats.acquire_time
+        self.assertEqual(hist.buckets, [1, 2, 0, 0, 0, 0, 0, 0, 1])
+        self.assertEqual((hist.min, hist.max, hist.count), (0.0005, 10, 4))
+
+if __name__ == '__main__':
+    unittest.main()
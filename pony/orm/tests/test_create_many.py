@@ -0,0 +1,71 @@
+import unittest
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    email = Optional(unicode, unique=True)
+    group = Required(Group)
+
+class Mark(db.Entity):
+    student = Required(int)
+    subject = Required(unicode)
+    PrimaryKey(student, subject)
+
+db.generate_mapping(create_tables=True)
+
+class TestCreateMany(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        for table in 'Student', '"Group"', 'Mark':
+            db.execute('delete from %s' % table)
+        db.insert('Group', number=1)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def test1(self):
+        g = Group[1]
+        self.assertEqual(len(g.students), 0)
+        students = Student.create_many([ dict(name=u'S%d' % i, email=u'e%d' % i, group=g) for i in range(3) ])
+        self.assertEqual([ s.name for s in students ], [ u'S0', u'S1', u'S2' ])
+        self.assertEqual(g.students, set(students))
+        commit()
+        self.assertEqual(db.select('name from Student order by name'), [ u'S0', u'S1', u'S2' ])
+    def test2(self):
+        self.assertEqual(Student.create_many([]), [])
+        groups = Group.create_many([ dict(number=2), dict(number=3) ])
+        self.assert_(Group[2] is groups[0])
+        commit()
+        self.assertEqual(db.select('number from "Group" order by number'), [ 1, 2, 3 ])
+    @raises_exception(CacheIndexError, 'Cannot create Group: instance with primary key 2 already exists')
+    def test3(self):
+        Group.create_many([ dict(number=2), dict(number=2) ])
+    @raises_exception(CacheIndexError, 'Cannot create Group: instance with primary key 1 already exists')
+    def test4(self):
+        Group[1]
+        Group.create_many([ dict(number=2), dict(number=1) ])
+    @raises_exception(CacheIndexError, 'Cannot create Student: value e1 for key email already exists')
+    def test5(self):
+        g = Group[1]
+        Student(name=u'A', email=u'e1', group=g)
+        Student.create_many([ dict(name=u'B', email=u'e2', group=g), dict(name=u'C', email=u'e1', group=g) ])
+    @raises_exception(CacheIndexError, 'Cannot create Mark: instance with primary key 1, Math already exists')
+    def test6(self):
+        Mark.create_many([ dict(student=1, subject=u'Math'), dict(student=1, subject=u'Math') ])
+    def test7(self):
+        g = Group[1]
+        try: Student.create_many([ dict(name=u'A', group=g), dict(group=g) ])
+        except ConstraintError: pass
+        else: self.fail('ConstraintError expected')
+        self.assertEqual(len(g.students), 0)
+        self.assertEqual(Student.create_many([ dict(name=u'A', email=u'e1', group=g) ])[0].email, u'e1')
+
+if __name__ == '__main__':
+    unittest.main()
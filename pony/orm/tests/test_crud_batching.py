@@ -0,0 +1,151 @@
+import unittest
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    record = PrimaryKey(int)
+    name = Required(unicode)
+    group = Required(Group)
+    mentor = Optional('Student', reverse='pupils')
+    pupils = Set('Student', reverse='mentor')
+
+db.generate_mapping(create_tables=True)
+
+class TestInsertBatching(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Student')
+        db.execute('delete from "Group"')
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def insert_count(self, entity):
+        return sum(stat.db_count for sql, stat in db.local_stats.iteritems()
+                   if sql.startswith('INSERT INTO "%s"' % entity._table_))
+    def test1(self):
+        before = self.insert_count(Group)
+        Group(number=1)
+        Group(number=2)
+        Group(number=3)
+        commit()
+        self.assertEqual(self.insert_count(Group) - before, 1)
+        self.assertEqual(db.select('number from "Group" order by number'), [1, 2, 3])
+    def test2(self):
+        # dependent rows are inserted after their principals even when interleaved
+        g1 = Group(number=1)
+        s1 = Student(record=1, name=u'A', group=g1)
+        g2 = Group(number=2)
+        s2 = Student(record=2, name=u'B', group=g2)
+        before_groups, before_students = self.insert_count(Group), self.insert_count(Student)
+        commit()
+        self.assertEqual(self.insert_count(Group) - before_groups, 1)
+        self.assertEqual(self.insert_count(Student) - before_students, 1)
+        rollback()
+        self.assertEqual(Student[2].group.number, 2)
+    def test3(self):
+        g1 = Group(number=1)
+        s1 = Student(record=1, name=u'A', group=g1)
+        s2 = Student(record=2, name=u'B', group=g1, mentor=s1)
+        commit()
+        rollback()
+        self.assertEqual(Student[2].mentor, Student[1])
+    @raises_exception(CommitException)
+    def test4(self):
+        Group(number=1)
+        Group(number=2)
+        db.execute('insert into "Group" values (2)')
+        commit()
+
+class TestUpdateBatching(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Student')
+        db.execute('delete from "Group"')
+        db.insert('Group', number=1)
+        for record in range(1, 4):
+            db.insert('Student', record=record, name='S%d' % record, group=1)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def update_count(self):
+        return sum(stat.db_count for sql, stat in db.local_stats.iteritems()
+                   if sql.startswith('UPDATE "Student"'))
+    def test1(self):
+        for s in Student.select(lambda s: s.group.number == 1):
+            s.name += u'!'
+        before = self.update_count()
+        commit()
+        self.assertEqual(self.update_count() - before, 1)
+        self.assertEqual(db.select('name from Student order by record'), ['S1!', 'S2!', 'S3!'])
+    @raises_exception(CommitException, 'Object Student[2] was updated outside of current transaction')
+    def test2(self):
+        for s in Student.select(lambda s: s.group.number == 1):
+            s.name += u'!'
+        db.execute("update Student set name = 'X' where record = 2")
+        commit()
+
+class TestDeleteBatching(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Student')
+        db.execute('delete from "Group"')
+        for number in range(1, 3):
+            db.insert('Group', number=number)
+        for record in range(1, 7):
+            db.insert('Student', record=record, name='S%d' % record, group=(record - 1) // 3 + 1)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def delete_count(self, entity):
+        return sum(stat.db_count for sql, stat in db.local_stats.iteritems()
+                   if sql.startswith('DELETE FROM "%s"' % entity._table_))
+    def test1(self):
+        for s in Student.select(lambda s: s.record > 2): s.delete()
+        before = self.delete_count(Student)
+        commit()
+        self.assertEqual(self.delete_count(Student) - before, 1)
+        self.assertEqual(db.select('record from Student order by record'), [1, 2])
+    def test2(self):
+        # cascade delete: students of both groups go in one statement which precedes deletion of groups
+        Group[1].delete()
+        Group[2].delete()
+        before_groups, before_students = self.delete_count(Group), self.delete_count(Student)
+        db.execute('pragma foreign_keys = on')
+        commit()
+        self.assertEqual(self.delete_count(Group) - before_groups, 1)
+        self.assertEqual(self.delete_count(Student) - before_students, 1)
+        self.assertEqual(db.select('count(*) from Student'), [0])
+        self.assertEqual(db.select('count(*) from "Group"'), [0])
+        db.execute('pragma foreign_keys = off')
+        commit()
+    def test3(self):
+        for s in Student.select(): s.delete()
+        old_max_params_count = db.provider.max_params_count
+        db.provider.max_params_count = 4
+        try:
+            before = self.delete_count(Student)
+            commit()
+        finally: db.provider.max_params_count = old_max_params_count
+        self.assertEqual(self.delete_count(Student) - before, 2)
+        self.assertEqual(db.select('count(*) from Student'), [0])
+    def test4(self):
+        # a pupil is deleted by a statement which precedes deletion of the mentor
+        db.execute('update Student set mentor = 1 where record = 2')
+        Student[2].delete()
+        Student[1].delete()
+        before = self.delete_count(Student)
+        commit()
+        self.assertEqual(self.delete_count(Student) - before, 2)
+        self.assertEqual(db.select('record from Student order by record'), [3, 4, 5, 6])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os, unittest, tempfile
+from pony import options
+from pony.orm import decompiling
+from pony.orm.decompiling import decompile
+
+def gen_code():
+    return (x for x in [1, 2, 3] if x > y).gi_frame.f_code
+
+def other_code():
+    return (x.a for x in [] if x.b).gi_frame.f_code
+
+class TestDecompileCache(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp('.cache')
+        os.close(fd)
+        os.remove(self.filename)
+        self.old_filename = options.DECOMPILE_CACHE_FILE
+        options.DECOMPILE_CACHE_FILE = self.filename
+        self.forget()
+    def tearDown(self):
+        options.DECOMPILE_CACHE_FILE = self.old_filename
+        decompiling.persistent_cache_modified = False
+        decompiling.persistent_cache_filename = decompiling.persistent_cache = None
+        if os.path.exists(self.filename): os.remove(self.filename)
+    def forget(self):
+        decompiling.ast_cache.clear()
+        decompiling.persistent_cache_filename = decompiling.persistent_cache = None
+    def test1(self):
+        code = gen_code()
+        tree, external_names = decompile(code)
+        decompiling.save_persistent_cache()
+        self.assert_(os.path.exists(self.filename))
+        self.forget()
+        old_decompiler = decompiling.Decompiler
+        def failing_decompiler(*args): self.fail('Decompiler must not be called')
+        decompiling.Decompiler = failing_decompiler
+        try: tree2, external_names2 = decompile(code)
+        finally: decompiling.Decompiler = old_decompiler
+        self.assertEqual(repr(tree2), repr(tree))
+        self.assertEqual(external_names2, external_names)
+    def test2(self):
+        # entries saved by another process are merged with the file contents
+        decompile(gen_code())
+        decompiling.save_persistent_cache()
+        self.forget()
+        decompile(other_code())
+        decompiling.save_persistent_cache()
+        self.assertEqual(len(decompiling.read_persistent_cache_file(self.filename)), 2)
+    def test3(self):
+        f = open(self.filename, 'wb')
+        f.write('garbage')
+        f.close()
+        tree, external_names = decompile(gen_code())
+        self.assert_('y' in external_names)
+
+if __name__ == '__main__':
+    unittest.main()
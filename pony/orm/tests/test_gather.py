@@ -0,0 +1,82 @@
+import os, atexit, unittest, tempfile, threading
+from pony.orm.core import *
+from pony.orm.core import max_gather_workers
+from testutils import raises_exception
+
+fd, filename = tempfile.mkstemp('.sqlite')
+os.close(fd)
+atexit.register(os.remove, filename)
+
+db = Database('sqlite', filename)
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    group = Required(Group)
+
+db.generate_mapping(create_tables=True)
+
+def select_students():
+    return select(s for s in Student)
+
+def select_names(number):
+    return select(s.name for s in Student if s.group.number == number)
+
+def select_pairs():
+    return select((s, s.group) for s in Student)
+
+def select_groups():
+    return select(g for g in Group)
+
+class TestGather(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Student')
+        db.execute('delete from "Group"')
+        db.insert('Group', number=1)
+        db.insert('Group', number=2)
+        for i in range(1, 7): db.insert('Student', id=i, name='S%d' % i, group=i % 2 + 1)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def test1(self):
+        s1 = Student[1]
+        students, names, pairs = db.gather(select_students(), select_names(1), select_pairs())
+        self.assertEqual(sorted(s.id for s in students), range(1, 7))
+        self.assert_(s1 in students)
+        self.assertEqual(sorted(names), [ u'S2', u'S4', u'S6' ])
+        self.assert_((s1, Group[2]) in pairs)
+        self.assert_(s1.group is Group[2])
+    def test2(self):
+        students = select_students()[:]
+        result = db.gather(select_students(), select_groups())
+        self.assertEqual(list(result[0]), list(students))
+        self.assertEqual(set(result[1]), set([ Group[1], Group[2] ]))
+    def test3(self):
+        self.assertEqual(db.gather(), [])
+        self.assertEqual(list(db.gather(select_groups())[0]), list(select_groups()[:]))
+    def test4(self):
+        db.insert('Student', id=7, name='S7', group=1)
+        result = db.gather(select_groups(), select_names(1))
+        self.assertEqual(sorted(result[1]), [ u'S2', u'S4', u'S6', u'S7' ])
+    @raises_exception(TypeError, 'Query object expected. Got: 1')
+    def test5(self):
+        db.gather(select_students(), 1)
+    def test6(self):
+        for i in range(10): db.gather(select_students(), select_groups(), select_names(1), select_pairs())
+        executor = db._query_executor
+        self.assertEqual(len(executor.workers), max_gather_workers)
+        names = set(t.name for t in threading.enumerate())
+        self.assertEqual(len([ name for name in names if name.startswith('QueryExecutorThread') ]), max_gather_workers)
+        self.assert_(db._get_query_executor_() is executor)
+    def test7(self):
+        opened = db.pool_stats.opened
+        for i in range(5): db.gather(select_students(), select_groups(), select_pairs())
+        self.assertEqual(db.pool_stats.opened, opened)
+
+if __name__ == '__main__':
+    unittest.main()
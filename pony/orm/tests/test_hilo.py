@@ -0,0 +1,71 @@
+import unittest
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Item(db.Entity):
+    id = PrimaryKey(int, auto=True, hilo=10)
+    name = Required(unicode)
+
+class Special(Item):
+    code = Optional(int)
+
+db.generate_mapping(create_tables=True)
+
+class TestHiLo(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Item')
+        db.execute('update Item_hilo set next_hi = 3')
+        db.insert('Item', id=25, name='old', classtype='Item')
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def test1(self):
+        a = Item(name=u'A')
+        b = Special(name=u'B')
+        self.assertEqual((a.id, b.id), (30, 31))
+        self.assert_(Item[30] is a)
+        commit()
+        self.assertEqual(db.select('id from Item order by id'), [ 25, 30, 31 ])
+    def test2(self):
+        Item(name=u'A')
+        commit()
+        rollback()
+        self.assertEqual(Item(name=u'B').id, 40)
+    def test3(self):
+        items = Item.create_many([ dict(name=u'I%d' % i) for i in range(12) ])
+        self.assertEqual([ item.id for item in items ], range(30, 42))
+        commit()
+        self.assertEqual(db.select('count(*) from Item'), [ 13 ])
+        self.assertEqual(db.select('next_hi from Item_hilo'), [ 5 ])
+    def test3a(self):
+        self.assertEqual(Item(name=u'A').id, 30)
+        self.assert_(db._get_cache().optimistic)
+        rollback()
+        self.assertEqual(Item(name=u'B').id, 40)
+    def test3b(self):
+        self.assertEqual(db.select('count(*) from Item_hilo'), [ 1 ])
+        db.execute('delete from Item_hilo')
+        commit()
+        Item._seed_hilo_table_()
+        self.assertEqual(db.select('next_hi from Item_hilo'), [ 3 ])
+    def test4(self):
+        self.assertEqual(Item(id=100, name=u'A').id, 100)
+    @raises_exception(TypeError, "'hilo' option can be specified for auto primary keys of int type only")
+    def test5(self):
+        PrimaryKey(int, hilo=10)
+    @raises_exception(TypeError, "'hilo' option must be positive integer. Got: 0")
+    def test6(self):
+        PrimaryKey(int, auto=True, hilo=0)
+    def test7(self):
+        db2 = Database('sqlite', ':memory:')
+        class Item2(db2.Entity):
+            id = PrimaryKey(int, auto=True, hilo=10)
+        db2.generate_mapping()  # the hilo table does not exist, but it is not accessed
+        self.assertEqual(db2.select("name from sqlite_master where type = 'table'"), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from decimal import Decimal
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Person(db.Entity):
+    name = Required(unicode)
+    nickname = Optional(unicode)
+    mentor = Optional('Teacher')
+
+class Student(Person):
+    gpa = Optional(Decimal)
+
+class Teacher(Person):
+    pupils = Set(Person)
+
+db.generate_mapping(create_tables=True)
+
+def select_pairs():
+    return select((p, p.name, p.mentor) for p in Person).order_by(1)[:]
+
+class TestHydration(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Person')
+        db.insert('Person', id=1, name='T', nickname='', classtype='Teacher')
+        db.insert('Person', id=2, name='S', nickname='s', classtype='Student', gpa='4.5', mentor=1)
+        db.insert('Person', id=3, name='P', nickname='', classtype='Person')
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def test1(self):
+        persons = Person.select().order_by(Person.id)[:]
+        self.assertEqual([ type(p) for p in persons ], [ Teacher, Student, Person ])
+        self.assertEqual([ p.nickname for p in persons ], [ u'', u's', u'' ])
+        self.assertEqual(persons[1].gpa, Decimal('4.5'))
+        self.assertEqual(persons[1].mentor, persons[0])
+    def test2(self):
+        self.assertEqual(select_pairs(), [ (Person[1], u'T', None), (Person[2], u'S', Person[1]), (Person[3], u'P', None) ])
+    @raises_exception(ConstraintError, 'Attribute Person.name is required')
+    def test3(self):
+        db.execute("update Person set name = '' where id = 3")
+        Person[3]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from pony.orm.core import *
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    name = Required(unicode)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    group = Required(Group)
+
+db.generate_mapping(create_tables=True)
+
+class TestInsertReturning(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Student')
+        db.execute('delete from "Group"')
+        commit()
+        rollback()
+        db.local_stats.clear()
+    def tearDown(self):
+        rollback()
+        db.provider.__dict__.pop('multirow_insert_returning', None)
+        db.provider.__dict__.pop('max_params_count', None)
+    def insert_count(self):
+        return sum(stat.db_count for sql, stat in db.local_stats.iteritems() if sql.startswith('INSERT'))
+    def create(self):
+        g1 = Group(name=u'A')
+        g2 = Group(name=u'B')
+        students = [ Student(name=u'S%d' % i, group=i % 2 and g1 or g2) for i in range(6) ]
+        commit()
+        for s in students: self.assert_(Student[s.id] is s)
+        rows = db.select('name, "group" from Student order by id')
+        self.assertEqual([ tuple(row) for row in rows ], [ (s.name, s.group.id) for s in students ])
+        self.assertEqual(db.select('name from "Group" order by id'), [ u'A', u'B' ])
+    def test1(self):
+        if not db.provider.multirow_insert_returning: return
+        self.create()
+        self.assertEqual(self.insert_count(), 2)
+    def test2(self):
+        db.provider.multirow_insert_returning = False
+        self.create()
+        self.assertEqual(self.insert_count(), 8)
+    def test3(self):
+        if not db.provider.multirow_insert_returning: return
+        db.provider.max_params_count = 4
+        self.create()
+        self.assertEqual(self.insert_count(), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Article(db.Entity):
+    title = Required(unicode)
+    excerpt = Optional(LongUnicode, fetch_group='body')
+    text = Optional(LongUnicode, fetch_group='body')
+    notes = Optional(LongUnicode)
+
+db.generate_mapping(create_tables=True)
+
+class TestLazyLoading(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Article')
+        for i in range(1, 6):
+            db.insert('Article', id=i, title='T%d' % i, excerpt='E%d' % i, text='X%d' % i, notes='N%d' % i)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def query_count(self):
+        return sum(stat.db_count for stat in db.local_stats.itervalues())
+    def test1(self):
+        articles = Article.select().order_by(Article.id)[:]
+        before = self.query_count()
+        self.assertEqual([ a.excerpt for a in articles ], [ u'E1', u'E2', u'E3', u'E4', u'E5' ])
+        self.assertEqual([ a.text for a in articles ], [ u'X1', u'X2', u'X3', u'X4', u'X5' ])
+        self.assertEqual(self.query_count() - before, 1)
+        self.assertEqual([ a.notes for a in articles ], [ u'N1', u'N2', u'N3', u'N4', u'N5' ])
+        self.assertEqual(self.query_count() - before, 2)
+    def test2(self):
+        articles = Article.select().order_by(Article.id)[:]
+        articles[1].text = u'new'
+        self.assertEqual(articles[0].excerpt, u'E1')
+        self.assertEqual(articles[1].text, u'new')
+        commit()
+        self.assertEqual(db.select('text from Article where id = 2'), [ u'new' ])
+    @raises_exception(TypeError, "'fetch_group' option can be specified for lazy attributes only")
+    def test3(self):
+        Optional(unicode, fetch_group='body')
+    def test4(self):
+        articles = Article.select()[:]
+        lazy_seeds = db._get_cache().lazy_seeds
+        self.assertEqual(lazy_seeds[Article.text], set(articles))
+        articles[0].excerpt
+        self.assertEqual(lazy_seeds[Article.excerpt], set())
+        self.assertEqual(lazy_seeds[Article.text], set())
+        self.assertEqual(lazy_seeds[Article.notes], set(articles))
+
+if __name__ == '__main__':
+    unittest.main()
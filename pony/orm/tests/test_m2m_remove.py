@@ -0,0 +1,79 @@
+import unittest
+from pony.orm.core import *
+
+db = Database('sqlite', ':memory:')
+
+class Product(db.Entity):
+    name = Required(unicode)
+    tags = Set('Tag')
+    labels = Set('Label')
+
+class Tag(db.Entity):
+    name = Required(unicode)
+    products = Set(Product)
+
+class Label(db.Entity):
+    kind = Required(unicode)
+    number = Required(int)
+    PrimaryKey(kind, number)
+    products = Set(Product)
+
+class Person(db.Entity):
+    name = Required(unicode)
+    friends = Set('Person', reverse='friends')
+
+db.generate_mapping(create_tables=True)
+
+class TestM2MRemove(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        for table in 'Label_Product', 'Product_Tag', 'Person_friends', 'Label', 'Tag', 'Product', 'Person':
+            db.execute('delete from %s' % table)
+        for i in range(1, 4): db.insert('Product', id=i, name='P%d' % i)
+        for i in range(1, 501):
+            db.insert('Tag', id=i, name='T%d' % i)
+            for j in range(1, 4): db.insert('Product_Tag', product=j, tag=i)
+        for i in range(1, 6):
+            db.insert('Label', kind='K', number=i)
+            db.insert('Label_Product', label_kind='K', label_number=i, product=1)
+        commit()
+        rollback()
+        db.local_stats.clear()
+    def tearDown(self):
+        rollback()
+    def delete_count(self):
+        return sum(stat.db_count for sql, stat in db.local_stats.iteritems() if sql.startswith('DELETE'))
+    def test1(self):
+        Product[1].tags.clear()
+        commit()
+        self.assertEqual(db.select('count(*) from Product_Tag where product = 1'), [ 0 ])
+        self.assertEqual(db.select('count(*) from Product_Tag'), [ 1000 ])
+        self.assert_(self.delete_count() < 10)
+    def test2(self):
+        Product[1].tags.remove(Tag[1])
+        Product[2].tags.remove(Tag[2])
+        Product[3].tags.remove([ Tag[3], Tag[4] ])
+        commit()
+        self.assertEqual(db.select('tag from Product_Tag where product = 3 and tag < 6 order by tag'), [ 1, 2, 5 ])
+        self.assertEqual(db.select('count(*) from Product_Tag'), [ 1496 ])
+        self.assertEqual(self.delete_count(), 2)
+    def test3(self):
+        p = Product[1]
+        p.labels.remove([ Label[u'K', 2], Label[u'K', 4] ])
+        commit()
+        self.assertEqual(db.select('label_number from Label_Product order by label_number'), [ 1, 3, 5 ])
+        self.assertEqual(self.delete_count(), 1)
+    def test4(self):
+        a = Person(name=u'A')
+        friends = [ Person(name=u'F%d' % i) for i in range(5) ]
+        a.friends = friends
+        commit()
+        a.friends.remove(friends[:3])
+        a_id = a.id
+        commit()
+        rollback()
+        self.assertEqual(set(f.name for f in Person[a_id].friends), set([ u'F3', u'F4' ]))
+        self.assertEqual(db.select('count(*) from Person_friends'), [ 4 ])
+
+if __name__ == '__main__':
+    unittest.main()
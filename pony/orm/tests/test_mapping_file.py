@@ -0,0 +1,91 @@
+import os, unittest, tempfile
+from pony.orm.core import *
+from pony.orm import core
+
+def define_entities(db):
+    class Group(db.Entity):
+        number = PrimaryKey(int)
+        students = Set('Student')
+        subjects = Set('Subject')
+    class Student(db.Entity):
+        name = Required(unicode, column='fio')
+        group = Required(Group)
+    class Subject(db.Entity):
+        name = PrimaryKey(unicode)
+        groups = Set(Group)
+    return Group, Student, Subject
+
+class TestMappingFile(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp('.mapping')
+        os.close(fd)
+        os.remove(self.filename)
+    def tearDown(self):
+        if os.path.exists(self.filename): os.remove(self.filename)
+    def make_db(self, include_sql=True):
+        db = Database('sqlite', ':memory:')
+        entities = define_entities(db)
+        db.generate_mapping(self.filename, create_tables=True, include_sql=include_sql)
+        return db, entities
+    def test1(self):
+        db1, (Group1, Student1, Subject1) = self.make_db()
+        self.assert_(os.path.exists(self.filename))
+        db2, (Group2, Student2, Subject2) = self.make_db()
+        self.assertEqual(Group2._table_, Group1._table_)
+        self.assertEqual(Student2.group.columns, Student1.group.columns)
+        self.assertEqual(Group2.subjects.table, Group1.subjects.table)
+        self.assertEqual(Student2._cached_create_sql_auto_pk_[0], Student1._construct_create_sql_(True)[0])
+        self.assertEqual(Student2._cached_delete_sql_[0], Student1._construct_delete_sql_()[0])
+    def test2(self):
+        self.make_db()
+        db, (Group, Student, Subject) = self.make_db()
+        g = Group(number=1)
+        s = Student(name=u'A', group=g)
+        Subject(name=u'Math', groups=[g])
+        commit()
+        rollback()
+        self.assertEqual(db.select('fio from Student'), [u'A'])
+        self.assertEqual(Group[1].number, 1)
+        self.assertEqual(len(Group[1].subjects), 1)
+        Student[1].delete()
+        commit()
+        self.assertEqual(db.select('count(*) from Student'), [0])
+    def test3(self):
+        self.make_db()
+        def define_group(db):
+            class Group(db.Entity):
+                number = PrimaryKey(int)
+                title = Optional(unicode)
+            return Group
+        db = Database('sqlite', ':memory:')
+        Group = define_group(db)
+        self.assertEqual(core.read_mapping_file(self.filename, db._get_mapping_fingerprint_()), None)
+        db.generate_mapping(self.filename, create_tables=True)
+        self.assertEqual(Group._columns_, [ 'number', 'title' ])
+        db = Database('sqlite', ':memory:')
+        define_group(db)
+        self.assertNotEqual(core.read_mapping_file(self.filename, db._get_mapping_fingerprint_()), None)
+    def test4(self):
+        f = open(self.filename, 'wb')
+        f.write('garbage')
+        f.close()
+        db, (Group, Student, Subject) = self.make_db(include_sql=False)
+        self.assertEqual(Student.group.columns, [ 'group' ])
+        self.assertEqual(Student._cached_delete_sql_, None)
+    def test5(self):
+        def define_item(db, hilo):
+            class Item(db.Entity):
+                id = PrimaryKey(int, auto=True, hilo=hilo)
+        fingerprints = []
+        for hilo in 10, 10, 20:
+            db = Database('sqlite', ':memory:')
+            define_item(db, hilo)
+            fingerprints.append(db._get_mapping_fingerprint_())
+        self.assertEqual(fingerprints[0], fingerprints[1])
+        self.assertNotEqual(fingerprints[0], fingerprints[2])
+    def test6(self):
+        self.assertEqual(core.fingerprint_value((define_entities, 1)),
+                         [ define_entities.__module__ + '.define_entities', 1 ])
+
+if __name__ == '__main__':
+    unittest.main()
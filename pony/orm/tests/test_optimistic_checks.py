@@ -0,0 +1,60 @@
+import unittest
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    age = Optional(int)
+    group = Optional(Group)
+
+db.generate_mapping(create_tables=True)
+
+def select_students():
+    return select(s for s in Student)
+
+class TestOptimisticChecks(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Student')
+        db.execute('delete from "Group"')
+        db.insert('Group', number=1)
+        for i in range(1, 501):
+            db.insert('Student', id=i, name='S%d' % i, age=i % 2 and i or None, group=i % 3 and 1 or None)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def read_and_lock(self):
+        students = select_students()[:]
+        for s in students:
+            s.name, s.age, s.group
+            s.check_on_commit()
+        return students
+    def test1(self):
+        self.read_and_lock()
+        Student(name=u'New')
+        db.local_stats.clear()
+        commit()
+        selects = [ sql for sql in db.local_stats if sql.startswith('SELECT') ]
+        self.assert_(0 < sum(db.local_stats[sql].db_count for sql in selects) <= 10)
+    @raises_exception(CommitException, 'Object Student[250] was updated outside of current transaction')
+    def test2(self):
+        self.read_and_lock()
+        db.execute("update Student set name = 'X' where id = 250")
+        Student(name=u'New')
+        commit()
+    @raises_exception(CommitException, 'Object Student[3] was updated outside of current transaction')
+    def test3(self):
+        self.read_and_lock()
+        db.execute("update Student set age = 30 where id = 3")
+        Student(name=u'New')
+        commit()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Customer(db.Entity):
+    name = Required(unicode)
+    orders = Set('Order')
+    card = Optional('Card')
+
+class Card(db.Entity):
+    number = Required(unicode)
+    customer = Required(Customer)
+
+class Order(db.Entity):
+    customer = Required(Customer)
+    items = Set('OrderItem')
+
+class OrderItem(db.Entity):
+    order = Required(Order)
+    product = Required('Product')
+
+class Product(db.Entity):
+    name = Required(unicode)
+    items = Set(OrderItem)
+    tags = Set('Tag')
+
+class Tag(db.Entity):
+    name = Required(unicode)
+    products = Set(Product)
+
+db.generate_mapping(create_tables=True)
+
+def select_orders():
+    return select(o for o in Order)
+
+def select_customers():
+    return select(c for c in Customer)
+
+def select_pairs():
+    return select((o, o.customer) for o in Order)
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        for table in 'Product_Tag', 'OrderItem', '"Order"', 'Card', 'Product', 'Tag', 'Customer':
+            db.execute('delete from %s' % table)
+        for i in range(1, 4):
+            db.insert('Customer', id=i, name='C%d' % i)
+            db.insert('Product', id=i, name='P%d' % i)
+            db.insert('Tag', id=i, name='T%d' % i)
+            db.insert('Product_Tag', product=i, tag=i)
+        db.insert('Card', id=1, number='N1', customer=1)
+        for i in range(1, 7):
+            db.insert('Order', id=i, customer=(i - 1) % 3 + 1)
+            for j in range(1, 3):
+                db.insert('OrderItem', id=i*10 + j, order=i, product=j)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def query_count(self):
+        return sum(stat.db_count for stat in db.local_stats.itervalues())
+    def test1(self):
+        orders = select_orders().prefetch(Order.customer, Order.items, OrderItem.product)[:]
+        before = self.query_count()
+        self.assertEqual(sorted(o.customer.name for o in orders), [ u'C1', u'C1', u'C2', u'C2', u'C3', u'C3' ])
+        self.assertEqual(sum(len(o.items) for o in orders), 12)
+        self.assertEqual(set(item.product.name for o in orders for item in o.items), set([ u'P1', u'P2' ]))
+        self.assertEqual(self.query_count(), before)
+    def test2(self):
+        orders = select_orders().prefetch('customer', 'items.product.tags')[:]
+        before = self.query_count()
+        for o in orders:
+            self.assert_(o._vals_['items'].is_fully_loaded)
+            for item in o.items: self.assertEqual(len(item.product.tags), 1)
+        self.assertEqual(self.query_count(), before)
+    def test3(self):
+        customers = select_customers().prefetch(Customer.card)[:]
+        before = self.query_count()
+        self.assertEqual(sorted(c.card and c.card.number for c in customers), [ None, None, u'N1' ])
+        self.assertEqual(self.query_count(), before)
+    def test4(self):
+        before = self.query_count()
+        pairs = select_pairs().prefetch(Customer.orders)[:]
+        self.assertEqual(self.query_count() - before, 2)
+        self.assertEqual(sum(len(c.orders) for o, c in pairs), 12)
+        self.assertEqual(self.query_count() - before, 2)
+    @raises_exception(TypeError, 'Attribute Customer.name is not a relationship attribute')
+    def test5(self):
+        select_customers().prefetch(Customer.name)
+    @raises_exception(AttributeError, 'Entity Order does not have attribute foo')
+    def test6(self):
+        select_orders().prefetch('items.order.foo')
+
+if __name__ == '__main__':
+    unittest.main()
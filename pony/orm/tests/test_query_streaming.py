@@ -0,0 +1,92 @@
+import unittest
+from pony.orm.core import *
+from testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    id = PrimaryKey(int)
+    name = Required(unicode, unique=True)
+    group = Required(Group)
+
+db.generate_mapping(create_tables=True)
+
+g1 = Group(number=1)
+g2 = Group(number=2)
+for i in range(1, 8):
+    Student(id=i, name=u'S%d' % i, group=i % 2 and g1 or g2)
+commit()
+
+class TestQueryStreaming(unittest.TestCase):
+    def setUp(self):
+        rollback()
+    def test1(self):
+        chunks = list(select(s for s in Student).order_by(Student.id).iter_chunks(3))
+        self.assertEqual(map(len, chunks), [3, 3, 1])
+        self.assertEqual([ s.id for chunk in chunks for s in chunk ], range(1, 8))
+    def test2(self):
+        chunks = list(select((s.name, s.group.number) for s in Student).order_by(1).iter_chunks(5))
+        self.assertEqual(chunks[1], [(u'S6', 2), (u'S7', 1)])
+    def test3(self):
+        cache = Student._get_cache_()
+        seen = []
+        for chunk in select(s for s in Student).order_by(Student.id).iter_chunks(2, evict=True):
+            seen.extend(chunk)
+            self.assertEqual(len(cache.indexes[Student._pk_]), len(chunk))
+        self.assertEqual(len(seen), 7)
+        self.assertTrue(Student[1] is not seen[0])
+    def test4(self):
+        s1 = Student[1]
+        s1.group = Group[2]
+        for chunk in select(s for s in Student).iter_chunks(10, evict=True): pass
+        self.assertTrue(Student[1] is s1)
+    def test5(self):
+        chunks = list(select((s, s.group) for s in Student).order_by(1).iter_chunks(4, evict=True))
+        self.assertEqual(chunks[0][0][0].id, 1)
+    @raises_exception(ValueError, 'Chunk size must be positive number. Got: 0')
+    def test6(self):
+        select(s for s in Student).iter_chunks(0)
+    def test7(self):
+        cursors = []
+        provider = db.provider
+        def server_side_cursor(connection, arraysize=None):
+            cursor = provider.__class__.server_side_cursor(provider, connection, arraysize)
+            cursors.append(cursor)
+            return cursor
+        provider.server_side_cursor = server_side_cursor
+        try:
+            chunks = select(s for s in Student).iter_chunks(2)
+            chunks.next()
+            chunks.close()
+        finally: del provider.server_side_cursor
+        self.assertEqual(cursors[0].arraysize, 2)
+        self.assertRaises(Exception, cursors[0].fetchone)
+    @raises_exception(ProgrammingError, 'Cannot execute SQL query while Query.iter_chunks() '
+                                        'is streaming results from the same connection')
+    def test8(self):
+        db.provider.streaming_blocks_connection = True
+        try:
+            for chunk in select(s for s in Student).iter_chunks(2):
+                select(g for g in Group)[:]
+        finally: del db.provider.streaming_blocks_connection
+    @raises_exception(ProgrammingError, 'Cannot execute SQL query while Query.iter_chunks() '
+                                        'is streaming results from the same connection')
+    def test8a(self):
+        db.provider.streaming_blocks_connection = True
+        try:
+            for chunk in select(s for s in Student).iter_chunks(2):
+                db.select('number from "Group"')
+        finally: del db.provider.streaming_blocks_connection
+    def test9(self):
+        db.provider.streaming_blocks_connection = True
+        try:
+            for chunk in select(s for s in Student).iter_chunks(2): pass
+        finally: del db.provider.streaming_blocks_connection
+        self.assertEqual(len(select(g for g in Group)[:]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from pony.orm.core import *
+from pony.orm.core import db_decorator
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    group = Required(Group)
+
+db.generate_mapping(create_tables=True)
+
+def select_students():
+    return select(s for s in Student)
+
+@with_transaction(readonly=True)
+def load_students():
+    students = select_students()[:]
+    return [ (s.name, s.group.number, s._rbits_, s._dbvals_ is s._vals_) for s in students ]
+
+@with_transaction(readonly=True)
+def rename_student():
+    Student[1].name = u'B'
+
+@db_decorator(readonly=True)
+def add_student():
+    Student(name=u'C', group=Group[1])
+
+@db_decorator(readonly=True)
+def remove_students():
+    Group[1].students.clear()
+
+@db_decorator(readonly=True)
+def delete_students():
+    select_students().delete(bulk=True)
+
+@with_transaction(readonly=True)
+def execute_update():
+    db.execute("update Student set name = 'B'")
+
+@with_transaction(readonly=True)
+def insert_group():
+    db.insert('Group', number=2)
+
+@with_transaction(readonly=True)
+def get_connection():
+    return db.get_connection()
+
+class TestReadOnly(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Student')
+        db.execute('delete from "Group"')
+        db.insert('Group', number=1)
+        db.insert('Student', id=1, name='A', group=1)
+        commit()
+        rollback()
+        db.local_stats.clear()
+    def tearDown(self):
+        rollback()
+        db.provider.__dict__.pop('commit', None)
+        db.provider.__dict__.pop('rollback', None)
+    def test1(self):
+        calls = []
+        db.provider.commit = lambda connection: calls.append('COMMIT')
+        db.provider.rollback = lambda connection: calls.append('ROLLBACK')
+        self.assertEqual(load_students(), [ (u'A', 1, 0, True) ])
+        self.assertEqual(calls, [])
+    @raises_exception(ReadOnlyError, 'Cannot modify Student[1]: transaction is read-only')
+    def test2(self):
+        rename_student()
+    @raises_exception(ReadOnlyError, 'Cannot create Student: transaction is read-only')
+    def test3(self):
+        add_student()
+    @raises_exception(ReadOnlyError, 'Cannot modify Group[1]: transaction is read-only')
+    def test4(self):
+        remove_students()
+    @raises_exception(ReadOnlyError, 'Cannot delete objects: transaction is read-only')
+    def test5(self):
+        delete_students()
+    def test6(self):
+        load_students()
+        s = Student[1]
+        s.name = u'B'
+        commit()
+        self.assertEqual(db.select('name from Student'), [ u'B' ])
+    def test7(self):
+        self.assertRaises(ReadOnlyError, execute_update)
+        self.assertRaises(ReadOnlyError, insert_group)
+        rollback()
+        self.assertEqual(db.select('name from Student'), [ u'A' ])
+        self.assertEqual(db.select('number from "Group"'), [ 1 ])
+    @raises_exception(ReadOnlyError, 'Cannot execute raw SQL: transaction is read-only')
+    def test8(self):
+        execute_update()
+    @raises_exception(ReadOnlyError, 'Cannot insert into Group: transaction is read-only')
+    def test9(self):
+        insert_group()
+    @raises_exception(ReadOnlyError, 'Cannot get connection for writing: transaction is read-only')
+    def test10(self):
+        get_connection()
+
+if __name__ == '__main__':
+    unittest.main()
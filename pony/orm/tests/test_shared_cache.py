@@ -0,0 +1,187 @@
+import unittest
+from pony.orm.core import *
+from pony.orm.caching import LRUCache, QueryResultCache
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Country(db.Entity):
+    _shared_cache_ = True
+    id = PrimaryKey(int)
+    name = Required(unicode)
+    cities = Set('City')
+
+class City(db.Entity):
+    id = PrimaryKey(int)
+    name = Required(unicode)
+    country = Required(Country)
+
+db.generate_mapping(create_tables=True)
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        Country._shared_cache_.clear()
+        db.execute('delete from City')
+        db.execute('delete from Country')
+        db.insert('Country', id=1, name='France')
+        db.insert('Country', id=2, name='Spain')
+        db.insert('City', id=1, name='Paris', country=1)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def select_count(self):
+        return sum(stat.db_count for sql, stat in db.local_stats.iteritems()
+                   if sql.startswith('SELECT') and 'FROM "Country"' in sql)
+    def test1(self):
+        self.assertEqual(Country[1].name, 'France')
+        rollback()
+        before = self.select_count()
+        self.assertEqual(Country[1].name, 'France')
+        self.assertEqual(self.select_count(), before)
+    def test2(self):
+        Country[1]
+        rollback()
+        before = self.select_count()
+        self.assertEqual(City[1].country.name, 'France')
+        self.assertEqual(self.select_count(), before)
+    def test3(self):
+        Country[1].name = u'Republique Francaise'
+        commit()
+        rollback()
+        self.assertTrue(1 not in Country._shared_cache_)
+        self.assertEqual(Country[1].name, 'Republique Francaise')
+    def test4(self):
+        Country[2].delete()
+        commit()
+        rollback()
+        self.assertEqual(Country.get(id=2), None)
+    def test5(self):
+        country = Country[1]
+        country.name = u'X'
+        flush()
+        Country.select(lambda c: c.id > 0)[:]
+        rollback()
+        self.assertTrue(1 not in Country._shared_cache_)
+        self.assertEqual(Country[1].name, 'France')
+    @raises_exception(ERDiagramError, 'Entity Region cannot use shared cache, '
+                                      'because its primary key contains reference attribute Region.country')
+    def test6(self):
+        db2 = Database('sqlite', ':memory:')
+        class Country(db2.Entity):
+            id = PrimaryKey(int)
+            regions = Set('Region')
+        class Region(db2.Entity):
+            _shared_cache_ = True
+            country = Required(Country)
+            name = Required(unicode)
+            PrimaryKey(country, name)
+    def test7(self):
+        db.select('1')
+        Country._shared_cache_.pop(1)  # concurrent transaction has modified the object
+        self.assertEqual(Country[1].name, 'France')
+        self.assertTrue(1 not in Country._shared_cache_)
+        rollback()
+        Country[1]
+        self.assertTrue(1 in Country._shared_cache_)
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.query_cache.clear()
+        db.execute('delete from City')
+        db.execute('delete from Country')
+        db.insert('Country', id=1, name='France')
+        db.insert('City', id=1, name='Paris', country=1)
+        db.insert('City', id=2, name='Lyon', country=1)
+        commit()
+        rollback()
+    def tearDown(self):
+        rollback()
+    def db_count(self, sql):
+        stat = db.local_stats.get(sql)
+        return stat and stat.db_count or 0
+    def test1(self):
+        def query(): return select(c for c in City if c.country.name == 'France').cached()
+        self.assertEqual(query().count(), 2)
+        sql = db.last_sql
+        rollback()
+        before = self.db_count(sql)
+        self.assertEqual(query().count(), 2)
+        self.assertEqual(self.db_count(sql), before)
+    def test2(self):
+        def names(): return sorted(select(c.name for c in City).cached())
+        self.assertEqual(names(), ['Lyon', 'Paris'])
+        rollback()
+        City(id=3, name=u'Nice', country=Country[1])
+        commit()
+        rollback()
+        self.assertEqual(names(), ['Lyon', 'Nice', 'Paris'])
+    def test3(self):
+        def cities(): return select(c for c in City).cached()[:]
+        self.assertEqual(len(cities()), 2)
+        rollback()
+        self.assertEqual(sorted(city.name for city in cities()), ['Lyon', 'Paris'])
+    def test4(self):
+        def count(): return select(c for c in City).cached().count()
+        count()
+        City[2].delete()
+        flush()
+        self.assertEqual(count(), 1)
+        rollback()
+        self.assertEqual(count(), 2)
+    def test5(self):
+        query = select(c for c in Country)
+        query.cached().count()
+        self.assertEqual(len(db.query_cache), 1)
+        rollback()
+        self.assertEqual(query.count(), 1)
+        self.assertEqual(len(db.query_cache), 1)
+
+class TestLRUCache(unittest.TestCase):
+    def test1(self):
+        cache = LRUCache(max_size=2)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+        self.assertEqual(sorted(cache.data), [1, 3])
+    def test2(self):
+        cache = LRUCache(ttl=-1)
+        cache.set(1, 'a')
+        self.assertEqual(cache.get(1), None)
+        self.assertEqual(len(cache), 0)
+    def test3(self):
+        cache = LRUCache()
+        cache.set(1, 'a', ttl=60)
+        self.assertEqual(cache.pop(1), 'a')
+        self.assertEqual(cache.get(1, 'b'), 'b')
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+    def test4(self):
+        cache = QueryResultCache()
+        cache.set(1, 'a', [ 'T1' ])
+        cache.set(2, 'b', [ 'T1', 'T2' ])
+        cache.set(3, 'c', [ 'T3' ])
+        cache.invalidate([ 'T2' ])
+        self.assertEqual(sorted(cache.data), [1, 3])
+        self.assertEqual(cache.table_keys, { 'T1' : set([1]), 'T3' : set([3]) })
+    def test5(self):
+        cache = LRUCache()
+        generation = cache.generation
+        cache.pop(1)
+        cache.set(1, 'a', generation=generation)
+        self.assertEqual(len(cache), 0)
+        cache.set(1, 'a', generation=cache.generation)
+        self.assertEqual(cache.get(1), 'a')
+    def test6(self):
+        cache = QueryResultCache()
+        versions = cache.get_versions([ 'T1', 'T2' ])
+        cache.invalidate([ 'T2' ])
+        cache.set(1, 'a', [ 'T1', 'T2' ], versions=versions)
+        self.assertEqual(len(cache), 0)
+        cache.set(1, 'a', [ 'T1', 'T2' ], versions=cache.get_versions([ 'T1', 'T2' ]))
+        self.assertEqual(cache.get(1), 'a')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,7 +50,28 @@ class TestFormatStyles(unittest.TestCase):
                                 'FROM "T1"\n'
                                 'WHERE "B" = %(p1)s\n  AND "C" = %(p2)s\n  AND "D" = %(p2)s\n  AND "E" = %(p1)s')
         self.assertEqual(b.layout, (self.key1, self.key2))
-
+    def test_adapter_qmark(self):
+        self.provider.paramstyle = 'qmark'
+        b = SQLBuilder(self.provider, self.ast)
+        self.assertEqual(b.adapter({self.key1: 1, self.key2: None}), (1, None, None, 1))
+    def test_adapter_pyformat(self):
+        self.provider.paramstyle = 'pyformat'
+        b = SQLBuilder(self.provider, self.ast)
+        self.assertEqual(b.adapter({self.key1: 1, self.key2: 2}), {'p1': 1, 'p2': 2})
+    def test_adapter_composite_keys(self):
+        class Converter(object):
+            def py2sql(converter, val): return val * 10
+        class Obj(object):
+            def __init__(obj, pkval): obj.pkval = pkval
+            def _get_raw_pkval_(obj): return obj.pkval
+        self.provider.paramstyle = 'qmark'
+        ast = [ SELECT, [ ALL, [COLUMN, None, 'A']], [ FROM, [None, TABLE, 'T1']],
+                [ WHERE, [ EQ, [COLUMN, None, 'B'], [ PARAM, ('x', 1), Converter() ] ],
+                         [ EQ, [COLUMN, None, 'C'], [ PARAM, ('y', 0) ] ],
+                         [ EQ, [COLUMN, None, 'D'], [ PARAM, (('z', 1), 0) ] ] ] ]
+        b = SQLBuilder(self.provider, ast)
+        values = { 'x': (1, 2), 'y': Obj((3, 4)), 'z': (Obj((5,)), Obj((6,))) }
+        self.assertEqual(b.adapter(values), (20, 3, 6))
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,67 @@
+import os, atexit, unittest, tempfile, threading
+from pony.orm.core import *
+from pony.orm.core import local
+from testutils import raises_exception
+
+fd, filename = tempfile.mkstemp('.sqlite')
+os.close(fd)
+atexit.register(os.remove, filename)
+
+db = Database('sqlite', filename)
+
+class Person(db.Entity):
+    name = Required(unicode)
+
+db.generate_mapping(create_tables=True)
+
+def count_persons():
+    return select(p for p in Person).count()
+
+def add_person(name):
+    Person(name=name)
+    return threading.current_thread().name
+
+def add_and_fail(name):
+    Person(name=name)
+    raise ValueError('Failure')
+
+def rename_person():
+    Person.get(name=u'A').name = u'B'
+
+class TestTransactionExecutor(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Person')
+        commit()
+        rollback()
+        self.executor = TransactionExecutor(max_workers=2)
+    def tearDown(self):
+        self.executor.shutdown()
+        rollback()
+    def test1(self):
+        results = [ self.executor.submit(add_person, u'P%d' % i) for i in range(4) ]
+        for result in results:
+            self.assert_(result.get(5).startswith('TransactionExecutorThread-'))
+            self.assert_(result.done())
+        self.assertEqual(self.executor.submit(count_persons).get(5), 4)
+        self.assert_(db not in local.db2cache)
+    @raises_exception(ValueError, 'Failure')
+    def test2(self):
+        self.executor.submit(add_and_fail, u'X').get(5)
+    def test3(self):
+        self.assertRaises(ValueError, self.executor.submit(add_and_fail, u'X').get, 5)
+        self.assertEqual(self.executor.submit(count_persons).get(5), 0)
+    def test4(self):
+        self.executor.submit(add_person, u'A').get(5)
+        executor = TransactionExecutor(max_workers=1, readonly=True)
+        try:
+            self.assertEqual(executor.submit(count_persons).get(5), 1)
+            self.assertRaises(ReadOnlyError, executor.submit(rename_person).get, 5)
+        finally: executor.shutdown()
+    @raises_exception(TypeError, 'Cannot submit transaction: executor is shut down')
+    def test5(self):
+        self.executor.shutdown()
+        self.executor.submit(count_persons)
+
+if __name__ == '__main__':
+    unittest.main()
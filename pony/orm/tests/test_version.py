@@ -0,0 +1,77 @@
+import unittest
+from pony.orm.core import *
+from testutils import raises_exception
+
+db = Database('sqlite', ':memory:')
+
+class Document(db.Entity):
+    title = Required(unicode)
+    body = Optional(LongUnicode)
+    version = Version()
+
+db.generate_mapping(create_tables=True)
+
+def select_documents():
+    return select(d for d in Document)
+
+class TestVersion(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db.execute('delete from Document')
+        db.insert('Document', id=1, title='A', body='text', version=1)
+        db.insert('Document', id=2, title='B', body='text', version=5)
+        commit()
+        rollback()
+        db.local_stats.clear()
+    def tearDown(self):
+        rollback()
+    def test1(self):
+        d = Document(title=u'C')
+        self.assertEqual(d.version, 1)
+        commit()
+        self.assertEqual(db.select("version from Document where title = 'C'"), [ 1 ])
+    def test2(self):
+        d1 = Document[1]
+        d2 = Document[2]
+        d1.title, d1.body, d2.body
+        d1.title = u'X'
+        d2.title = u'Y'
+        commit()
+        self.assertEqual((d1.version, d2.version), (2, 6))
+        self.assertEqual(db.select('version from Document order by id'), [ 2, 6 ])
+        updates = [ sql for sql in db.local_stats if sql.startswith('UPDATE') ]
+        self.assertEqual(len(updates), 1)
+        self.assert_('"body"' not in updates[0])
+    @raises_exception(CommitException, 'Object Document[1] was updated outside of current transaction')
+    def test3(self):
+        d = Document[1]
+        d.title
+        db.execute('update Document set version = 2 where id = 1')
+        d.title = u'X'
+        commit()
+    def test4(self):
+        d = Document[1]
+        d.title
+        db.execute("update Document set body = 'new' where id = 1")
+        d.title = u'X'
+        commit()
+        self.assertEqual(db.select('body from Document where id = 1'), [ u'new' ])
+    @raises_exception(TypeError, 'Cannot assign value to version attribute Document.version')
+    def test5(self):
+        Document[1].version = 10
+    @raises_exception(TypeError, 'Cannot assign value to version attribute Document.version')
+    def test6(self):
+        Document[1].set(version=10)
+    def test7(self):
+        d = Document[1]
+        d.title
+        self.assertEqual(select_documents().update(title=u'Z'), 2)
+        self.assertEqual(d.version, 2)
+        commit()
+        self.assertEqual(db.select('version from Document order by id'), [ 2, 6 ])
+    @raises_exception(TypeError, 'Version attribute must be of int or long type. Got: %r' % unicode)
+    def test8(self):
+        Version(unicode)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 from pony.orm.core import Database
+from pony.orm.dbapiprovider import PoolStats
 
 def raises_exception(exc_class, msg=None):
     def decorator(func):
@@ -36,6 +37,8 @@ class TestCursor(object):
 test_cursor = TestCursor()
 
 class TestPool(object):
+    def __init__(pool):
+        pool.stats = PoolStats()
     def connect(pool):
         return None
     def release(pool, con):
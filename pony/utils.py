@@ -187,6 +187,14 @@ def get_mtime(filename):
     if sys.platform == "win32": mtime -= stat.st_ctime
     return mtime
 
+def write_file_atomically(filename, data):
+    tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+    f = open(tmp_filename, 'wb')
+    try: f.write(data)
+    finally: f.close()
+    if sys.platform == 'win32' and os.path.exists(filename): os.remove(filename)
+    os.rename(tmp_filename, filename)
+
 coding_re = re.compile(r'coding[:=]\s*([-\w.]+)')
 
 def detect_source_encoding(filename):